@@ -1,6 +1,11 @@
 from . import agg
 from .__pkginfo__ import __version__
+from .aio import AsyncCheck, AsyncTransformed, amatch
+from .batch import BatchCheck, match_many
+from .cache import ResultCache
 from .case_of import case
+from .cep import SequenceDetector, SequenceMatch
+from .compiler import CompiledPattern, Memo, compile_pattern
 from .core import \
     AllOf, \
     Capture, \
@@ -10,17 +15,27 @@ from .core import \
     Not, \
     OneOf, \
     Pattern, \
+    Rec, \
+    Ref, \
     Remainder, \
     Some, \
     Strict, \
     String, \
     StringPattern, \
     Value, \
-    _
+    _, \
+    register_pattern_type
 from .error import MatchError
 from .guarded import guarded
+from .index import IntervalIndex, PatternIndex
+from .interning import InternTable, intern_pattern
 from .match import match
+from .optimizer import optimize
+from .parallel import aggregate_parallel, match_parallel
 from .overload import case_distinction, Match
+from .rete import Rete, ReteMatch
+from .stream import CaseStats, Dispatcher
+from .serialization import FunctionRegistry, SerializationError, deserialize, register_function, serialize
 from .patterns import \
     Arguments, \
     At, \
@@ -42,7 +57,8 @@ from .patterns import \
     Regex, \
     Returns, \
     SubclassOf, \
-    Transformed
+    Transformed, \
+    pure
 from .try_match import Case, Default
 from .typefoo import \
     Parameters, \
@@ -64,6 +80,8 @@ __all__ = [
     'Not',
     'OneOf',
     'Pattern',
+    'Rec',
+    'Ref',
     'Remainder',
     'Remaining',
     'Some',
@@ -74,18 +92,47 @@ __all__ = [
 
     '_',
 
+    'register_pattern_type',
+
     'case',
     'match',
+    'amatch',
+    'match_many',
+    'match_parallel',
+    'aggregate_parallel',
+    'compile_pattern',
+    'CompiledPattern',
+    'Memo',
+    'optimize',
     'guarded',
     'case_distinction',
     'Match',
     'MatchError',
+    'IntervalIndex',
+    'InternTable',
+    'intern_pattern',
+    'PatternIndex',
+    'ResultCache',
+    'SequenceDetector',
+    'SequenceMatch',
+    'Rete',
+    'ReteMatch',
+    'FunctionRegistry',
+    'SerializationError',
+    'serialize',
+    'deserialize',
+    'register_function',
     'Case',
+    'CaseStats',
     'Default',
+    'Dispatcher',
 
     'Arguments',
+    'AsyncCheck',
+    'AsyncTransformed',
     'At',
     'Attrs',
+    'BatchCheck',
     'Between',
     'Check',
     'Contains',
@@ -104,6 +151,7 @@ __all__ = [
     'Returns',
     'SubclassOf',
     'Transformed',
+    'pure',
 
     'Parameters',
     'KwArgs',
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import inspect
+import weakref
 
 try:
     from collections.abc import Iterator
@@ -9,7 +10,7 @@ except ImportError:
 from inspect import CO_VARARGS  # pylint: disable=no-name-in-module
 from itertools import chain, repeat
 from types import CodeType
-from typing import List, Optional, Type, get_type_hints, Dict, Union, Mapping, Iterable
+from typing import List, Optional, Type, get_type_hints, Dict, Union, Mapping, Iterable, Callable, Any
 
 
 def get_arg_types(obj) -> List[Optional[Type]]:
@@ -109,3 +110,32 @@ class SeqIterator(Iterator):
 
     def rewind(self, steps: int = 1):
         self._ix = max(0, self._ix - steps)
+
+
+class WeakTypeCache:
+    """A cache keyed by types which does not keep the types alive.
+
+    Entries are looked up by `id(type_)`, which is cheaper than `weakref.WeakKeyDictionary` (that one needs to create a
+    weak reference on every lookup). An entry is evicted by a weak reference callback when its type is collected, i.e.
+    before the id could be reused by another object.
+    """
+    __slots__ = ('_entries',)
+
+    def __init__(self):
+        self._entries: Dict[int, tuple] = {}
+
+    def get(self, type_: type, compute: Callable[[type], Any]):
+        entry = self._entries.get(id(type_))
+        if entry is not None:
+            return entry[1]
+        value = compute(type_)
+        key = id(type_)
+        entries = self._entries
+        entries[key] = (weakref.ref(type_, lambda _ref: entries.pop(key, None)), value)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
-from typing import Union
+import math
+from collections import Counter
+from typing import Iterable, Optional, Union
 
 from apm.core import Aggregation
+from apm.sketches import CountMinSketch, HyperLogLog, Reservoir, SpaceSaving
 
 
 class Histogram(Aggregation[dict]):
     def new(self) -> dict:
-        return dict()
+        return {}
 
     def _add(self, aggregate: dict, value) -> dict:
         if value not in aggregate:
@@ -15,6 +18,16 @@ class Histogram(Aggregation[dict]):
         aggregate[value] += 1
         return aggregate
 
+    def _add_many(self, aggregate: dict, values: Iterable) -> dict:
+        # counted in C, then added once per distinct value
+        return self.merge(aggregate, Counter(values))
+
+    def merge(self, aggregate: dict, other: dict) -> dict:
+        get = aggregate.get
+        for value, count in other.items():
+            aggregate[value] = get(value, 0) + count
+        return aggregate
+
 
 class Set(Aggregation[set]):
     def new(self) -> set:
@@ -24,6 +37,14 @@ class Set(Aggregation[set]):
         aggregate.add(value)
         return aggregate
 
+    def _add_many(self, aggregate: set, values: Iterable) -> set:
+        aggregate.update(values)
+        return aggregate
+
+    def merge(self, aggregate: set, other: set) -> set:
+        aggregate |= other
+        return aggregate
+
 
 class List(Aggregation[list]):
     def new(self) -> list:
@@ -33,16 +54,35 @@ class List(Aggregation[list]):
         aggregate.append(value)
         return aggregate
 
+    def _add_many(self, aggregate: list, values: Iterable) -> list:
+        aggregate.extend(values)
+        return aggregate
+
+    def merge(self, aggregate: list, other: list) -> list:
+        aggregate.extend(other)
+        return aggregate
+
+
+def _number(value) -> Union[int, float]:
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
 
 class Sum(Aggregation[Union[int, float]]):
     def new(self) -> Union[int, float]:
         return 0
 
     def _add(self, aggregate: Union[int, float], value) -> Union[int, float]:
-        try:
-            return aggregate + int(value)
-        except ValueError:
-            return aggregate + float(value)
+        return aggregate + _number(value)
+
+    def _add_many(self, aggregate: Union[int, float], values: Iterable) -> Union[int, float]:
+        # adds from left to right starting with the aggregate, exactly like adding one after the other would
+        return sum(map(_number, values), aggregate)
+
+    def merge(self, aggregate: Union[int, float], other: Union[int, float]) -> Union[int, float]:
+        return aggregate + other
 
 
 class Count(Aggregation[int]):
@@ -51,3 +91,134 @@ class Count(Aggregation[int]):
 
     def _add(self, aggregate: int, value) -> int:
         return aggregate + 1
+
+    def _add_many(self, aggregate: int, values: Iterable) -> int:
+        try:
+            return aggregate + len(values)
+        except TypeError:
+            return aggregate + sum(1 for _value in values)
+
+    def merge(self, aggregate: int, other: int) -> int:
+        return aggregate + other
+
+
+class Distinct(Aggregation[HyperLogLog]):
+    """Estimates the number of distinct values (`len(result.name)`) using a `HyperLogLog` sketch. The default relative
+    error of 1% takes 16 KiB per aggregate."""
+    __slots__ = ('_error', '_precision')
+
+    def __init__(self, name: Optional[str] = None, error: float = 0.01):
+        super().__init__(name)
+        self._error = error
+        self._precision = HyperLogLog.precision_for(error)
+
+    def __reduce__(self):
+        return type(self), (self._name, self._error)
+
+    @property
+    def error(self) -> float:
+        """The actual relative standard error, which is at most the one asked for."""
+        return 1.04 / math.sqrt(1 << self._precision)
+
+    def new(self) -> HyperLogLog:
+        return HyperLogLog(self._precision)
+
+    def _add(self, aggregate: HyperLogLog, value) -> HyperLogLog:
+        aggregate.add(value)
+        return aggregate
+
+    def merge(self, aggregate: HyperLogLog, other: HyperLogLog) -> HyperLogLog:
+        return aggregate.merge(other)
+
+
+class Frequency(Aggregation[CountMinSketch]):
+    """Estimates how often each value occurred (`result.name[value]`) using a `CountMinSketch`, such that an estimate is
+    at most `epsilon` times the number of values too high with a probability of `1 - delta`. The defaults take 106 KiB
+    per aggregate."""
+    __slots__ = ('_epsilon', '_delta')
+
+    def __init__(self, name: Optional[str] = None, epsilon: float = 0.001, delta: float = 0.01):
+        super().__init__(name)
+        CountMinSketch.for_error(epsilon, delta)
+        self._epsilon = epsilon
+        self._delta = delta
+
+    def __reduce__(self):
+        return type(self), (self._name, self._epsilon, self._delta)
+
+    def new(self) -> CountMinSketch:
+        return CountMinSketch.for_error(self._epsilon, self._delta)
+
+    def _add(self, aggregate: CountMinSketch, value) -> CountMinSketch:
+        aggregate.add(value)
+        return aggregate
+
+    def _add_many(self, aggregate: CountMinSketch, values: Iterable) -> CountMinSketch:
+        for value, count in Counter(values).items():
+            aggregate.add(value, count)
+        return aggregate
+
+    def merge(self, aggregate: CountMinSketch, other: CountMinSketch) -> CountMinSketch:
+        return aggregate.merge(other)
+
+
+class TopK(Aggregation[SpaceSaving]):
+    """Finds the `k` most frequent values (`result.name.most_common(k)`), keeping track of `capacity` values (at least
+    `k`, more give more accurate counts) using the Space-Saving algorithm."""
+    __slots__ = ('_k', '_capacity')
+
+    def __init__(self, name: Optional[str] = None, k: int = 10, capacity: Optional[int] = None):
+        super().__init__(name)
+        if capacity is None:
+            capacity = 10 * k
+        if not 1 <= k <= capacity:
+            raise ValueError(f"k must be at least 1 and at most the capacity ({capacity}), not {k}")
+        self._k = k
+        self._capacity = capacity
+
+    def __reduce__(self):
+        return type(self), (self._name, self._k, self._capacity)
+
+    @property
+    def k(self) -> int:
+        return self._k
+
+    def new(self) -> SpaceSaving:
+        return SpaceSaving(self._capacity)
+
+    def _add(self, aggregate: SpaceSaving, value) -> SpaceSaving:
+        aggregate.add(value)
+        return aggregate
+
+    def _add_many(self, aggregate: SpaceSaving, values: Iterable) -> SpaceSaving:
+        for value, count in Counter(values).items():
+            aggregate.add(value, count)
+        return aggregate
+
+    def merge(self, aggregate: SpaceSaving, other: SpaceSaving) -> SpaceSaving:
+        return aggregate.merge(other)
+
+
+class Sample(Aggregation[Reservoir]):
+    """Keeps a uniform random sample of at most `size` of the values (`list(result.name)`) in a `Reservoir`."""
+    __slots__ = ('_size', '_seed')
+
+    def __init__(self, name: Optional[str] = None, size: int = 100, seed=None):
+        super().__init__(name)
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self._size = size
+        self._seed = seed
+
+    def __reduce__(self):
+        return type(self), (self._name, self._size, self._seed)
+
+    def new(self) -> Reservoir:
+        return Reservoir(self._size, self._seed)
+
+    def _add(self, aggregate: Reservoir, value) -> Reservoir:
+        aggregate.add(value)
+        return aggregate
+
+    def merge(self, aggregate: Reservoir, other: Reservoir) -> Reservoir:
+        return aggregate.merge(other)
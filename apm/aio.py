@@ -0,0 +1,70 @@
+"""Matching with asynchronous predicates and transformations, using `amatch` from within a running event loop.
+
+`amatch` starts a task for every `AsyncCheck` and `AsyncTransformed` it comes across (see `apm.deferred`), the tasks of
+independent branches run concurrently. The match is repeated whenever some of them are done, until it does not depend
+on the outstanding ones any more, which are then cancelled: A conjunction fails as soon as any of its patterns does and
+an alternative matches as soon as all of the alternatives declared before it did not. Batches of `BatchCheck` are
+called in between.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+
+from .core import MatchContext, MatchResult, Nested, Pattern, Undecided
+from .deferred import Deferred
+
+
+def _deferred(ctx: MatchContext) -> Deferred:
+    deferred = ctx._deferred
+    if deferred is None or not deferred.asynchronous:
+        raise TypeError("patterns with asynchronous functions need to be matched using amatch")
+    return deferred
+
+
+class AsyncCheck(Pattern):
+    __slots__ = ('_condition',)
+
+    def __init__(self, condition: Callable[[Any], Awaitable]):
+        self._condition = condition
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        return ctx.match_if(_deferred(ctx).awaited(self._condition, value))
+
+
+class AsyncTransformed(Pattern, Nested):
+    __slots__ = ('_f', '_pattern')
+
+    def __init__(self, f: Callable[[Any], Awaitable], pattern):
+        self._f = f
+        self._pattern = pattern
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        deferred = _deferred(ctx)
+        # noinspection PyBroadException
+        try:
+            transformed = deferred.awaited(self._f, value)
+        except Exception:
+            return ctx.no_match()
+        return ctx.match(transformed, self._pattern)
+
+    def descend(self, f):
+        return AsyncTransformed(f=self._f, pattern=f(self._pattern))
+
+
+async def amatch(value, pattern, *, multimatch: bool = False, strict: bool = False) -> MatchResult:
+    """Matches the given value against a pattern which might contain `AsyncCheck` and `AsyncTransformed` (and any
+    other pattern), see `apm.aio`."""
+    deferred = Deferred(asynchronous=True)
+    try:
+        while True:
+            ctx = MatchContext(multimatch=multimatch, strict=strict)
+            ctx._deferred = deferred
+            try:
+                return ctx.match(value, pattern, strict=strict)
+            except Undecided:
+                pass
+            if not deferred.flush():
+                await deferred.wait()
+    finally:
+        await deferred.close()
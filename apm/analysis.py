@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import Set, Hashable
+
+from .aio import AsyncCheck, AsyncTransformed
+from .batch import BatchCheck
+from .core import AllOf, Capture, Dataclass, Either, Not, OneOf, Pattern, Rec, Ref, Remainder, Some, Strict, String, \
+    Underscore, Value, transform
+from .patterns import Arguments, At, Attrs, Between, Check, Contains, Each, EachItem, InstanceOf, Items, Length, \
+    Object, Regex, Returns, SubclassOf, Transformed
+
+# Patterns which neither record anything in the match context nor call user supplied functions, given that all the
+# patterns nested inside them do not either. A `Ref` stands for its `Rec`, which is looked at on its own.
+_PURE_PATTERN_TYPES = frozenset({
+    AllOf, Arguments, At, Attrs, Between, Contains, Dataclass, Each, EachItem, Either, InstanceOf, Items, Length, Not,
+    Object, OneOf, Rec, Ref, Remainder, Returns, Some, Strict, String, SubclassOf, Value,
+})
+
+
+# Patterns which call user supplied functions but do not record anything in the match context themselves.
+_CALLING_PATTERN_TYPES = frozenset({AsyncCheck, AsyncTransformed, BatchCheck, Check, Transformed})
+
+
+def capture_names(pattern) -> Set[Hashable]:
+    """The names of all captures anywhere in the given pattern."""
+    names = set()
+
+    def visit(p):
+        if isinstance(p, Capture):
+            names.add(p.name)
+        return p
+
+    transform(pattern, visit)
+    return names
+
+
+def _records_captures_node(pattern) -> bool:
+    if isinstance(pattern, Regex):
+        # noinspection PyProtectedMember
+        return bool(pattern._wildcards) or bool(pattern._bind_groups and pattern._regex.groupindex)
+    if isinstance(pattern, (Pattern, Some, Remainder, Dataclass)):
+        return type(pattern) not in _PURE_PATTERN_TYPES and type(pattern) not in _CALLING_PATTERN_TYPES
+    return False
+
+
+def records_captures(pattern) -> bool:
+    """Whether matching the given pattern might record anything in the match context (named captures, wildcards, or
+    groups of a regular expression). Custom `Pattern` subclasses are assumed to do so.
+    """
+    records = False
+
+    def visit(p):
+        nonlocal records
+        if not records and _records_captures_node(p):
+            records = True
+        return p
+
+    transform(pattern, visit)
+    return records
+
+
+def _is_resumable(pattern) -> bool:
+    """Whether matching the given pattern records nothing in the match context, and does not refer to a `Rec` outside of
+    it either (which might), such that an item which matched it need not be matched again when a deferred match is
+    repeated (see `Each`)."""
+    resumable = True
+
+    def visit(p):
+        nonlocal resumable
+        if resumable and (isinstance(p, Ref) or _records_captures_node(p)):
+            resumable = False
+        return p
+
+    transform(pattern, visit)
+    return resumable
+
+
+def _is_pure_node(pattern) -> bool:
+    if isinstance(pattern, Regex):
+        # noinspection PyProtectedMember
+        return not pattern._wildcards and not (pattern._bind_groups and pattern._regex.groupindex)
+    if isinstance(pattern, (Check, Transformed)):
+        # noinspection PyProtectedMember
+        return pattern._pure_key is not None
+    if isinstance(pattern, (Pattern, Some, Remainder, Dataclass)):
+        return type(pattern) in _PURE_PATTERN_TYPES
+    return True
+
+
+def is_pure(pattern) -> bool:
+    """Whether matching the given pattern is free of observable effects: It does not capture anything (neither named
+    captures nor wildcards) and does not invoke any functions supplied by the user (like `Check` and `Transformed` do,
+    unless their function is marked as `pure`, or custom `Pattern` subclasses might). Such a pattern always gives the
+    same result for the same value and may be evaluated any number of times, or not at all.
+    """
+    pure = True
+
+    def visit(p):
+        nonlocal pure
+        if pure and not _is_pure_node(p):
+            pure = False
+        return p
+
+    transform(pattern, visit)
+    return pure
+
+
+def _is_memoizable_node(pattern) -> bool:
+    if isinstance(pattern, Capture):
+        # noinspection PyProtectedMember
+        return type(pattern) is Capture and pattern._target is None and pattern._aggregation is None
+    if isinstance(pattern, (Regex, Underscore)):
+        return type(pattern) in (Regex, Underscore)
+    return _is_pure_node(pattern)
+
+
+def is_memoizable(pattern) -> bool:
+    """Whether the complete outcome of matching the given pattern (if it matches, the captures, and the wildcard
+    matches) depends on nothing but the value, such that it can be remembered and handed out again for an equal value.
+    This is the case for a pattern which would be pure (see `is_pure`) if it were not for named captures (which do not
+    write to a `target` nor aggregate), wildcards, and regular expressions.
+    """
+    memoizable = True
+
+    def visit(p):
+        nonlocal memoizable
+        if memoizable and not _is_memoizable_node(p):
+            memoizable = False
+        return p
+
+    transform(pattern, visit)
+    return memoizable
@@ -0,0 +1,49 @@
+"""Predicates which are called for many values at once, like a lookup in a database or a remote index.
+
+`match_many` matches many values against one pattern, with `BatchCheck(fn_many)` collecting the values of all of the
+matches (and all of the items of an `Each`, the patterns of an `AllOf`, ...) to call `fn_many` once for all of them,
+before the matches which waited for it are resumed (see `apm.deferred`). `match` calls `fn_many` with just the one
+value every time.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from .core import MatchContext, MatchResult, Pattern, Undecided
+from .deferred import Deferred
+
+
+class BatchCheck(Pattern):
+    __slots__ = ('_condition',)
+
+    def __init__(self, condition: Callable[[List], Sequence]):
+        self._condition = condition
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        deferred: Optional[Deferred] = ctx._deferred
+        if deferred is None:
+            return ctx.match_if(self._condition([value])[0])
+        return ctx.match_if(deferred.batched(self._condition, value))
+
+
+def match_many(values: Iterable, pattern, *, multimatch: bool = False, strict: bool = False) -> List[MatchResult]:
+    """Matches every one of the values against the pattern, calling the functions of `BatchCheck` patterns in as few
+    batches as possible. Returns the results in the order of the values."""
+    values = list(values)
+    results: List[Optional[MatchResult]] = [None] * len(values)
+    deferred = Deferred()
+    undecided = range(len(values))
+    while undecided:
+        waiting = []
+        for i in undecided:
+            ctx = MatchContext(multimatch=multimatch, strict=strict)
+            ctx._deferred = deferred
+            try:
+                results[i] = ctx.match(values[i], pattern, strict=strict)
+            except Undecided:
+                waiting.append(i)
+        if waiting and not deferred.flush():
+            raise RuntimeError("a pattern is undecided but there is nothing to wait for")
+        undecided = waiting
+    return results
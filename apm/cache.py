@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import enum
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from .core import _SCALARS, _get_dataclass_fields
+
+
+def value_key(value) -> Optional[Hashable]:
+    """A key for the given value which is equal for two values only if they are indistinguishable by any pattern, or
+    None if there is no such key. Unlike `==` this tells `1`, `1.0`, and `True` apart (also inside of tuples), and
+    `0.0` from `-0.0`.
+
+    Keys exist for scalars, enums, and tuples, frozensets, and frozen dataclasses made up of values which have keys.
+    """
+    t = type(value)
+    if t is float:
+        return t, value.hex()
+    if t is complex:
+        return t, value.real.hex(), value.imag.hex()
+    if t in _SCALARS or isinstance(value, enum.Enum):
+        return t, value
+    if t is tuple or t is frozenset:
+        keys = []
+        for item in value:
+            key = value_key(item)
+            if key is None:
+                return None
+            keys.append(key)
+        return t, t(keys)
+    fields = _get_dataclass_fields(t)
+    if fields is not None and t.__dataclass_params__.frozen:
+        keys = [t]
+        for _name, getter in fields:
+            key = value_key(getter(value))
+            if key is None:
+                return None
+            keys.append(key)
+        return tuple(keys)
+    return None
+
+
+class ResultCache:
+    """A thread-safe cache for the results of functions, to be given to `Check(..., cache=)` and
+    `Transformed(..., cache=)`. The functions are expected to be pure, i.e. to always give the same result for the same
+    value.
+
+    Results are kept for at most `maxsize` values (the least recently used one is evicted first) and, if a `ttl` is
+    given, for at most `ttl` seconds. Values which have a `value_key` (scalars, enums, tuples, ...) are looked up by
+    that key, i.e. by equality and type (`1` and `True` are cached separately). Any other value is looked up by
+    identity, unless `identity=False`, which requires it to support weak references (instances of most classes do,
+    dicts and lists do not): Its entries go away along with it. Results for all other values are computed every time.
+    Exceptions are never cached.
+
+    A cache may be shared by several patterns, entries are kept per function.
+    """
+
+    def __init__(self, maxsize: Optional[int] = 1024, *, ttl: Optional[float] = None, identity: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.identity = identity
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # keys of values which have been collected, removed with the next access to the cache
+        self._collected: List = []
+
+    def _key(self, f: Callable, value) -> Tuple[Optional[Tuple], Optional[weakref.ref]]:
+        key = value_key(value)
+        if key is not None:
+            return (f, key), None
+        if not self.identity:
+            return None, None
+        key = (f, id(value))
+        collected = self._collected
+        try:
+            ref = weakref.ref(value, lambda r: collected.append((key, r)))
+        except TypeError:
+            return None, None
+        return key, ref
+
+    def _purge(self):
+        while self._collected:
+            key, ref = self._collected.pop()
+            entry = self._entries.get(key)
+            # the id might have been reused by another value in the meantime, which has an entry of its own
+            if entry is not None and entry[2] is ref:
+                del self._entries[key]
+
+    def call(self, f: Callable, value):
+        """Returns `f(value)`, from the cache if possible."""
+        key, ref = self._key(f, value)
+        if key is None:
+            with self._lock:
+                self.misses += 1
+            return f(value)
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires, entry_ref = entry
+                if (expires is None or expires > time.monotonic()) and (entry_ref is None or entry_ref() is value):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+            self.misses += 1
+        result = f(value)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (result, expires, ref)
+            self._entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._collected.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            self._purge()
+            return len(self._entries)
+
+    def __repr__(self):
+        return f"ResultCache(maxsize={self.maxsize}, ttl={self.ttl}, hits={self.hits}, misses={self.misses})"
@@ -0,0 +1,253 @@
+"""Complex event processing: finding sequence patterns like `[failed, Some(failed, at_least=4), succeeded]` in a stream
+of events, one event at a time.
+
+A `SequenceDetector` splits the stream into partitions (per user, say) and, within each partition, considers the
+events which match any of the patterns of the sequence. A match is a run of consecutive such events which matches the
+sequence just like a list of them would (events which none of the patterns match do not interrupt it). Every event
+advances all of the partial matches of its partition at once, using a non-deterministic automaton made from the
+sequence, and starts a new one. Partial matches expire once they span more than the window.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .core import MatchResult, Some, _get_as, _is_a
+from .match import match
+
+# the state of a partial match: the element of the sequence, the pattern within the element, and how often the
+# element has been repeated (for a `Some`)
+_State = Tuple[int, int, int]
+
+
+@dataclasses.dataclass(frozen=True)
+class SequenceMatch:
+    __slots__ = ('partition', 'events', 'result', 'start', 'end')
+
+    partition: Hashable
+    events: Tuple
+    # the result of matching the list of the events against the sequence
+    result: MatchResult
+    # the timestamps of the first and the last event
+    start: float
+    end: float
+
+
+class _Element:
+    __slots__ = ('patterns', 'at_least', 'at_most')
+
+    def __init__(self, pattern):
+        if _is_a(pattern, Some):
+            some = _get_as(pattern, Some)
+            if any(_is_a(p, Some) for p in some.patterns):
+                raise ValueError("a Some within a Some is not supported in event sequences")
+            self.patterns = tuple(some.patterns)
+            self.at_least = some.at_least or 0
+            self.at_most = some.at_most
+        else:
+            self.patterns = (pattern,)
+            self.at_least = 1
+            self.at_most = 1
+
+
+class _Partition:
+    __slots__ = ('events', 'partials', 'seq')
+
+    def __init__(self):
+        # (seq, timestamp, event) of the events which the partial matches span
+        self.events: Deque[Tuple[int, float, Any]] = deque()
+        # the states of the partial matches by the seq of the event they start with, oldest first
+        self.partials: Dict[int, FrozenSet[_State]] = {}
+        self.seq = 0
+
+
+class SequenceDetector:
+    """Finds matches of the `sequence` (a list of patterns, with `Some` for repetitions) in a stream of events.
+
+    - `partition_by` is the name of a capture (the first pattern of the sequence which matches an event and captures
+      it decides) or a function of the event. Events of different partitions never end up in the same match. An event
+      without a partition key is dropped.
+    - `within` limits the seconds in between the first and the last event of a match, `within_events` the number of
+      events in it. Timestamps come from `timestamp(event)`, or `time.monotonic()` when the event is fed.
+    - Per partition at most `max_partials` partial matches (the oldest ones are given up first) of at most
+      `max_events` events are kept. Partitions without partial matches take no memory at all.
+    - With `overlapping=False` (the default) a match gives up all of the other partial matches in its partition, which
+      started before it ended, otherwise they go on (and, if the sequence ends with a `Some`, longer matches follow).
+    """
+
+    def __init__(self, sequence: Union[list, tuple], *,
+                 partition_by: Union[None, Hashable, Callable[[Any], Hashable]] = None,
+                 within: Optional[float] = None,
+                 within_events: Optional[int] = None,
+                 timestamp: Optional[Callable[[Any], float]] = None,
+                 max_partials: int = 64,
+                 max_events: int = 1024,
+                 overlapping: bool = False,
+                 strict: bool = False):
+        if not isinstance(sequence, (list, tuple)) or not sequence:
+            raise ValueError("the sequence must be a non-empty list or tuple of patterns")
+        if max_partials < 1 or max_events < 1:
+            raise ValueError("max_partials and max_events must be at least 1")
+        self.sequence = sequence
+        self._elements = [_Element(p) for p in sequence]
+        # every distinct pattern an event might be matched against, in order
+        self._patterns = list({id(p): p for element in self._elements for p in element.patterns}.values())
+        self.partition_by = partition_by
+        self.within = within
+        self.max_events = max_events if within_events is None else min(within_events, max_events)
+        self.timestamp = timestamp
+        self.max_partials = max_partials
+        self.overlapping = overlapping
+        self.strict = strict
+        self._partitions: Dict[Hashable, _Partition] = {}
+        self._latest: Optional[float] = None
+        self._next_sweep: Optional[float] = None
+
+    def __len__(self):
+        """The number of partial matches."""
+        return sum(len(partition.partials) for partition in self._partitions.values())
+
+    @property
+    def partitions(self) -> int:
+        """The number of partitions which have partial matches."""
+        return len(self._partitions)
+
+    def _advance(self, state: _State, matched: Dict[int, MatchResult], into: set):
+        i, j, count = state
+        elements = self._elements
+        if i == len(elements):
+            return
+        element = elements[i]
+        if j:
+            if matched[id(element.patterns[j])]:
+                into.add(self._normalize(i, j + 1, count))
+            return
+        if element.at_most is None or count < element.at_most:
+            if matched[id(element.patterns[0])]:
+                into.add(self._normalize(i, 1, count))
+        if count >= element.at_least:
+            self._advance((i + 1, 0, 0), matched, into)
+
+    def _normalize(self, i: int, j: int, count: int) -> _State:
+        if j == len(self._elements[i].patterns):
+            return i, 0, count + 1
+        return i, j, count
+
+    def _accepts(self, state: _State) -> bool:
+        i, j, count = state
+        if j:
+            return False
+        elements = self._elements
+        while i < len(elements):
+            if count < elements[i].at_least:
+                return False
+            i, count = i + 1, 0
+        return True
+
+    def _key(self, event, matched: Dict[int, MatchResult]) -> Tuple[bool, Hashable]:
+        partition_by = self.partition_by
+        if partition_by is None:
+            return True, None
+        if callable(partition_by):
+            return True, partition_by(event)
+        for pattern in self._patterns:
+            result = matched[id(pattern)]
+            if result and partition_by in result:
+                return True, result[partition_by]
+        return False, None
+
+    def feed(self, event, timestamp: Optional[float] = None) -> List[SequenceMatch]:
+        """Feeds the next event, returns the matches which it completes."""
+        matched = {id(p): match(event, p, strict=self.strict) for p in self._patterns}
+        if not any(matched.values()):
+            return []
+        if timestamp is None:
+            timestamp = time.monotonic() if self.timestamp is None else self.timestamp(event)
+        self._latest = timestamp if self._latest is None else max(self._latest, timestamp)
+        has_key, key = self._key(event, matched)
+        if not has_key:
+            return []
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition()
+        seq = partition.seq
+        partition.seq += 1
+        partition.events.append((seq, timestamp, event))
+
+        partials = {}
+        for start, states in partition.partials.items():
+            if self._expired(partition, start, seq, timestamp):
+                continue
+            advanced = set()
+            for state in states:
+                self._advance(state, matched, advanced)
+            if advanced:
+                partials[start] = frozenset(advanced)
+        started = set()
+        self._advance((0, 0, 0), matched, started)
+        if started:
+            partials[seq] = frozenset(started)
+        while len(partials) > self.max_partials:
+            del partials[next(iter(partials))]
+        partition.partials = partials
+
+        found = []
+        for start, states in list(partials.items()):
+            if any(self._accepts(state) for state in states):
+                found.extend(self._complete(key, partition, start))
+                if found and not self.overlapping:
+                    partition.partials = {}
+                    break
+        self._trim(key, partition)
+        if self.within is not None and (self._next_sweep is None or timestamp >= self._next_sweep):
+            self.expire()
+        return found
+
+    def _expired(self, partition: _Partition, start: int, seq: int, timestamp: float) -> bool:
+        if seq - start + 1 > self.max_events:
+            return True
+        if self.within is not None:
+            first = partition.events[start - partition.events[0][0]]
+            return timestamp - first[1] > self.within
+        return False
+
+    def _complete(self, key: Hashable, partition: _Partition, start: int) -> List[SequenceMatch]:
+        first_seq = partition.events[0][0]
+        span = [partition.events[i] for i in range(start - first_seq, len(partition.events))]
+        events = tuple(event for _seq, _timestamp, event in span)
+        # the automaton knows that the events fit the sequence, matching them as a list tells whether they do in the
+        # same way as they would in a list (the repetitions of `Some` are not greedy) and captures everything
+        result = match(list(events), list(self.sequence), strict=self.strict)
+        if not result:
+            return []
+        return [SequenceMatch(partition=key, events=events, result=result, start=span[0][1], end=span[-1][1])]
+
+    def _trim(self, key: Hashable, partition: _Partition):
+        if not partition.partials:
+            del self._partitions[key]
+            return
+        oldest = next(iter(partition.partials))
+        events = partition.events
+        while events[0][0] < oldest:
+            events.popleft()
+
+    def expire(self, now: Optional[float] = None):
+        """Gives up the partial matches which can not end within the window any more, as of the given time (defaults
+        to the latest timestamp seen). Happens on its own once per window."""
+        if now is None:
+            now = self._latest
+        if now is None or self.within is None:
+            return
+        for key, partition in list(self._partitions.items()):
+            partition.partials = {start: states for start, states in partition.partials.items()
+                                  if now - partition.events[start - partition.events[0][0]][1] <= self.within}
+            self._trim(key, partition)
+        self._next_sweep = now + self.within
+
+    def process(self, events: Iterable) -> Iterator[SequenceMatch]:
+        """Feeds all of the events, yields the matches as they are found."""
+        for event in events:
+            yield from self.feed(event)
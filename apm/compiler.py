@@ -0,0 +1,487 @@
+from __future__ import annotations
+
+import operator as ops
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar, Union
+
+from .analysis import is_memoizable
+from .cache import ResultCache
+from .core import AllOf, Capture, MatchContext, MatchResult, Not, OneOf, Pattern, Strict, Underscore, Value, \
+    WildcardMatch, _get_dataclass_fields, _has_registered_handler, _is_literal
+from .optimizer import _literal_tree, _matches_literal
+from .patterns import Between, Check, InstanceOf, Transformed
+
+# A compiled pattern is a function `(value, ctx, strict) -> bool` which records captures in `ctx` exactly like the
+# interpreter (`MatchContext.match`) would, but without keeping track of the match stack and without creating a
+# `MatchResult` for every single node. `strict` is the effective strictness, i.e. already combined with the
+# properties of the context.
+Compiled = Callable[[object, MatchContext, bool], bool]
+
+T = TypeVar('T')
+
+
+def _compile_literal(literal) -> Compiled:
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        if _get_dataclass_fields(type(value)) is not None:
+            return False
+        if literal == value:
+            return not strict or type(literal) == type(value)
+        return False
+
+    return compiled
+
+
+def _compile_literal_tree(literal) -> Compiled:
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return _matches_literal(value, literal, strict, ctx.properties.strict)
+
+    return compiled
+
+
+def _compile_all_of(pattern: AllOf) -> Compiled:
+    conjuncts = tuple(_compile(p) for p in pattern.patterns)
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        nested_strict = ctx.properties.strict
+        for conjunct in conjuncts:
+            if not conjunct(value, ctx, nested_strict):
+                return False
+        return True
+
+    return compiled
+
+
+def _compile_one_of(pattern: OneOf) -> Compiled:
+    alternatives: Dict[int, Compiled] = {id(p): _compile(p) for p in pattern.patterns}
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        nested_strict = ctx.properties.strict
+        for p in pattern.candidates(value):
+            if alternatives[id(p)](value, ctx, nested_strict):
+                return True
+        return False
+
+    return compiled
+
+
+def _compile_not(pattern: Not) -> Compiled:
+    inner = _compile(pattern.pattern)
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return not inner(value, ctx, ctx.properties.strict)
+
+    return compiled
+
+
+def _compile_capture(pattern: Capture) -> Compiled:
+    inner = _compile(pattern.pattern)
+    capture = pattern.capture
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        if inner(value, ctx, strict):
+            capture(value, ctx=ctx)
+            return True
+        return False
+
+    return compiled
+
+
+def _compile_strict(pattern: Strict) -> Compiled:
+    inner = _compile(pattern.pattern)
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return inner(value, ctx, True)
+
+    return compiled
+
+
+def _compile_value(pattern: Value) -> Compiled:
+    expected = pattern.value
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        if strict and type(expected) != type(value):
+            return False
+        return bool(expected == value)
+
+    return compiled
+
+
+def _compile_instance_of(pattern: InstanceOf) -> Compiled:
+    types = pattern.types
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return isinstance(value, types)
+
+    return compiled
+
+
+def _compile_between(pattern: Between) -> Compiled:
+    lower, upper = pattern.lower, pattern.upper
+    op_lower = ops.gt if pattern.lower_bound_exclusive else ops.ge
+    op_upper = ops.lt if pattern.upper_bound_exclusive else ops.le
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return bool(op_lower(value, lower) and op_upper(value, upper))
+
+    return compiled
+
+
+def _compile_check(pattern: Check) -> Compiled:
+    # noinspection PyProtectedMember
+    apply = pattern._apply
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return bool(apply(value, ctx))
+
+    return compiled
+
+
+def _compile_transformed(pattern: Transformed) -> Compiled:
+    # noinspection PyProtectedMember
+    apply = pattern._apply
+    # noinspection PyProtectedMember
+    inner = _compile(pattern._pattern)
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        # noinspection PyBroadException
+        try:
+            transformed = apply(value, ctx)
+        except Exception:
+            return False
+        return inner(transformed, ctx, ctx.properties.strict)
+
+    return compiled
+
+
+def _compile_underscore(pattern: Underscore) -> Compiled:
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        ctx.record(pattern, value)
+        return True
+
+    return compiled
+
+
+def _compile_pattern_node(pattern: Pattern) -> Compiled:
+    match = pattern.match
+
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return bool(match(value, ctx=ctx, strict=strict))
+
+    return compiled
+
+
+def _compile_interpreted(pattern) -> Compiled:
+    def compiled(value, ctx: MatchContext, strict: bool) -> bool:
+        return bool(ctx.match(value, pattern, strict=strict))
+
+    return compiled
+
+
+def _compile_ellipsis(_value, _ctx: MatchContext, _strict: bool) -> bool:
+    return True
+
+
+_COMPILERS: Dict[type, Callable[..., Compiled]] = {
+    Capture: _compile_capture,
+    Strict: _compile_strict,
+    Value: _compile_value,
+    OneOf: _compile_one_of,
+    Not: _compile_not,
+    Underscore: _compile_underscore,
+    InstanceOf: _compile_instance_of,
+    Between: _compile_between,
+    Check: _compile_check,
+    Transformed: _compile_transformed,
+}
+
+
+def _compile(pattern) -> Compiled:
+    if pattern is Ellipsis:
+        return _compile_ellipsis
+    if _has_registered_handler(type(pattern)):
+        return _compile_interpreted(pattern)
+    compiler = _COMPILERS.get(type(pattern))
+    if compiler is not None:
+        return compiler(pattern)
+    if type(pattern) == AllOf and not pattern.adaptive:
+        return _compile_all_of(pattern)
+    if isinstance(pattern, Pattern):
+        return _compile_pattern_node(pattern)
+    if _is_literal(pattern):
+        return _compile_literal(pattern)
+    if type(pattern) == tuple and _literal_tree(pattern) is not None:
+        # a tuple can not be changed after the fact, unlike dicts and lists which are left to the interpreter
+        return _compile_literal_tree(_literal_tree(pattern))
+    return _compile_interpreted(pattern)
+
+
+class _CompiledNoMatch(MatchResult):
+    """A failed match from a compiled pattern, which does not know why it failed. `explain()` finds out by matching
+    the value once more using the interpreter."""
+
+    def __init__(self, value, pattern, *, ctx: MatchContext, strict: bool):
+        super().__init__(matches=False, context=ctx, match_stack=[])
+        self._replay = (value, pattern, strict)
+
+    def explain(self, *, short: bool = False) -> str:
+        value, pattern, strict = self._replay
+        properties = self._context.properties
+        ctx = MatchContext(multimatch=properties.multimatch, strict=properties.strict)
+        return ctx.match(value, pattern, strict=strict).explain(short=short)
+
+
+# What is remembered of a match: whether it matched, the captures, and the wildcard matches as `(id of the wildcard,
+# index, value)` (a failed match might have captured something before failing).
+_Outcome = Tuple[bool, Dict, Tuple[Tuple[int, int, Any], ...]]
+
+
+def _groups(ctx: MatchContext) -> Dict:
+    if ctx.properties.multimatch:
+        # the lists of multiple matches are extended by later matches in the same context
+        return {key: [*values] for key, values in ctx.groups.items()}
+    return {**ctx.groups}
+
+
+class Memo:
+    """Remembers the outcome of matching values against one pattern (whether it matched, the captures, and the
+    wildcard matches) in a `ResultCache`, bounded by its `maxsize` and `ttl`. Only values which have a `value_key`
+    (scalars, enums, tuples, frozen dataclasses, ...) are remembered, any other value is matched every time.
+
+    Only patterns which are memoizable (see `analysis.is_memoizable`) may be memoized. Captured values are handed out
+    again as they are, they are not copied.
+    """
+    __slots__ = ('_pattern', '_match', '_functions', 'cache')
+
+    def __init__(self, pattern, match: Callable[[Any, MatchContext, bool], MatchResult], cache: ResultCache):
+        self._pattern = pattern
+        self._match = match
+        # the outcomes are kept per function by the cache, one function per combination of options
+        self._functions: Dict[Tuple[bool, bool], Callable[[Any], _Outcome]] = {}
+        self.cache = cache
+
+    def _function(self, multimatch: bool, strict: bool) -> Callable[[Any], _Outcome]:
+        f = self._functions.get((multimatch, strict))
+        if f is None:
+            def f(value) -> _Outcome:
+                ctx = MatchContext(multimatch=multimatch, strict=strict)
+                matches = bool(self._match(value, ctx, strict))
+                return matches, _groups(ctx), tuple((id_, w.index, w.value) for id_, w in ctx.wildcards.items())
+
+            f = self._functions.setdefault((multimatch, strict), f)
+        return f
+
+    def match(self, value, *, multimatch: bool = False, strict: bool = False) -> MatchResult:
+        matches, groups, wildcards = self.cache.call(self._function(multimatch, strict), value)
+        ctx = MatchContext(multimatch=multimatch, strict=strict)
+        ctx.groups = {key: [*values] for key, values in groups.items()} if multimatch else {**groups}
+        for id_, index, wildcard_value in wildcards:
+            ctx.wildcards[id_] = wildcard_match = WildcardMatch(index)
+            wildcard_match.set(wildcard_value)
+        if matches:
+            return ctx.matches()
+        return _CompiledNoMatch(value, self._pattern, ctx=ctx, strict=strict)
+
+
+def _memo_cache(memoize: Union[bool, ResultCache]) -> Optional[ResultCache]:
+    if memoize is True:
+        return ResultCache(identity=False)
+    if memoize is None or memoize is False:
+        return None
+    return memoize
+
+
+class CompiledPattern:
+    """A pattern turned into nested closures which match exactly like the pattern itself, just faster. Patterns
+    are not expected to change after the fact, dicts and lists inside of them are matched by the interpreter though.
+
+    With `memoize` (a `ResultCache` or True for a new one) `match()` remembers its outcome per value, see `Memo`. This
+    is only done if the pattern is memoizable (see `analysis.is_memoizable`), other patterns are matched as usual.
+    """
+
+    def __init__(self, pattern, *, memoize: Union[bool, ResultCache] = False):
+        self._pattern = pattern
+        self._compiled = _compile(pattern)
+        cache = _memo_cache(memoize)
+        self._memo: Optional[Memo] = None
+        if cache is not None and is_memoizable(pattern):
+            self._memo = Memo(pattern, lambda value, ctx, strict: self.match_in(value, ctx=ctx, strict=strict), cache)
+
+    def match_in(self, value, *, ctx: MatchContext, strict: bool = False) -> MatchResult:
+        if self._compiled(value, ctx, strict or ctx.properties.strict):
+            return ctx.matches()
+        return _CompiledNoMatch(value, self._pattern, ctx=ctx, strict=strict)
+
+    def match(self, value, *, multimatch: bool = False, strict: bool = False) -> MatchResult:
+        if self._memo is not None:
+            return self._memo.match(value, multimatch=multimatch, strict=strict)
+        return self.match_in(value, ctx=MatchContext(multimatch=multimatch, strict=strict), strict=strict)
+
+    @property
+    def pattern(self):
+        return self._pattern
+
+    @property
+    def memo(self) -> Optional[Memo]:
+        return self._memo
+
+
+def compile_pattern(pattern, *, memoize: Union[bool, ResultCache] = False) -> CompiledPattern:
+    """Compiles the given pattern once and for all, see `CompiledPattern`."""
+    return CompiledPattern(pattern, memoize=memoize)
+
+
+_UNTRACKED = frozenset({dict, list, tuple, type(...)})
+
+
+class _PatternTable:
+    """Entries keyed by pattern objects, at most `capacity` of them (the least recently used one is dropped first).
+
+    The patterns are referenced weakly, an entry does not keep its pattern alive (the value of an entry might, which
+    is bounded by the capacity). An entry whose pattern has been collected is replaced once its id comes up again.
+    """
+    __slots__ = ('capacity', '_entries', '_lock', '_on_evict')
+
+    def __init__(self, capacity: int, *, on_evict: Optional[Callable[[Any], None]] = None):
+        self.capacity = capacity
+        self._entries: OrderedDict[int, Tuple[weakref.ref, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        # called with the pattern of an entry which is dropped to make room, if it is still alive
+        self._on_evict = on_evict
+
+    def get(self, pattern, create: Callable[[Any], T]) -> T:
+        """Returns the entry for the given pattern, created by `create(pattern)` if there is none. Raises a TypeError
+        if the pattern can not be referenced weakly."""
+        key = id(pattern)
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None and entry[0]() is pattern:
+            # hits do not wait for the lock, the order of recent use is kept up to date unless it is contended
+            if self._lock.acquire(blocking=False):
+                try:
+                    entries.move_to_end(key)
+                except KeyError:
+                    pass  # evicted in the meantime
+                finally:
+                    self._lock.release()
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0]() is not pattern:
+                # either not seen before or the id belonged to an object which has been collected in the meantime
+                entry = self._entries[key] = (weakref.ref(pattern), create(pattern))
+                while len(self._entries) > self.capacity:
+                    _key, (ref, _value) = self._entries.popitem(last=False)
+                    evicted = ref()
+                    if evicted is not None and self._on_evict is not None:
+                        self._on_evict(evicted)
+            self._entries.move_to_end(key)
+        return entry[1]
+
+    def peek(self, pattern) -> Optional[Any]:
+        entry = self._entries.get(id(pattern))
+        if entry is None or entry[0]() is not pattern:
+            return None
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Tiering:
+    """Counts how often `match()` is invoked per pattern object and once a pattern was used `threshold` times
+    matches it using a `CompiledPattern` from then on. The count is kept on the pattern itself, so patterns which are
+    used a few times only (like the ones written inline) cost no more than an increment. At most `capacity` compiled
+    patterns are kept, the least recently used one is forgotten (and counts from zero again) when a new one comes
+    along. A `threshold` of None disables tiering altogether.
+
+    Only instances of `Pattern` are counted. Plain dicts, lists, and tuples are usually created anew for every call
+    anyway and are always interpreted, and so are dataclasses.
+    """
+
+    def __init__(self, *, threshold: Optional[int] = 64, capacity: int = 256):
+        self.threshold = threshold
+        self._entries = _PatternTable(capacity, on_evict=_reset_uses)
+
+    @property
+    def capacity(self) -> int:
+        return self._entries.capacity
+
+    def match(self, value, pattern, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        threshold = self.threshold
+        if threshold is None or not isinstance(pattern, Pattern):
+            return ctx.match(value, pattern, strict=strict)
+        # the counter is not synchronized, a lost update only delays compilation a bit
+        uses = getattr(pattern, '_uses', 0) + 1
+        if uses < threshold:
+            pattern._uses = uses
+            return ctx.match(value, pattern, strict=strict)
+        if uses == threshold:
+            pattern._uses = uses
+        compiled: CompiledPattern = self._entries.get(pattern, CompiledPattern)
+        return compiled.match_in(value, ctx=ctx, strict=strict)
+
+    def is_compiled(self, pattern) -> bool:
+        return self._entries.peek(pattern) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _reset_uses(pattern):
+    pattern._uses = 0
+
+
+tiering = Tiering()
+
+
+class Memoization:
+    """Keeps a `Memo` per pattern object for `match(..., memoize=True)`, for at most `capacity` patterns (the least
+    recently used one is forgotten first), each remembering the outcomes for at most `maxsize` values.
+
+    Patterns which are not memoizable (see `analysis.is_memoizable`) or can not be referenced weakly (plain dicts,
+    lists, and tuples) are matched as usual; `compile_pattern(..., memoize=True)` memoizes those, too.
+    """
+
+    def __init__(self, *, maxsize: int = 1024, capacity: int = 256):
+        self.maxsize = maxsize
+        self._entries = _PatternTable(capacity)
+
+    def _memo(self, pattern) -> Optional[Memo]:
+        if not is_memoizable(pattern):
+            return None
+        return Memo(pattern, lambda value, ctx, strict: tiering.match(value, pattern, ctx=ctx, strict=strict),
+                    ResultCache(self.maxsize, identity=False))
+
+    def match(self, value, pattern, *, multimatch: bool = False, strict: bool = False) -> MatchResult:
+        memo = None
+        if type(pattern) not in _UNTRACKED:
+            try:
+                memo = self._entries.get(pattern, self._memo)
+            except TypeError:
+                # can not be referenced weakly
+                pass
+        if memo is None:
+            ctx = MatchContext(multimatch=multimatch, strict=strict)
+            return tiering.match(value, pattern, ctx=ctx, strict=strict)
+        return memo.match(value, multimatch=multimatch, strict=strict)
+
+    def memo(self, pattern) -> Optional[Memo]:
+        return self._entries.peek(pattern)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+memoization = Memoization()
@@ -1,14 +1,20 @@
 from __future__ import annotations
 
 import collections.abc as abc
+import contextvars
 import dataclasses
+import enum
+import math
+import weakref
 from abc import abstractmethod, ABC
 from copy import copy
 from dataclasses import is_dataclass
 from itertools import chain
-from typing import Optional, List, Dict, Union, Tuple, Callable, Generic, TypeVar, Hashable, Iterable, Type
+from operator import attrgetter
+from time import perf_counter_ns
+from typing import Any, Optional, List, Dict, Union, Tuple, Callable, Generic, TypeVar, Hashable, Iterable, Type
 
-from ._util import SeqIterator, call
+from ._util import SeqIterator, WeakTypeCache, call
 from .generic import AutoEqHash, AutoRepr
 from .no_value import NoValue
 
@@ -17,7 +23,52 @@ def apply(func, result: MatchResult):
     return call(func, *result.wildcard_matches(), **result.groups())
 
 
+# Literals of these types compare and hash consistently with each other, so looking them up in a dict finds exactly
+# the entries which `==` would find. Values of any other type are never used as a key for such a lookup.
+_SCALARS = frozenset({str, int, float, bool, complex, bytes, type(None)})
+
+
+def _is_literal(value) -> bool:
+    return type(value) in _SCALARS or isinstance(value, enum.Enum)
+
+
+def _compute_dataclass_fields(type_: type) -> Optional[Tuple[Tuple[str, Callable], ...]]:
+    if not is_dataclass(type_):
+        return None
+    return tuple((field.name, attrgetter(field.name)) for field in dataclasses.fields(type_))
+
+
+_dataclass_fields = WeakTypeCache()
+
+
+def _get_dataclass_fields(type_: type) -> Optional[Tuple[Tuple[str, Callable], ...]]:
+    """Returns `(name, getter)` for every field of the given dataclass type, or None if it is not a dataclass.
+
+    The result is cached per type, so asking this for every value that is being matched is cheap.
+    """
+    return _dataclass_fields.get(type_, _compute_dataclass_fields)
+
+
+def _dataclass_pattern_fields(pattern) -> Optional[Tuple[type, List[Tuple[Callable, Any]]]]:
+    """The type of a dataclass instance (or `Dataclass`) used as a pattern and the getters of its fields along with
+    the patterns they hold, None for any other pattern."""
+    pattern_fields = _get_dataclass_fields(type(pattern))
+    if pattern_fields is not None:
+        getters = []
+        for _name, getter in pattern_fields:
+            try:
+                getters.append((getter, getter(pattern)))
+            except AttributeError:
+                pass
+        return type(pattern), getters
+    if isinstance(pattern, Dataclass):
+        return pattern.type, pattern.getters
+    return None
+
+
 class WildcardMatch:
+    __slots__ = ('index', 'value')
+
     def __init__(self, index):
         self.index = index
         self.value = None
@@ -29,13 +80,26 @@ class WildcardMatch:
         return self.value
 
 
+class Undecided(BaseException):
+    """Raised by a pattern which can not tell whether it matches yet, as it waits for the outcome of a function which
+    is awaited or called in a batch (see `apm.deferred`). Conjunctions and alternatives catch it to go on with their
+    other patterns, such that everything they wait for is waited for at the same time (or called for in the same
+    batch), and raise it again once they are done. An exception raised by a pattern which comes after an undecided one
+    is held back until the match is repeated, as the undecided pattern might keep it from being matched at all."""
+
+
 @dataclasses.dataclass(frozen=True)
 class MatchContextProperties:
+    __slots__ = ('multimatch', 'strict')
+
     multimatch: bool
     strict: bool
 
 
 class MatchContext:
+    __slots__ = ('groups', 'wildcards', 'properties', '_match_stack', '_memo', '_aggregations', '_deferred',
+                 '_references')
+
     def __init__(self, *, multimatch: bool = False, strict: bool = False, _copy_from: Optional[MatchContext] = None):
         if _copy_from is None:
             self.groups = {}
@@ -45,11 +109,68 @@ class MatchContext:
                 strict=strict,
             )
             self._match_stack = []
+            self._memo: Optional[Dict[Tuple[Hashable, int], Tuple]] = None
+            # the aggregation for every group which holds an aggregate
+            self._aggregations: Optional[Dict[Hashable, Aggregation]] = None
+            # outcomes of functions which are called later on (asynchronously or in batches), see `apm.deferred`
+            self._deferred = None
+            # the `Rec` which each `Ref` refers to, by name, while matching the pattern of the `Rec`
+            self._references: Optional[Dict[Hashable, Rec]] = None
         else:
             self.groups = {**_copy_from.groups}
             self.wildcards = {**_copy_from.wildcards}
             self.properties = _copy_from.properties
             self._match_stack = [*_copy_from._match_stack]
+            # results of pure functions do not depend on the context, forks of the same match share them
+            if _copy_from._memo is None:
+                _copy_from._memo = {}
+            self._memo = _copy_from._memo
+            self._deferred = _copy_from._deferred
+            # scopes are entered and left in order, forks which are given up leave them just as well
+            self._references = _copy_from._references
+            self._aggregations = None
+            if _copy_from._aggregations:
+                # aggregates are usually updated in place, a fork which is given up must not change them
+                self._aggregations = {**_copy_from._aggregations}
+                groups = self.groups
+                for name, aggregation in self._aggregations.items():
+                    groups[name] = aggregation.copy(groups[name])
+
+    def call_pure(self, key: Hashable, f: Callable, value):
+        """Calls `f(value)` unless a function with the same key has been applied to the same value (the very same
+        object) during this match already, in which case the previous result is returned (or exception raised)."""
+        memo = self._memo
+        if memo is None:
+            memo = self._memo = {}
+        memo_key = (key, id(value))
+        entry = memo.get(memo_key)
+        if entry is not None and entry[0] is value:
+            if entry[2]:
+                raise entry[1]
+            return entry[1]
+        try:
+            result = f(value)
+        except Exception as e:
+            # the value is kept in the entry so that its id is not reused by another object during this match
+            memo[memo_key] = (value, e, True)
+            raise
+        memo[memo_key] = (value, result, False)
+        return result
+
+    def aggregate(self, name: Hashable, aggregation: Aggregation, value):
+        """Adds the value to the aggregate in the group of the given name, which is created using the aggregation if
+        there is none yet. Aggregates live in the context only, such that the same pattern can be used by any number
+        of matches at the same time."""
+        aggregations = self._aggregations
+        if aggregations is None:
+            aggregations = self._aggregations = {}
+        groups = self.groups
+        if name in aggregations:
+            aggregate = groups[name]
+        else:
+            aggregate = aggregation.new()
+            aggregations[name] = aggregation
+        groups[name] = aggregation.add(aggregate, value)
 
     def __setitem__(self, key, value):
         groups = self.groups
@@ -67,60 +188,31 @@ class MatchContext:
         return item in self.groups
 
     def match(self, value, pattern, strict=False) -> MatchResult:
-        deferred: List[Callable] = []
         self._match_stack.append((value, pattern))
-        deferred.append(lambda: self._match_stack.pop())
-
         try:
-            strict = strict or self.properties.strict
-
-            if pattern is Ellipsis:
-                return self.matches()
-
-            if isinstance(pattern, Pattern):
-                return pattern.match(value, ctx=self, strict=strict)
-
-            if is_dataclass(value):
-                if is_dataclass(pattern):
-                    pattern_type = type(pattern)
-                    pattern_dict = pattern.__dict__
-                elif isinstance(pattern, Dataclass):
-                    pattern_type = pattern.type
-                    pattern_dict = pattern.dict
-                else:
-                    return self.no_match()
-
-                if not issubclass(type(value), pattern_type):
-                    return self.no_match()
-                return _match_mapping(value.__dict__, pattern_dict, ctx=self, strict=strict)
-
-            if type(pattern) in (dict, Remainder):
-                return _match_mapping(value, pattern, ctx=self, strict=strict)
-
-            if type(pattern) == tuple:
-                if not isinstance(value, tuple) or strict and type(value) != tuple:
-                    return self.no_match()
-                return _match_sequence(value, pattern, ctx=self)
-
-            if type(pattern) == list:
-                if strict and type(value) != list:
-                    return self.no_match()
-                return _match_sequence(value, pattern, ctx=self)
-
-            if type(pattern) == range:
-                if strict and type(value) != range:
-                    return self.no_match()
-                return _match_sequence(value, pattern, ctx=self)
-
-            if pattern == value:
-                if strict:
-                    return self.match_if(type(pattern) == type(value))
-                return self.matches()
+            handler = _pattern_handlers.get(type(pattern), _resolve_pattern_handler)
+            return handler(value, pattern, ctx=self, strict=strict or self.properties.strict)
+        finally:
+            self._match_stack.pop()
 
+    def _match_dataclass(self, value, value_fields, pattern, *, strict: bool) -> MatchResult:
+        fields = _dataclass_pattern_fields(pattern)
+        if fields is None:
             return self.no_match()
-        finally:
-            for finalizer in deferred:
-                finalizer()
+        pattern_type, getters = fields
+        if not issubclass(type(value), pattern_type):
+            return self.no_match()
+        for getter, field_pattern in getters:
+            try:
+                field_value = getter(value)
+            except AttributeError:
+                return self.no_match()
+            result = self.match(field_value, field_pattern)
+            if not result:
+                return result
+        if strict and len(value_fields) > len(getters):
+            return self.no_match()
+        return self.matches()
 
     def matches(self) -> MatchResult:
         return MatchResult(matches=True, context=self, match_stack=copy(self._match_stack))
@@ -151,10 +243,14 @@ class MatchContext:
         assert self.properties is other.properties
         self.groups.update(other.groups)
         self.wildcards.update(other.wildcards)
+        if other._aggregations:
+            self._aggregations = {**(self._aggregations or {}), **other._aggregations}
         self._match_stack = [*other._match_stack]
 
 
 class MatchResult(abc.Mapping):
+    # no __slots__ here: TryMatch derives from both this and BaseException, their layouts would conflict
+
     def __init__(self, *, matches: bool, context: MatchContext, match_stack: List[Tuple]):
         self._matches: bool = matches
         self._context: MatchContext = context
@@ -214,6 +310,8 @@ class MatchResult(abc.Mapping):
 
 
 class Capturable:
+    __slots__ = ()
+
     def __capture(self, other: Union[str, Aggregation]):
         if isinstance(other, Aggregation):
             return Capture(self, name=other.name, agg=other)
@@ -227,14 +325,23 @@ class Capturable:
 
 
 class Nested:
+    __slots__ = ()
+
     def descend(self, f):
         raise NotImplementedError
 
 
 class Dataclass(Nested):
+    __slots__ = ('type', 'dict', 'getters')
+
     def __init__(self, type_: type, dict_: dict):
         self.type = type_
         self.dict = dict_
+        self.getters = tuple((attrgetter(name), field_pattern) for name, field_pattern in dict_.items())
+
+    @staticmethod
+    def of(pattern) -> Dataclass:
+        return Dataclass(type(pattern), {name: getter(pattern) for name, getter in _get_dataclass_fields(type(pattern))})
 
     def descend(self, f):
         dict_ = {}
@@ -247,8 +354,8 @@ def transform(pattern, f):
     def rf(p):
         return transform(p, f)
 
-    if is_dataclass(pattern) and not isinstance(pattern, type):
-        pattern = Dataclass(type(pattern), pattern.__dict__)
+    if _get_dataclass_fields(type(pattern)) is not None:
+        pattern = Dataclass.of(pattern)
 
     if isinstance(pattern, Nested):
         return f(pattern.descend(rf))
@@ -265,6 +372,11 @@ def transform(pattern, f):
 
 
 class Pattern(Capturable, AutoEqHash, AutoRepr):
+    # how often `match()` was given this very pattern, see `compiler.Tiering`
+    __slots__ = ('_uses',)
+
+    _derived_attributes = frozenset({'_uses'})
+
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
         raise NotImplementedError
 
@@ -283,6 +395,7 @@ class Pattern(Capturable, AutoEqHash, AutoRepr):
 
 class StringPattern:
     """Experimental"""
+    __slots__ = ()
 
     def string_match(self, remaining, *, ctx: MatchContext) -> Optional[str]:
         raise NotImplementedError
@@ -290,6 +403,7 @@ class StringPattern:
 
 class String(Pattern, Nested):
     """Experimental"""
+    __slots__ = ('_patterns',)
 
     def __init__(self, *patterns):
         self._patterns = patterns
@@ -328,11 +442,26 @@ class String(Pattern, Nested):
 
 T = TypeVar('T')
 
+# the most recent aggregate of every aggregation used in the current thread (or asyncio task), by a weak reference to
+# the aggregation; the dict is replaced rather than updated, tasks started from here must not see later changes
+_latest_aggregates: contextvars.ContextVar = contextvars.ContextVar('apm latest aggregates')
+
 
 class Aggregation(Generic[T], ABC):
+    """Aggregates the values captured by a pattern (`pattern >> agg.Count('name')`) into a single value.
+
+    An aggregation does not hold the aggregate itself, that one is kept in the `MatchContext` of a match, the same
+    pattern can be used by different threads and tasks at the same time. `value` is the aggregate of the most recent
+    match in the current thread (or asyncio task).
+    """
+    __slots__ = ('_name', '_ref', '__weakref__')
+
     def __init__(self, name: Optional[str] = None):
         self._name = name
-        self._value = NoValue
+        self._ref = weakref.ref(self)
+
+    def __reduce__(self):
+        return type(self), (self._name,)
 
     @property
     def name(self) -> Optional[str]:
@@ -340,9 +469,23 @@ class Aggregation(Generic[T], ABC):
 
     @property
     def value(self):
-        if self._value is NoValue:
+        latest = _latest_aggregates.get(None)
+        value = NoValue if latest is None else latest.get(self._ref, NoValue)
+        if value is NoValue:
             return self.new()
-        return self._value
+        return value
+
+    def _set_latest(self, aggregate: T):
+        ref = self._ref
+        latest = _latest_aggregates.get(None)
+        if latest is None:
+            _latest_aggregates.set({ref: aggregate})
+        elif latest.get(ref, NoValue) is not aggregate:
+            # aggregates updated in place are found in there already
+            if len(latest) >= 16:
+                # drop the entries of aggregations which have been collected
+                latest = {r: a for r, a in latest.items() if r() is not None}
+            _latest_aggregates.set({**latest, ref: aggregate})
 
     @abstractmethod
     def new(self) -> T:
@@ -352,12 +495,36 @@ class Aggregation(Generic[T], ABC):
     def _add(self, aggregate: T, value) -> T:
         raise NotImplementedError
 
+    def _add_many(self, aggregate: T, values: Iterable) -> T:
+        for value in values:
+            aggregate = self._add(aggregate, value)
+        return aggregate
+
     def add(self, aggregate: T, value) -> T:
-        self._value = self._add(aggregate, value)
-        return self._value
+        aggregate = self._add(aggregate, value)
+        self._set_latest(aggregate)
+        return aggregate
+
+    def add_many(self, aggregate: T, values: Iterable) -> T:
+        """Adds all of the given values, like `add` for every single one of them would (but faster)."""
+        aggregate = self._add_many(aggregate, values)
+        self._set_latest(aggregate)
+        return aggregate
+
+    def merge(self, aggregate: T, other: T) -> T:
+        """Combines two aggregates into the one which `aggregate` would be had the values which went into `other` been
+        added to it (in this order), for aggregating parts of the input separately. `aggregate` might be updated in
+        place, `other` is left alone."""
+        raise NotImplementedError(f"{type(self).__name__} does not support merging aggregates")
+
+    def copy(self, aggregate: T) -> T:
+        """A copy of the given aggregate which can be added to without changing the original."""
+        return copy(aggregate)
 
 
 class Capture(Pattern, Nested):
+    __slots__ = ('_pattern', '_name', '_target', '_aggregation')
+
     def __init__(self, pattern, *, name: Hashable, target=None, agg: Optional[Aggregation] = None):
         self._pattern = pattern
         self._name: Hashable = name
@@ -372,8 +539,11 @@ class Capture(Pattern, Nested):
         return ctx.no_match()
 
     def capture(self, value, *, ctx: MatchContext):
+        if self._aggregation is not None and self._target is None:
+            ctx.aggregate(self._name, self._aggregation, value)
+            return
         target = ctx if self._target is None else self._target
-        if self._aggregation:
+        if self._aggregation is not None:
             if self._name not in target:
                 target[self._name] = self._aggregation.new()
             target[self._name] = self._aggregation.add(target[self._name], value)
@@ -389,12 +559,24 @@ class Capture(Pattern, Nested):
         return patterns, pattern
 
     def descend(self, f):
-        return Capture(pattern=f(self._pattern), name=self._name)
+        return Capture(pattern=f(self._pattern), name=self._name, target=self._target, agg=self._aggregation)
 
     @property
     def pattern(self):
         return self._pattern
 
+    @property
+    def name(self) -> Hashable:
+        return self._name
+
+    @property
+    def aggregation(self) -> Optional[Aggregation]:
+        return self._aggregation
+
+    @property
+    def target(self):
+        return self._target
+
 
 class SomePatternCompatibilityArgumentsError(ValueError):
     """
@@ -439,6 +621,7 @@ class Some(Capturable, Nested, AutoEqHash, AutoRepr):
             it will stop looking for matches if it can match the pattern following the Some(). Enabling greediness will
             make it go on as long as the current pattern matches.
     """
+    __slots__ = ('patterns', 'at_least', 'at_most', 'greedy')
 
     def __init__(self, *patterns,
                  pattern=None,  # for backwards compatibility, see docstring of SomePatternCompatibilityArgumentsError
@@ -479,10 +662,12 @@ class Some(Capturable, Nested, AutoEqHash, AutoRepr):
         return True
 
     def descend(self, f):
-        return Some(*(f(p) for p in self.patterns), at_least=self.at_least, at_most=self.at_most)
+        return Some(*(f(p) for p in self.patterns), at_least=self.at_least, at_most=self.at_most, greedy=self.greedy)
 
 
 class Remainder(Nested, AutoEqHash, AutoRepr):
+    __slots__ = ('pattern', 'left')
+
     def __init__(self, pattern):
         self.pattern = pattern
         self.left = NoValue
@@ -494,10 +679,13 @@ class Remainder(Nested, AutoEqHash, AutoRepr):
 
     def __rpow__(self, left):
         self.left = left
+        self._reset_hash()
         return self
 
 
 class Strict(Pattern, Nested):
+    __slots__ = ('_pattern',)
+
     def __init__(self, pattern):
         self._pattern = pattern
 
@@ -507,8 +695,14 @@ class Strict(Pattern, Nested):
     def descend(self, f):
         return Strict(pattern=f(self._pattern))
 
+    @property
+    def pattern(self):
+        return self._pattern
+
 
 class Value(Pattern):
+    __slots__ = ('_value',)
+
     def __init__(self, value):
         self._value = value
 
@@ -518,18 +712,73 @@ class Value(Pattern):
                 return ctx.no_match()
         return ctx.match_if(self._value == value)
 
+    @property
+    def value(self):
+        return self._value
+
 
 class OneOf(Pattern, StringPattern, Nested):
+    __slots__ = ('_patterns', '_dispatch', '_warmup')
+
+    _derived_attributes = frozenset({'_dispatch', '_warmup'})
+
+    # matches of an instance before its jump table is built, most patterns written inline are matched once only
+    dispatch_after = 8
+
     def __init__(self, *patterns):
         self._patterns = patterns
+        self._derive()
+
+    def _derive(self):
+        self._dispatch: Union[None, bool, _Dispatch] = None
+        self._warmup = self.dispatch_after
+
+    def alternatives(self, value) -> Tuple:
+        """The alternatives to try when matching the given value: All of them for the first `dispatch_after` matches,
+        the `candidates` from then on. The counter is not synchronized, a lost update only delays the jump table."""
+        warmup = self._warmup
+        if warmup:
+            self._warmup = warmup - 1
+            return self._patterns
+        return self.candidates(value)
 
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
-        for pattern in self._patterns:
-            result = ctx.match(value, pattern)
+        undecided = None
+        for pattern in self.alternatives(value):
+            try:
+                result = ctx.match(value, pattern)
+            except Undecided as e:
+                # the later alternatives are tried anyway, to start whatever they wait for, too
+                undecided = e
+                continue
+            except Exception:
+                if undecided is None:
+                    raise
+                # it would not be tried at all should an earlier alternative match, it is tried again once they decide
+                continue
             if result:
+                if undecided is not None:
+                    # an earlier alternative might still match, it would take precedence
+                    raise undecided
                 return result
+        if undecided is not None:
+            raise undecided
         return ctx.no_match()
 
+    def candidates(self, value) -> Tuple:
+        """The alternatives which might match the given value, in their original order.
+
+        If enough alternatives are discriminated by the same thing (their literal value, a literal value at the same key
+        of a dict, or their type) a jump table is built on first use, so that alternatives which are known not to match
+        are skipped. Alternatives without the discriminator are always candidates.
+        """
+        dispatch = self._dispatch
+        if dispatch is None:
+            dispatch = self._dispatch = _Dispatch.build(self._patterns) or False
+        if dispatch is False:
+            return self._patterns
+        return dispatch.candidates(value)
+
     def string_match(self, remaining, *, ctx: MatchContext) -> Optional[str]:
         for p in self._patterns:
             result = String.match_pattern(remaining=remaining, pattern=p, ctx=ctx)
@@ -540,23 +789,280 @@ class OneOf(Pattern, StringPattern, Nested):
     def descend(self, f):
         return OneOf(*(f(p) for p in self._patterns))
 
+    @property
+    def patterns(self):
+        return self._patterns
+
+
+_MISSING = object()
+
+
+class _Dispatch:
+    __slots__ = ()
+
+    min_alternatives = 4
+
+    @staticmethod
+    def discriminators(pattern) -> Dict[Tuple, object]:
+        from .patterns import Items, Object  # pylint: disable=import-outside-toplevel,cyclic-import
+
+        def unwrap(p):
+            while isinstance(p, (Capture, Strict)):
+                p = p.pattern
+            if isinstance(p, Value):
+                p = p.value
+            return p
+
+        pattern = unwrap(pattern)
+        if isinstance(pattern, Items):
+            pattern = pattern.items
+        if _is_literal(pattern):
+            return {('self',): pattern}
+        if type(pattern) == dict:
+            result = {}
+            for key, val in pattern.items():
+                val = unwrap(val)
+                if _is_literal(key) and _is_literal(val):
+                    result[('item', key)] = val
+            return result
+        if isinstance(pattern, Object) and type(pattern.type) == type:
+            return {('type',): (False, pattern.type)}
+        if _get_dataclass_fields(type(pattern)) is not None:
+            return {('type',): (True, type(pattern))}
+        return {}
+
+    @staticmethod
+    def build(patterns: Tuple) -> Optional[_Dispatch]:
+        if len(patterns) < _Dispatch.min_alternatives:
+            return None
+        discriminators = [_Dispatch.discriminators(p) for p in patterns]
+        counts: Dict[Tuple, int] = {}
+        for ds in discriminators:
+            for kind in ds:
+                counts[kind] = counts.get(kind, 0) + 1
+        if not counts:
+            return None
+        kind, n = max(counts.items(), key=lambda kv: kv[1])
+        if n < _Dispatch.min_alternatives:
+            return None
+        keys = [ds.get(kind, _MISSING) for ds in discriminators]
+        if kind == ('type',):
+            return _TypeDispatch(patterns, keys)
+        return _LiteralDispatch(patterns, keys, None if kind == ('self',) else kind[1])
+
+    def candidates(self, value) -> Tuple:
+        raise NotImplementedError
+
+
+class _LiteralDispatch(_Dispatch):
+    __slots__ = ('_patterns', '_item_key', '_table', '_default')
+
+    def __init__(self, patterns: Tuple, keys: List, item_key):
+        self._patterns = patterns
+        self._item_key = item_key
+        wildcards = {ix for ix, key in enumerate(keys) if key is _MISSING}
+        indices: Dict[object, set] = {}
+        for ix, key in enumerate(keys):
+            if key is not _MISSING:
+                indices.setdefault(key, set(wildcards)).add(ix)
+        self._table = {key: tuple(patterns[ix] for ix in sorted(ixs)) for key, ixs in indices.items()}
+        self._default = tuple(patterns[ix] for ix in sorted(wildcards))
+
+    def candidates(self, value) -> Tuple:
+        if self._item_key is not None:
+            if type(value) != dict:
+                return self._patterns
+            value = value.get(self._item_key, _MISSING)
+            if value is _MISSING:
+                return self._default
+        if _is_literal(value):
+            return self._table.get(value, self._default)
+        return self._patterns
+
+
+class _TypeDispatch(_Dispatch):
+    __slots__ = ('_patterns', '_keys', '_by_type')
+
+    def __init__(self, patterns: Tuple, keys: List):
+        self._patterns = patterns
+        self._keys = keys
+        self._by_type = WeakTypeCache()
+
+    def _compute(self, type_: type) -> Tuple:
+        is_dataclass_type = _get_dataclass_fields(type_) is not None
+        result = []
+        for pattern, key in zip(self._patterns, self._keys):
+            if key is not _MISSING:
+                is_dataclass_pattern, pattern_type = key
+                # a dataclass pattern is compared using == with a value which is not a dataclass itself
+                if not issubclass(type_, pattern_type) and (is_dataclass_type or not is_dataclass_pattern):
+                    continue
+            result.append(pattern)
+        return tuple(result)
+
+    def candidates(self, value) -> Tuple:
+        type_ = type(value)
+        if value.__class__ is not type_:
+            return self._patterns
+        return self._by_type.get(type_, self._compute)
+
+
+class _AdaptiveOrder:
+    """Measures cost and rejection rate of the conjuncts of an `AllOf` and every `reorder_interval` matches sorts runs
+    of conjuncts which do not record captures such that cheap and selective ones come first. Conjuncts which might
+    capture something stay where they are, and so do the runs in between them, hence the captures recorded are the
+    same in any order. A guard (`InstanceOf`, `SubclassOf`, `Length`) ends its run, the conjuncts after it are never
+    tried before it, as they might not cope with the values it rejects. Should a conjunct raise an exception while the
+    order differs from the given one nonetheless, the match is repeated in the given order. Counters are not
+    synchronized; a lost update when matching from several threads only skews the statistics a little.
+    """
+    __slots__ = ('_patterns', 'calls', 'rejections', 'cost', '_segments', '_declared', 'order', '_countdown')
+
+    reorder_interval = 128
+
+    def __init__(self, patterns: Tuple):
+        # pylint: disable=import-outside-toplevel,cyclic-import
+        from .analysis import records_captures
+        from .patterns import InstanceOf, Length, SubclassOf
+        self._patterns = patterns
+        self.calls = [0] * len(patterns)
+        self.rejections = [0] * len(patterns)
+        self.cost = [0] * len(patterns)
+        self._segments: List[List[int]] = []
+        segment = []
+        for ix, pattern in enumerate(patterns):
+            if records_captures(pattern):
+                self._segments.extend((segment, [ix]))
+                segment = []
+            elif isinstance(pattern, (InstanceOf, Length, SubclassOf)):
+                segment.append(ix)
+                self._segments.append(segment)
+                segment = []
+            else:
+                segment.append(ix)
+        self._segments.append(segment)
+        self._declared = self.order = tuple(range(len(patterns)))
+        self._countdown = self.reorder_interval
+
+    def match(self, value, ctx: MatchContext) -> MatchResult:
+        result = None
+        order = self.order
+        for ix in order:
+            start = perf_counter_ns()
+            try:
+                result = ctx.match(value, self._patterns[ix])
+            except Exception:
+                if order is self._declared:
+                    raise
+                # a conjunct which comes later in the given order might have rejected the value
+                return self._match_declared(value, ctx)
+            self.cost[ix] += perf_counter_ns() - start
+            self.calls[ix] += 1
+            if not result:
+                self.rejections[ix] += 1
+                break
+        else:
+            result = ctx.matches()
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._countdown = self.reorder_interval
+            self.reorder()
+        return result
+
+    def _match_declared(self, value, ctx: MatchContext) -> MatchResult:
+        for pattern in self._patterns:
+            result = ctx.match(value, pattern)
+            if not result:
+                return result
+        return ctx.matches()
+
+    def _rank(self, ix: int) -> Tuple[float, float]:
+        calls, rejections, cost = self.calls[ix], self.rejections[ix], self.cost[ix]
+        if not calls:
+            # not evaluated so far, nothing known about it
+            return math.inf, math.inf
+        # expected cost spent per rejection, ties broken by the average cost
+        return cost / rejections if rejections else math.inf, cost / calls
+
+    def reorder(self):
+        order = []
+        for segment in self._segments:
+            order.extend(sorted(segment, key=self._rank))
+        # halve the statistics so that the order keeps up with changing inputs
+        for ix in range(len(self._patterns)):
+            self.calls[ix] //= 2
+            self.rejections[ix] //= 2
+            self.cost[ix] //= 2
+        order = tuple(order)
+        self.order = self._declared if order == self._declared else order
+
 
 class AllOf(Pattern, Nested):
-    def __init__(self, *patterns):
+    """Matches if all of the given patterns match, trying them in the given order.
+
+    With `adaptive=True` the order is adjusted at runtime: Conjuncts which do not capture anything are reordered based
+    on how expensive and how selective they turned out to be, so that cheap checks which often reject come first.
+    Conjuncts are then expected to be free of side effects, as one which used to run might be skipped, and vice versa.
+    """
+    __slots__ = ('_patterns', '_adaptive', '_order')
+
+    def __init__(self, *patterns, adaptive: bool = False):
         self._patterns = patterns
+        self._adaptive = adaptive
+        self._derive()
+
+    def _derive(self):
+        self._order: Optional[_AdaptiveOrder] = None
+
+    _derived_attributes = frozenset({'_order'})
 
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        if self._adaptive:
+            order = self._order
+            if order is None:
+                order = self._order = _AdaptiveOrder(self._patterns)
+            return order.match(value, ctx)
+        undecided = None
         for pattern in self._patterns:
-            result = ctx.match(value, pattern)
+            try:
+                result = ctx.match(value, pattern)
+            except Undecided as e:
+                # the other patterns are tried anyway, to start whatever they wait for, too - or to fail right away
+                undecided = e
+                continue
+            except Exception:
+                if undecided is None:
+                    raise
+                # an earlier pattern might reject the value it can not cope with, it is tried again once they decide
+                continue
             if not result:
                 return result
+        if undecided is not None:
+            raise undecided
         return ctx.matches()
 
     def descend(self, f):
-        return AllOf(*(f(p) for p in self._patterns))
+        return AllOf(*(f(p) for p in self._patterns), adaptive=self._adaptive)
+
+    @property
+    def patterns(self):
+        return self._patterns
+
+    @property
+    def adaptive(self) -> bool:
+        return self._adaptive
+
+    @property
+    def evaluation_order(self) -> Tuple:
+        """The patterns in the order they are currently tried in."""
+        if self._order is None:
+            return self._patterns
+        return tuple(self._patterns[ix] for ix in self._order.order)
 
 
 class Either(Pattern, Nested):
+    __slots__ = ('_left', '_right')
+
     def __init__(self, left, right):
         self._left = left
         self._right = right
@@ -571,6 +1077,8 @@ class Either(Pattern, Nested):
 
 
 class Not(Pattern, Nested):
+    __slots__ = ('_pattern',)
+
     def __init__(self, pattern):
         self._pattern = pattern
 
@@ -582,6 +1090,75 @@ class Not(Pattern, Nested):
     def descend(self, f):
         return Not(pattern=f(self._pattern))
 
+    @property
+    def pattern(self):
+        return self._pattern
+
+
+class Rec(Pattern, Nested):
+    """A recursive pattern: Every `Ref` of the same name within the given pattern stands for the whole `Rec`, e.g.
+    `Rec('tree', {'value': int, 'children': Each(Ref('tree'))})`. The pattern does not refer to itself, references are
+    resolved while matching, by the innermost `Rec` of the name being matched."""
+    __slots__ = ('_name', '_pattern')
+
+    def __init__(self, name: Hashable, pattern):
+        self._name = name
+        self._pattern = pattern
+
+    def enter(self, ctx: MatchContext):
+        """Makes references to this pattern resolve to it, returns what they resolved to before (for `leave`)."""
+        references = ctx._references
+        if references is None:
+            references = ctx._references = {}
+        previous = references.get(self._name, _MISSING)
+        references[self._name] = self
+        return previous
+
+    def leave(self, ctx: MatchContext, previous):
+        if previous is _MISSING:
+            del ctx._references[self._name]
+        else:
+            ctx._references[self._name] = previous
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        previous = self.enter(ctx)
+        try:
+            return ctx.match(value, self._pattern, strict=strict)
+        finally:
+            self.leave(ctx, previous)
+
+    def descend(self, f):
+        return Rec(name=self._name, pattern=f(self._pattern))
+
+    @property
+    def name(self) -> Hashable:
+        return self._name
+
+    @property
+    def pattern(self):
+        return self._pattern
+
+
+class Ref(Pattern):
+    __slots__ = ('_name',)
+
+    def __init__(self, name: Hashable):
+        self._name = name
+
+    def resolve(self, ctx: MatchContext) -> Rec:
+        references = ctx._references
+        rec = None if references is None else references.get(self._name)
+        if rec is None:
+            raise ValueError(f"Ref({self._name!r}) is matched outside of a Rec({self._name!r}, ...)")
+        return rec
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        return ctx.match(value, self.resolve(ctx).pattern, strict=strict)
+
+    @property
+    def name(self) -> Hashable:
+        return self._name
+
 
 def _is_a(pattern, type_) -> bool:
     if isinstance(pattern, type_):
@@ -675,6 +1252,8 @@ def _match_mapping(value, pattern: Union[dict, Remainder], *, ctx: MatchContext,
 
 @dataclasses.dataclass
 class MatchSomeResult:
+    __slots__ = ('it', 'ctx', 'matches')
+
     it: SeqIterator
     ctx: MatchContext
     matches: List
@@ -761,7 +1340,105 @@ def _match_sequence(value, pattern: Union[tuple, list, Iterable], *, ctx: MatchC
         return ctx.matches()
 
 
+# Matching dispatches on the type of the pattern. Handlers take `(value, pattern, *, ctx, strict)` and return a
+# `MatchResult`, just like `Pattern.match`. The builtin ones apply to exactly the given type, i.e. a subclass of tuple
+# (a namedtuple for instance) is compared using `==`, not matched as a sequence.
+
+def _handle_ellipsis(_value, _pattern, *, ctx: MatchContext, strict: bool) -> MatchResult:
+    return ctx.matches()
+
+
+def _handle_pattern(value, pattern: Pattern, *, ctx: MatchContext, strict: bool) -> MatchResult:
+    return pattern.match(value, ctx=ctx, strict=strict)
+
+
+def _handle_mapping(value, pattern, *, ctx: MatchContext, strict: bool) -> MatchResult:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return ctx._match_dataclass(value, value_fields, pattern, strict=strict)
+    return _match_mapping(value, pattern, ctx=ctx, strict=strict)
+
+
+def _handle_tuple(value, pattern: tuple, *, ctx: MatchContext, strict: bool) -> MatchResult:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return ctx._match_dataclass(value, value_fields, pattern, strict=strict)
+    if not isinstance(value, tuple) or strict and type(value) != tuple:
+        return ctx.no_match()
+    return _match_sequence(value, pattern, ctx=ctx)
+
+
+def _handle_sequence(value, pattern: Union[list, range], *, ctx: MatchContext, strict: bool) -> MatchResult:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return ctx._match_dataclass(value, value_fields, pattern, strict=strict)
+    if strict and type(value) != type(pattern):
+        return ctx.no_match()
+    return _match_sequence(value, pattern, ctx=ctx)
+
+
+def _handle_value(value, pattern, *, ctx: MatchContext, strict: bool) -> MatchResult:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return ctx._match_dataclass(value, value_fields, pattern, strict=strict)
+    if pattern == value:
+        if strict:
+            return ctx.match_if(type(pattern) == type(value))
+        return ctx.matches()
+    return ctx.no_match()
+
+
+PatternHandler = Callable[..., MatchResult]
+
+_builtin_pattern_handlers: Dict[type, PatternHandler] = {
+    type(...): _handle_ellipsis,
+    dict: _handle_mapping,
+    Remainder: _handle_mapping,
+    tuple: _handle_tuple,
+    list: _handle_sequence,
+    range: _handle_sequence,
+}
+_registered_pattern_handlers: Dict[type, PatternHandler] = {}
+# the handler for each type of pattern seen so far, filled in by `_resolve_pattern_handler`
+_pattern_handlers = WeakTypeCache()
+
+
+def _resolve_pattern_handler(type_: type) -> PatternHandler:
+    for t in type_.__mro__:
+        handler = _registered_pattern_handlers.get(t)
+        if handler is not None:
+            return handler
+    handler = _builtin_pattern_handlers.get(type_)
+    if handler is not None:
+        return handler
+    if issubclass(type_, Pattern):
+        return _handle_pattern
+    return _handle_value
+
+
+def register_pattern_type(type_: type, handler: PatternHandler):
+    """Registers how to match against patterns of the given type (and its subclasses, unless they are registered
+    themselves). The handler is invoked as `handler(value, pattern, ctx=ctx, strict=strict)` and has to return a
+    `MatchResult`, just like `Pattern.match` does. It takes precedence over the builtin treatment of dicts, tuples,
+    lists, and instances of `Pattern`, and is given every value, including dataclass instances. Patterns which have
+    been compiled (by `compile_pattern`) before the handler was registered are not affected by it."""
+    from .compiler import memoization, tiering  # pylint: disable=import-outside-toplevel,cyclic-import
+    _registered_pattern_handlers[type_] = handler
+    _pattern_handlers.clear()
+    # compiled forms do not look up handlers, patterns of this type are left to the interpreter once compiled again
+    tiering.clear()
+    memoization.clear()
+
+
+def _has_registered_handler(type_: type) -> bool:
+    """Whether a handler has been registered for the given type of pattern (or one of its base classes)."""
+    registered = _registered_pattern_handlers
+    return bool(registered) and any(t in registered for t in type_.__mro__)
+
+
 class Underscore(Pattern):
+    __slots__ = ()
+
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
         ctx.record(self, value)
         return ctx.matches()
@@ -0,0 +1,200 @@
+"""Outcomes of functions which are not called right away when a pattern is matched, but awaited (`AsyncCheck`) or
+called for many values at once (`BatchCheck`).
+
+A pattern which needs such an outcome asks the `Deferred` of the match for it. If it is not there yet, the function is
+started (or the value is put into the next batch) and `Undecided` is raised. `AllOf`, `Each`, and `OneOf` go on with
+their other patterns anyway, so that everything a match waits for is started at once. Once some outcomes are there,
+the match is repeated (by `amatch` or `match_many`), until it does not depend on outstanding outcomes any more. The
+functions are expected to be pure, each is called once per value and `Deferred`.
+
+Every repetition walks the whole pattern again, looking up the outcomes which are there already. Outcomes which come
+in one at a time thus make the number of repetitions, and the cost of the match, grow with the square of the number of
+outcomes it waits for. `Each` avoids most of this when its pattern does not capture anything: It remembers the items
+which were undecided and the outcomes they waited for (see `Deferred.suspend` and `Deferred.watch`), and matches an
+item again only once one of these is there. Other patterns which wait for many outcomes, like a list of `AsyncCheck`
+patterns or an `Each` with captures, are repeated in full.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .cache import value_key
+from .core import Undecided
+
+
+class _Batched:
+    """The outcome of a function for a value which is called in a batch, it quacks like a finished task once it is."""
+    __slots__ = ('_done', '_result', '_exception')
+
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception: Optional[BaseException] = None
+
+    def done(self) -> bool:
+        return self._done
+
+    def set(self, result, exception: Optional[BaseException]):
+        self._done = True
+        self._result = result
+        self._exception = exception
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class Deferred:
+    """The outcomes of the functions called by one match (or by many matches of a batch), by function and value. Values
+    are told apart like `ResultCache` does, values which are not hashable (dicts, lists, ...) by identity or equality,
+    as such a value might be built anew every time the match is repeated."""
+    __slots__ = ('asynchronous', '_by_key', '_by_id', '_unhashable', '_tasks', '_batches', '_suspended', '_watched')
+
+    def __init__(self, *, asynchronous: bool = False):
+        self.asynchronous = asynchronous
+        self._by_key: Dict[Tuple, Any] = {}
+        # outcomes for unhashable values by identity, the value is kept alive so that its id is not reused
+        self._by_id: Dict[Tuple[Callable, int], Tuple[Any, Any]] = {}
+        self._unhashable: List[Tuple[Callable, Any, Any]] = []
+        self._tasks: List[asyncio.Future] = []
+        # the values waiting to be passed to each batch function
+        self._batches: Dict[Callable, Tuple[List, List[_Batched]]] = {}
+        # the state in which patterns were left undecided, by pattern and value, which are kept alive with it
+        self._suspended: Dict[Tuple[int, int], Tuple[Any, Any, Any]] = {}
+        # the outcomes which were not there when asked for since `watch` was called, if it was
+        self._watched: Optional[List] = None
+
+    def _find(self, f: Callable, value) -> Tuple[Optional[Tuple], Any]:
+        key = value_key(value)
+        if key is None:
+            try:
+                hash(value)
+            except TypeError:
+                return None, self._find_unhashable(f, value)
+            key = type(value), value
+        key = f, key
+        return key, self._by_key.get(key)
+
+    def _find_unhashable(self, f: Callable, value):
+        entry = self._by_id.get((f, id(value)))
+        if entry is not None:
+            return entry[1]
+        for g, other, outcome in self._unhashable:
+            # noinspection PyBroadException
+            try:
+                if g is f and type(other) is type(value) and other == value:
+                    self._by_id[f, id(value)] = value, outcome
+                    return outcome
+            except Exception:
+                pass
+        return None
+
+    def _store(self, key: Optional[Tuple], f: Callable, value, outcome):
+        if key is not None:
+            self._by_key[key] = outcome
+        else:
+            self._by_id[f, id(value)] = value, outcome
+            self._unhashable.append((f, value, outcome))
+
+    def awaited(self, f: Callable[[Any], Awaitable], value):
+        """The result of `await f(value)` (or raises its exception), raises `Undecided` if it is not there yet. Needs
+        a running event loop."""
+        key, outcome = self._find(f, value)
+        if outcome is None:
+            outcome = asyncio.ensure_future(f(value))
+            self._tasks.append(outcome)
+            self._store(key, f, value, outcome)
+        if not outcome.done():
+            if self._watched is not None:
+                self._watched.append(outcome)
+            raise Undecided()
+        return outcome.result()
+
+    def batched(self, f: Callable[[List], Sequence], value):
+        """The result for the value from `f(values)` (or raises its exception), raises `Undecided` if it has not been
+        called for the value yet."""
+        key, outcome = self._find(f, value)
+        if outcome is None:
+            outcome = _Batched()
+            self._store(key, f, value, outcome)
+            values, outcomes = self._batches.setdefault(f, ([], []))
+            values.append(value)
+            outcomes.append(outcome)
+        if not outcome.done():
+            if self._watched is not None:
+                self._watched.append(outcome)
+            raise Undecided()
+        return outcome.result()
+
+    def suspend(self, pattern, value, state):
+        """Keeps the state in which a pattern was left undecided about a value, for when it is matched against the very
+        same value again (see `resumed`)."""
+        self._suspended[id(pattern), id(value)] = pattern, value, state
+
+    def resumed(self, pattern, value):
+        """The state given to `suspend` for the pattern and value, None if there is none."""
+        entry = self._suspended.get((id(pattern), id(value)))
+        if entry is not None and entry[0] is pattern and entry[1] is value:
+            return entry[2]
+        return None
+
+    def watch(self) -> Optional[List]:
+        """Starts collecting the outcomes which are asked for but not there yet. Returns the outcomes collected for an
+        enclosing `watch` so far, which are to be given to `unwatch`."""
+        outer = self._watched
+        self._watched = []
+        return outer
+
+    def unwatch(self, outer: Optional[List]) -> List:
+        """Stops collecting outcomes, returns those collected since the matching `watch` (these count for an enclosing
+        `watch` as well)."""
+        watched = self._watched
+        self._watched = outer
+        if outer is not None:
+            outer.extend(watched)
+        return watched
+
+    def waiting(self, outcomes: List):
+        """Adds outcomes which are waited for to those collected (see `watch`), for a pattern which is undecided without
+        asking for them again."""
+        if self._watched is not None:
+            self._watched.extend(outcomes)
+
+    def flush(self) -> bool:
+        """Calls every batch function once for all of the values waiting for it, returns whether there were any."""
+        batches, self._batches = self._batches, {}
+        for f, (values, outcomes) in batches.items():
+            try:
+                results = f(values)
+                if len(results) != len(values):
+                    raise ValueError(f"{f!r} returned {len(results)} results for {len(values)} values")
+            except Exception as e:  # pylint: disable=broad-except
+                for outcome in outcomes:
+                    outcome.set(None, e)
+            else:
+                for outcome, result in zip(outcomes, results):
+                    outcome.set(result, None)
+        return bool(batches)
+
+    async def wait(self):
+        """Waits for at least one of the running tasks to finish."""
+        pending = [task for task in self._tasks if not task.done()]
+        if not pending:
+            raise RuntimeError("a pattern is undecided but there is nothing to wait for")
+        await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+    async def close(self):
+        """Cancels the tasks which are still running."""
+        cancelled = []
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+                cancelled.append(task)
+            elif not task.cancelled():
+                # the exception of a task which did not matter in the end is not worth a warning
+                task.exception()
+        if cancelled:
+            await asyncio.gather(*cancelled, return_exceptions=True)
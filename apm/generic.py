@@ -1,9 +1,50 @@
 from __future__ import annotations
 
+from typing import Optional, Tuple
+
+from ._util import WeakTypeCache
+
+
+def _compute_layout(type_: type) -> Tuple[Optional[Tuple[str, ...]], frozenset]:
+    derived = set()
+    names = []
+    for cls in reversed(type_.__mro__):
+        derived.update(cls.__dict__.get('_derived_attributes', ()))
+        slots = cls.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        names.extend(slot for slot in slots if slot not in ('__dict__', '__weakref__'))
+    if not issubclass(type_, (AutoEqHash, AutoRepr)):
+        # slots of arbitrary objects are none of our business, only their __dict__ is looked at
+        return None, frozenset(derived)
+    return tuple(name for name in names if name not in derived), frozenset(derived)
+
+
+_layouts = WeakTypeCache()
+_UNSET = object()
+
+
+def _attributes(thing) -> dict:
+    names, derived = _layouts.get(type(thing), _compute_layout)
+    if names is None:
+        attributes = thing.__dict__
+        if derived:
+            return {k: v for k, v in attributes.items() if k not in derived}
+        return attributes
+    attributes = {}
+    for name in names:
+        value = getattr(thing, name, _UNSET)
+        if value is not _UNSET:
+            attributes[name] = value
+    for k, v in getattr(thing, '__dict__', {}).items():
+        if k not in derived:
+            attributes[k] = v
+    return attributes
+
 
 def _elements(thing):
     try:
-        yield from thing.__dict__.values()
+        yield from _attributes(thing).values()
         return
     except AttributeError:
         pass
@@ -30,13 +71,36 @@ def elements(thing):
 
 
 class AutoEqHash:
+    """Equality and hashing based on the attributes of an object, which live in its `__slots__` or its `__dict__`.
+
+    The hash is computed once and kept, objects are expected not to change after construction (an object which does
+    nonetheless has to reset it using `_reset_hash()`).
+    """
+    __slots__ = ('_hash', '__weakref__')
+
+    # names of attributes which are derived from the others (caches, lookup tables), these are not compared or hashed
+    _derived_attributes = frozenset({'_hash'})
 
     def __eq__(self, other):
-        return type(self) == type(other) and self.__dict__ == other.__dict__
+        return type(self) == type(other) and _attributes(self) == _attributes(other)
 
     def __hash__(self):
-        # noinspection PyTypeChecker
-        return hash(tuple(elements(self)))
+        result = getattr(self, '_hash', None)
+        if result is None:
+            # noinspection PyTypeChecker
+            result = self._hash = hash(tuple(elements(self)))
+        return result
+
+    def _derive(self):
+        """Computes the derived attributes (see `_derived_attributes`, other than the hash) from the others. Objects
+        which have been put together without calling `__init__` (see `apm.serialization`) are completed using this.
+        """
+
+    def _reset_hash(self):
+        try:
+            del self._hash
+        except AttributeError:
+            pass
 
 
 def _repr(t):
@@ -59,6 +123,7 @@ def _repr(t):
 
 
 class AutoRepr:
+    __slots__ = ()
 
     def __repr__(self):
-        return f"{type(self).__name__}({_repr(self.__dict__)})"
+        return f"{type(self).__name__}({_repr(_attributes(self))})"
@@ -0,0 +1,466 @@
+from __future__ import annotations
+
+from itertools import count
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from .core import AllOf, Capture, MatchResult, OneOf, Remainder, Strict, Value, _get_dataclass_fields, _is_literal
+from .match import match
+from .patterns import At, Between, InstanceOf, Items, Object
+
+_EQ = 'eq'
+_RANGE = 'range'
+_TYPE = 'type'
+
+_FOUND = 0
+_MISSING = 1
+_UNKNOWN = 2
+
+
+def _conditions(pattern, path: Tuple = ()) -> Iterator[Tuple[Tuple, str, object]]:
+    """Yields `(path, kind, key)` for conditions which are necessary for the pattern to match.
+
+    `kind` is either `'eq'` (the item at `path` must be equal to one of the literals in `key`, a frozenset), `'range'`
+    (the item at `path` must be within the interval `key`, a tuple as used by `IntervalIndex`), or `'type'` (the item
+    at `path` must be an instance of `key`, a type). Only what can be proven necessary is yielded, anything else is
+    left to the actual match.
+    """
+    while isinstance(pattern, (Capture, Strict)):
+        pattern = pattern.pattern
+    if _is_literal(pattern):
+        yield path, _EQ, frozenset((pattern,))
+    elif isinstance(pattern, Value) and _is_literal(pattern.value):
+        yield path, _EQ, frozenset((pattern.value,))
+    elif type(pattern) in (dict, Remainder, Items):
+        if isinstance(pattern, Remainder):
+            if not isinstance(pattern.left, dict):
+                return
+            pattern = pattern.left
+        elif isinstance(pattern, Items):
+            pattern = pattern.items
+        for key, val in pattern.items():
+            if _is_literal(key):
+                yield from _conditions(val, path + (key,))
+    elif isinstance(pattern, At):
+        yield from _conditions(pattern.pattern, path + tuple(pattern.path))
+    elif isinstance(pattern, AllOf):
+        for p in pattern.patterns:
+            yield from _conditions(p, path)
+    elif isinstance(pattern, OneOf):
+        literals = []
+        for p in pattern.patterns:
+            if isinstance(p, Value):
+                p = p.value
+            if not _is_literal(p):
+                return
+            literals.append(p)
+        if literals:
+            yield path, _EQ, frozenset(literals)
+    elif isinstance(pattern, Between):
+        key = _interval(pattern)
+        try:
+            hash(key)
+        except TypeError:
+            return
+        yield path, _RANGE, key
+    elif isinstance(pattern, InstanceOf):
+        if len(pattern.types) == 1:
+            yield path, _TYPE, pattern.types[0]
+    elif isinstance(pattern, Object):
+        yield path, _TYPE, pattern.type
+    elif _get_dataclass_fields(type(pattern)) is not None:
+        yield path, _TYPE, type(pattern)
+
+
+def _resolve(value, path: Tuple):
+    for key in path:
+        if type(value) is dict:
+            try:
+                value = value[key]
+            except KeyError:
+                return _MISSING, None
+        elif _get_dataclass_fields(type(value)) is not None:
+            # neither a dict pattern nor At() is able to look into a dataclass
+            return _MISSING, None
+        else:
+            return _UNKNOWN, None
+    return _FOUND, value
+
+
+def _interval(between: Between) -> Tuple:
+    return between.lower, between.upper, between.lower_bound_exclusive, between.upper_bound_exclusive
+
+
+class _Interval:
+    __slots__ = ('key', 'seq', 'lower', 'upper', 'lower_exclusive', 'upper_exclusive')
+
+    def __init__(self, key: Hashable, seq: int, lower, upper, lower_exclusive: bool, upper_exclusive: bool):
+        self.key = key
+        self.seq = seq
+        self.lower = lower
+        self.upper = upper
+        self.lower_exclusive = lower_exclusive
+        self.upper_exclusive = upper_exclusive
+
+    def above_lower(self, value) -> bool:
+        return value > self.lower if self.lower_exclusive else value >= self.lower
+
+    def below_upper(self, value) -> bool:
+        return value < self.upper if self.upper_exclusive else value <= self.upper
+
+    def contains(self, value) -> bool:
+        """Whether the value lies within the bounds, False if it can not be compared with them."""
+        try:
+            return self.above_lower(value) and self.below_upper(value)
+        except TypeError:
+            return False
+
+
+class _Center:
+    """A node of a centered interval tree: It holds all intervals which contain `center`, sorted by their lower bound
+    (ascending) and by their upper bound (descending). Intervals entirely below (above) `center` go to the left (right).
+    """
+    __slots__ = ('center', 'by_lower', 'by_upper', 'left', 'right', 'flat')
+
+    def __init__(self, intervals: List[_Interval]):
+        bounds = sorted(b for iv in intervals for b in (iv.lower, iv.upper))
+        center = self.center = bounds[len(bounds) // 2]
+        here, left, right = [], [], []
+        for iv in intervals:
+            if not iv.below_upper(center):
+                left.append(iv)
+            elif not iv.above_lower(center):
+                right.append(iv)
+            else:
+                here.append(iv)
+        self.flat = None
+        if not here and (not left or not right):
+            # no progress possible with this center (e.g. open intervals sharing a bound), scan these linearly
+            self.flat = intervals
+            self.left = self.right = None
+            return
+        # inclusive bounds go first so that the matching intervals always form a prefix
+        self.by_lower = sorted(here, key=lambda iv: (iv.lower, iv.lower_exclusive))
+        self.by_upper = sorted(here, key=lambda iv: (iv.upper, not iv.upper_exclusive), reverse=True)
+        self.left = _Center(left) if left else None
+        self.right = _Center(right) if right else None
+
+    def stab(self, value, into: List[_Interval]):
+        node = self
+        while node is not None:
+            if node.flat is not None:
+                into.extend(iv for iv in node.flat if iv.above_lower(value) and iv.below_upper(value))
+                return
+            if value < node.center:
+                for iv in node.by_lower:
+                    if not iv.above_lower(value):
+                        break
+                    into.append(iv)
+                node = node.left
+            elif value > node.center:
+                for iv in node.by_upper:
+                    if not iv.below_upper(value):
+                        break
+                    into.append(iv)
+                node = node.right
+            else:
+                into.extend(node.by_lower)
+                return
+
+
+class IntervalIndex:
+    """Finds all intervals which contain a given value in O(log n + k).
+
+    Intervals are given as `Between` patterns (or as their bounds) and honor `lower_bound_exclusive` and
+    `upper_bound_exclusive`. Any ordered type works (numbers, strings, dates, ...), as long as all bounds and the values
+    looked up are comparable with each other, just like with `Between`. The index is a centered interval tree which is
+    rebuilt lazily with the first lookup after it has been modified. Should the bounds not be comparable with each
+    other, the intervals are scanned linearly instead (until the index is modified again), skipping those which the
+    value looked up can not be compared with.
+
+    Example:
+        >>> prices = IntervalIndex()
+        >>> prices.add('cheap', Between(0, 10, upper_bound_exclusive=True))
+        >>> prices.add('regular', Between(10, 100))
+        >>> prices.stab(10)
+        ['regular']
+    """
+
+    def __init__(self):
+        self._intervals: Dict[Hashable, _Interval] = {}
+        self._seq = count()
+        self._root: Optional[_Center] = None
+        # all of the intervals, instead of the tree, if their bounds can not be compared with each other
+        self._mixed: Optional[List[_Interval]] = None
+        self._dirty = False
+
+    def add(self, key: Hashable, between: Optional[Between] = None, *,
+            lower=None, upper=None, lower_bound_exclusive: bool = False, upper_bound_exclusive: bool = False):
+        if between is not None:
+            lower, upper, lower_bound_exclusive, upper_bound_exclusive = _interval(between)
+        self._intervals.pop(key, None)
+        self._intervals[key] = _Interval(key, next(self._seq), lower, upper,
+                                         lower_bound_exclusive, upper_bound_exclusive)
+        self._dirty = True
+
+    def remove(self, key: Hashable):
+        del self._intervals[key]
+        # the tree refers to the interval, it is rebuilt anyway
+        self._root = None
+        self._dirty = True
+
+    def stab(self, value) -> List[Hashable]:
+        """The keys of all intervals containing `value`, in the order they were added."""
+        if self._dirty:
+            intervals = list(self._intervals.values())
+            self._mixed = None
+            try:
+                self._root = _Center(intervals) if intervals else None
+            except TypeError:
+                self._root, self._mixed = None, intervals
+            self._dirty = False
+        if self._mixed is not None:
+            found = [iv for iv in self._mixed if iv.contains(value)]
+        elif self._root is None:
+            return []
+        else:
+            found = []
+            self._root.stab(value, found)
+        found.sort(key=lambda iv: iv.seq)
+        return [iv.key for iv in found]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._intervals
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __iter__(self):
+        return iter(self._intervals)
+
+
+class _Entry:
+    __slots__ = ('id', 'seq', 'pattern', 'leaves')
+
+    def __init__(self, id_: Hashable, seq: int, pattern):
+        self.id = id_
+        self.seq = seq
+        self.pattern = pattern
+        self.leaves: List[_Node] = []
+
+
+class _Node:
+    __slots__ = ('entries', 'path', 'literals', 'ranges', 'intervals', 'types', 'other', 'parent', 'branch')
+
+    def __init__(self, parent: Optional[_Node] = None, branch: Tuple = ()):
+        # the node this one hangs off, and where: `('literals', literal)`, `('ranges', key)`, `('types', type)`, or
+        # `('other',)`, so that a node which runs empty can be taken off again
+        self.parent = parent
+        self.branch = branch
+        # entry -> conditions which have not been used for discrimination yet
+        self.entries: Optional[Dict[_Entry, List[Tuple]]] = {}
+        self.path: Optional[Tuple] = None
+        self.literals: Dict[object, _Node] = {}
+        self.ranges: Dict[Tuple, _Node] = {}
+        self.intervals: Optional[IntervalIndex] = None
+        self.types: Dict[type, _Node] = {}
+        self.other: Optional[_Node] = None
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.entries is not None
+
+    def insert(self, entry: _Entry, conditions: List[Tuple], leaf_size: int):
+        if self.is_leaf:
+            self.entries[entry] = conditions
+            entry.leaves.append(self)
+            size = len(self.entries)
+            if size > leaf_size and (size - leaf_size - 1) % leaf_size == 0:
+                self._split(leaf_size)
+            return
+        path = self.path
+        eq = rng = typ = None
+        for condition in conditions:
+            if condition[0] == path:
+                if condition[1] == _EQ:
+                    eq = condition
+                elif condition[1] == _RANGE:
+                    rng = condition
+                elif typ is None:
+                    typ = condition
+        chosen = eq or rng or typ
+        if chosen is None:
+            self.other.insert(entry, conditions, leaf_size)
+            return
+        remaining = [c for c in conditions if c is not chosen]
+        _path, kind, key = chosen
+        if kind == _EQ:
+            for literal in key:
+                child = self.literals.get(literal)
+                if child is None:
+                    child = self.literals[literal] = _Node(self, ('literals', literal))
+                child.insert(entry, remaining, leaf_size)
+        elif kind == _RANGE:
+            child = self.ranges.get(key)
+            if child is None:
+                child = self.ranges[key] = _Node(self, ('ranges', key))
+                if self.intervals is None:
+                    self.intervals = IntervalIndex()
+                lower, upper, lower_bound_exclusive, upper_bound_exclusive = key
+                self.intervals.add(key, lower=lower, upper=upper, lower_bound_exclusive=lower_bound_exclusive,
+                                   upper_bound_exclusive=upper_bound_exclusive)
+            child.insert(entry, remaining, leaf_size)
+        else:
+            child = self.types.get(key)
+            if child is None:
+                child = self.types[key] = _Node(self, ('types', key))
+            child.insert(entry, remaining, leaf_size)
+
+    def _split(self, leaf_size: int):
+        counts: Dict[Tuple, int] = {}
+        for conditions in self.entries.values():
+            for path in {c[0] for c in conditions}:
+                counts[path] = counts.get(path, 0) + 1
+        if not counts:
+            return
+        path, n = max(counts.items(), key=lambda kv: kv[1])
+        if n < 2:
+            return
+        entries = self.entries
+        self.entries = None
+        self.path = path
+        self.other = _Node(self, ('other',))
+        for entry, conditions in entries.items():
+            entry.leaves.remove(self)
+            self.insert(entry, conditions, leaf_size)
+
+    def remove(self, entry: _Entry):
+        del self.entries[entry]
+        # take off the leaves which ran empty, and the inner nodes which are left without any entries below them
+        node = self
+        while not node.entries and node.parent is not None:
+            parent = node.parent
+            parent._detach(node)
+            if parent.literals or parent.ranges or parent.types or not parent.other.is_leaf or parent.other.entries:
+                return
+            parent.entries = {}
+            parent.path = None
+            parent.other = None
+            node = parent
+
+    def _detach(self, child: _Node):
+        kind = child.branch[0]
+        if kind == 'literals':
+            del self.literals[child.branch[1]]
+        elif kind == 'ranges':
+            del self.ranges[child.branch[1]]
+            self.intervals.remove(child.branch[1])
+            if not self.ranges:
+                self.intervals = None
+        elif kind == 'types':
+            del self.types[child.branch[1]]
+
+    def collect(self, value, resolved: Dict[Tuple, Tuple], into: Set[_Entry]):
+        if self.is_leaf:
+            into.update(self.entries)
+            return
+        path = self.path
+        try:
+            status, item = resolved[path]
+        except KeyError:
+            status, item = resolved[path] = _resolve(value, path)
+        self.other.collect(value, resolved, into)
+        if status == _MISSING:
+            return
+        if status == _UNKNOWN:
+            for children in (self.literals, self.ranges, self.types):
+                for child in children.values():
+                    child.collect(value, resolved, into)
+            return
+        if _is_literal(item):
+            child = self.literals.get(item)
+            if child is not None:
+                child.collect(value, resolved, into)
+        else:
+            for child in self.literals.values():
+                child.collect(value, resolved, into)
+        if self.ranges:
+            try:
+                keys = self.intervals.stab(item)
+            except TypeError:
+                # not comparable with the bounds, let the actual match decide
+                keys = self.ranges
+            for key in keys:
+                self.ranges[key].collect(value, resolved, into)
+        for type_, child in self.types.items():
+            if isinstance(item, type_):
+                child.collect(value, resolved, into)
+
+
+class PatternIndex:
+    """Matches a single value against many patterns at once.
+
+    Patterns are organized in a discrimination tree: Every inner node looks at the item at some path (a sequence of
+    dict keys) and branches on its literal value or type, using conditions which are necessary for the patterns below
+    that branch to match (literal values, `OneOf` literals, `Between`, `InstanceOf`, `Object`, dataclasses). A lookup only
+    performs the actual `match()` for the patterns in the leaves it reaches. Literals are only used as discriminators
+    if they are of a builtin scalar type (or an `Enum`), whose equality is consistent with their hash.
+
+    Example:
+        >>> index = PatternIndex()
+        >>> index.add('login', {'type': 'login', 'user': 'user' @ InstanceOf(str)})
+        >>> index.add('logout', {'type': 'logout'})
+        >>> index.lookup({'type': 'login', 'user': 'jane'})
+        {'login': MatchResult(matches=True, groups={'user': 'jane'})}
+
+    Args:
+        leaf_size (int): The number of patterns a leaf may hold before it is split. Default: 8.
+    """
+
+    def __init__(self, *, leaf_size: int = 8):
+        self._leaf_size = leaf_size
+        self._root = _Node()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._seq = count()
+
+    def add(self, pattern_id: Hashable, pattern):
+        if pattern_id in self._entries:
+            self.remove(pattern_id)
+        entry = _Entry(pattern_id, next(self._seq), pattern)
+        self._entries[pattern_id] = entry
+        self._root.insert(entry, list(_conditions(pattern)), self._leaf_size)
+
+    def remove(self, pattern_id: Hashable):
+        entry = self._entries.pop(pattern_id)
+        for leaf in entry.leaves:
+            leaf.remove(entry)
+        entry.leaves.clear()
+
+    def candidates(self, value) -> List[Hashable]:
+        """The ids of the patterns which might match the given value, in the order they were added."""
+        found: Set[_Entry] = set()
+        self._root.collect(value, {}, found)
+        return [entry.id for entry in sorted(found, key=lambda e: e.seq)]
+
+    def lookup(self, value, **kwargs) -> Dict[Hashable, MatchResult]:
+        """Returns the ids of all patterns which match the given value along with their `MatchResult`, in the order
+        the patterns were added. Keyword arguments are passed on to `match()`."""
+        found: Set[_Entry] = set()
+        self._root.collect(value, {}, found)
+        results = {}
+        for entry in sorted(found, key=lambda e: e.seq):
+            result = match(value, entry.pattern, **kwargs)
+            if result:
+                results[entry.id] = result
+        return results
+
+    def __getitem__(self, pattern_id: Hashable):
+        return self._entries[pattern_id].pattern
+
+    def __contains__(self, pattern_id: Hashable) -> bool:
+        return pattern_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
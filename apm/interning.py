@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import threading
+import weakref
+from typing import Dict
+
+from .core import Capture, Remainder, Some, Underscore, _SCALARS, transform
+from .generic import AutoEqHash, _attributes
+
+# attributes which are not patterns but objects that are written to
+_BY_IDENTITY = {Capture: frozenset({'_target'})}
+
+
+def _key(pattern, seen: Dict[int, object]):
+    """A structural key for the given pattern. Two patterns with the same key behave exactly alike.
+
+    This is stricter than `==`: `1`, `1.0`, and `True` are told apart (they differ in strict matches), wildcards
+    (`_`) are only ever the same as themselves (matches are recorded by identity), and so is anything which is not
+    a pattern, a dict, a list, a tuple, or a scalar (functions, types, aggregations, targets of captures, ...).
+    """
+    t = type(pattern)
+    if t in _SCALARS:
+        return t, pattern
+    key = seen.get(id(pattern))
+    if key is not None:
+        return key
+    if isinstance(pattern, Underscore):
+        key = 'id', id(pattern)
+    elif isinstance(pattern, AutoEqHash):
+        key = t, tuple((name, ('id', id(value)) if name in _BY_IDENTITY.get(t, ()) else _key(value, seen))
+                       for name, value in _attributes(pattern).items())
+    elif t == dict:
+        key = t, tuple((_key(k, seen), _key(v, seen)) for k, v in pattern.items())
+    elif t in (list, tuple):
+        key = t, tuple(_key(item, seen) for item in pattern)
+    else:
+        key = 'id', id(pattern)
+    seen[id(pattern)] = key
+    return key
+
+
+class InternTable:
+    """Maps structurally equal patterns to one shared instance.
+
+    Only patterns (instances of `Pattern`, `Some`, and `Remainder`) are shared; dicts, lists, and tuples can not be
+    referenced weakly and are rebuilt around their interned contents. Entries are held weakly, a pattern which is not
+    used anymore is dropped from the table.
+    """
+
+    def __init__(self):
+        self._table: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def _canonical(self, pattern):
+        if not isinstance(pattern, (AutoEqHash, Some, Remainder)):
+            return pattern
+        # the key refers to objects by id (wildcards, functions, ...): these are kept alive by the interned
+        # pattern, the entry is gone before any of them could be collected and their id reused
+        key = _key(pattern, {})
+        with self._lock:
+            canonical = self._table.get(key)
+            if canonical is None:
+                self._table[key] = canonical = pattern
+        return canonical
+
+    def intern(self, pattern):
+        """Returns a pattern equivalent to the given one, sharing all sub-patterns seen before."""
+        return transform(pattern, self._canonical)
+
+    def clear(self):
+        with self._lock:
+            self._table.clear()
+
+    def __len__(self):
+        return len(self._table)
+
+
+_default_table = InternTable()
+
+
+def intern_pattern(pattern):
+    """Interns the given pattern (and all its sub-patterns) in the default `InternTable`."""
+    return _default_table.intern(pattern)
@@ -0,0 +1,360 @@
+"""Matching on an explicit stack rather than the call stack, for values which are nested deeper than the interpreter
+could go (comment threads, syntax trees, ...), using `match(value, pattern, iterative=True)`.
+
+The interpreter (`MatchContext.match`) descends into a nested value by calling itself, a few frames per level, and runs
+into a `RecursionError` some hundred levels down. Here every pattern which contains other patterns is matched by a
+generator (a step) which yields the value and the pattern it needs matched next and is sent whether they matched. The
+steps waiting for an outcome are kept in a list, so the depth is limited by memory only. This is done for dicts,
+dataclasses, lists and tuples (unless they contain `Some`), `AllOf` (unless adaptive), `OneOf`, `Not`, `Either`,
+`Strict`, `Capture`, `Each`, `EachItem`, `Rec`, and `Ref`. Any other pattern is handed to the interpreter, along with
+everything nested inside of it. The outcome, the captures, and the wildcard matches are exactly the same as with the
+interpreter.
+"""
+
+from __future__ import annotations
+
+from types import GeneratorType
+from typing import Callable, Dict, Generator, List, Optional, Tuple, Union
+
+from .core import AllOf, Capture, Either, MatchContext, MatchResult, Not, OneOf, Pattern, Rec, Ref, Remainder, Some, \
+    Strict, Underscore, _dataclass_pattern_fields, _get_dataclass_fields, _handle_ellipsis, _handle_mapping, \
+    _handle_pattern, _handle_sequence, _handle_tuple, _handle_value, _is_a, _pattern_handlers, _resolve_pattern_handler
+from .no_value import NoValue
+from .patterns import Each, EachItem
+
+# A step yields `(value, pattern, strict)` for every sub-match, is sent whether it matched, and returns whether the
+# pattern of the step matched. Patterns which are quicker matched than put on the stack give their outcome right away,
+# patterns left to the interpreter give its `MatchResult`.
+Step = Generator[Tuple[object, object, bool], bool, bool]
+Outcome = Union[bool, Step, MatchResult]
+
+# `(value, pattern, parent)` for every step on the stack, the path to a failure is kept for `MatchResult.explain()`
+Path = Optional[Tuple[object, object, 'Path']]
+
+_END = object()
+
+
+def _interpreted(value, pattern, ctx: MatchContext, strict: bool) -> MatchResult:
+    return ctx.match(value, pattern, strict=strict)
+
+
+def _dataclass(value, value_fields, pattern, ctx: MatchContext, strict: bool) -> Step:
+    fields = _dataclass_pattern_fields(pattern)
+    if fields is None:
+        return False
+    pattern_type, getters = fields
+    if not issubclass(type(value), pattern_type):
+        return False
+    for getter, field_pattern in getters:
+        try:
+            field_value = getter(value)
+        except AttributeError:
+            return False
+        if not (yield field_value, field_pattern, False):
+            return False
+    return not (strict and len(value_fields) > len(getters))
+
+
+def _mapping(value, pattern: Union[dict, Remainder], ctx: MatchContext, strict: bool) -> Step:
+    # the same as `core._match_mapping`
+    remainder = NoValue
+    if isinstance(pattern, Remainder):
+        remainder = pattern
+        pattern = pattern.left
+    to_be_matched = {}
+    matched = set()
+    try:
+        items = value.items()
+    except (AttributeError, TypeError):
+        return False
+    for key, val in items:
+        to_be_matched[key] = val
+    patterns = []
+    for key, val_pattern in pattern.items():
+        if isinstance(key, Pattern):
+            patterns.append((key, val_pattern))
+            continue
+        try:
+            val = to_be_matched[key]
+        except KeyError:
+            return False
+        if not (yield val, val_pattern, False):
+            return False
+        matched.add(key)
+        del to_be_matched[key]
+    possibly_mismatching_keys = set()
+    for key_pattern, val_pattern in patterns:
+        keys_to_remove = []
+        if _is_a(key_pattern, Underscore):
+            matches = False
+            for key, val in to_be_matched.items():
+                if (yield key, key_pattern, False):
+                    if (yield val, val_pattern, False):
+                        matches = True
+                        keys_to_remove.append(key)
+                        possibly_mismatching_keys.discard(key)
+                        break
+            if not matches:
+                return False
+        else:
+            for key, val in to_be_matched.items():
+                if (yield key, key_pattern, False):
+                    if (yield val, val_pattern, False):
+                        keys_to_remove.append(key)
+                        possibly_mismatching_keys.discard(key)
+                    else:
+                        possibly_mismatching_keys.add(key)
+        for key in keys_to_remove:
+            matched.add(key)
+            del to_be_matched[key]
+    if possibly_mismatching_keys or (strict and to_be_matched):
+        return False
+    if remainder is not NoValue:
+        remaining = {k: v for k, v in items if k not in matched}
+        if not (yield remaining, remainder.pattern, strict):
+            return False
+    return True
+
+
+def _items(value, pattern: Union[tuple, list, range], ctx: MatchContext, strict: bool) -> Step:
+    # the same as `core._match_sequence` for a sequence without `Some`
+    try:
+        it = iter(value)
+    except TypeError:
+        return False
+    for item_pattern in pattern:
+        item = next(it, _END)
+        if item is _END:
+            return False
+        if not (yield item, item_pattern, False):
+            return False
+    return next(it, _END) is _END
+
+
+def _handle_value_step(value, pattern, ctx: MatchContext, strict: bool) -> Outcome:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return _dataclass(value, value_fields, pattern, ctx, strict)
+    if pattern == value:
+        return not strict or type(pattern) == type(value)
+    return False
+
+
+def _handle_mapping_step(value, pattern, ctx: MatchContext, strict: bool) -> Outcome:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return _dataclass(value, value_fields, pattern, ctx, strict)
+    return _mapping(value, pattern, ctx, strict)
+
+
+def _handle_tuple_step(value, pattern: tuple, ctx: MatchContext, strict: bool) -> Outcome:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return _dataclass(value, value_fields, pattern, ctx, strict)
+    if not isinstance(value, tuple) or strict and type(value) != tuple:
+        return False
+    if any(_is_a(p, Some) for p in pattern):
+        return _interpreted(value, pattern, ctx, strict)
+    return _items(value, pattern, ctx, strict)
+
+
+def _handle_sequence_step(value, pattern: Union[list, range], ctx: MatchContext, strict: bool) -> Outcome:
+    value_fields = _get_dataclass_fields(type(value))
+    if value_fields is not None:
+        return _dataclass(value, value_fields, pattern, ctx, strict)
+    if strict and type(value) != type(pattern):
+        return False
+    if any(_is_a(p, Some) for p in pattern):
+        return _interpreted(value, pattern, ctx, strict)
+    return _items(value, pattern, ctx, strict)
+
+
+def _capture(value, pattern: Capture, ctx: MatchContext, strict: bool) -> Step:
+    if (yield value, pattern.pattern, strict):
+        pattern.capture(value, ctx=ctx)
+        return True
+    return False
+
+
+def _conjunction(value, patterns: Tuple) -> Step:
+    for pattern in patterns:
+        if not (yield value, pattern, False):
+            return False
+    return True
+
+
+def _all_of(value, pattern: AllOf, ctx: MatchContext, strict: bool) -> Outcome:
+    if pattern.adaptive:
+        return _interpreted(value, pattern, ctx, strict)
+    return _conjunction(value, pattern.patterns)
+
+
+def _one_of(value, pattern: OneOf, ctx: MatchContext, strict: bool) -> Step:
+    for alternative in pattern.alternatives(value):
+        if (yield value, alternative, False):
+            return True
+    return False
+
+
+def _not(value, pattern: Not, ctx: MatchContext, strict: bool) -> Step:
+    return not (yield value, pattern.pattern, False)
+
+
+def _either(value, pattern: Either, ctx: MatchContext, strict: bool) -> Step:
+    # noinspection PyProtectedMember
+    left = yield value, pattern._left, strict
+    # noinspection PyProtectedMember
+    right = yield value, pattern._right, strict
+    return left != right
+
+
+def _strict(value, pattern: Strict, ctx: MatchContext, strict: bool) -> Step:
+    return (yield value, pattern.pattern, True)
+
+
+def _each(value, pattern: Each, ctx: MatchContext, strict: bool) -> Step:
+    try:
+        it = iter(value)
+    except TypeError:
+        return False
+    count = 0
+    # noinspection PyProtectedMember
+    item_pattern = pattern._pattern
+    for item in it:
+        if not (yield item, item_pattern, False):
+            return False
+        count += 1
+    # noinspection PyProtectedMember
+    return count >= pattern._at_least
+
+
+def _each_item(value, pattern: EachItem, ctx: MatchContext, strict: bool) -> Step:
+    try:
+        items = value.items()
+    except AttributeError:
+        return False
+    # noinspection PyProtectedMember
+    key_pattern, value_pattern = pattern._key_pattern, pattern._value_pattern
+    for k, v in items:
+        if not (yield k, key_pattern, False):
+            return False
+        if not (yield v, value_pattern, False):
+            return False
+    return True
+
+
+def _rec(value, pattern: Rec, ctx: MatchContext, strict: bool) -> Step:
+    previous = pattern.enter(ctx)
+    try:
+        return (yield value, pattern.pattern, strict)
+    finally:
+        pattern.leave(ctx, previous)
+
+
+def _ref(value, pattern: Ref, ctx: MatchContext, strict: bool) -> Step:
+    return (yield value, pattern.resolve(ctx).pattern, strict)
+
+
+def _underscore(value, pattern: Underscore, ctx: MatchContext, strict: bool) -> bool:
+    ctx.record(pattern, value)
+    return True
+
+
+StepFactory = Callable[..., Outcome]
+
+_HANDLER_STEPS: Dict[Callable, StepFactory] = {
+    _handle_value: _handle_value_step,
+    _handle_mapping: _handle_mapping_step,
+    _handle_tuple: _handle_tuple_step,
+    _handle_sequence: _handle_sequence_step,
+}
+
+# only for exactly these types, a subclass might match differently
+_PATTERN_STEPS: Dict[type, StepFactory] = {
+    AllOf: _all_of,
+    Capture: _capture,
+    Each: _each,
+    EachItem: _each_item,
+    Either: _either,
+    Not: _not,
+    OneOf: _one_of,
+    Rec: _rec,
+    Ref: _ref,
+    Strict: _strict,
+    Underscore: _underscore,
+}
+
+
+def _step(value, pattern, ctx: MatchContext, strict: bool) -> Outcome:
+    handler = _pattern_handlers.get(type(pattern), _resolve_pattern_handler)
+    if handler is _handle_pattern:
+        factory = _PATTERN_STEPS.get(type(pattern))
+    elif handler is _handle_ellipsis:
+        return True
+    else:
+        factory = _HANDLER_STEPS.get(handler)
+    if factory is None:
+        return _interpreted(value, pattern, ctx, strict)
+    return factory(value, pattern, ctx, strict)
+
+
+def _run(value, pattern, ctx: MatchContext, strict: bool) -> Tuple[bool, Path, List[Tuple]]:
+    """Returns whether the value matches, and where the match failed: the path to the step which failed (or which
+    handed the value to the interpreter) and the match stack of the interpreter from there."""
+    context_strict = ctx.properties.strict
+    steps: List[Tuple[Step, Path]] = []
+    path: Path = None
+    failure: Tuple[Path, List[Tuple]] = (None, [])
+    request = (value, pattern, strict)
+    outcome = None
+    try:
+        while True:
+            if request is not None:
+                value, pattern, strict = request
+                step = _step(value, pattern, ctx, strict or context_strict)
+                if step is True:
+                    outcome = True
+                elif step is False:
+                    outcome = False
+                    failure = (value, pattern, path), []
+                elif type(step) is GeneratorType:
+                    steps.append((step, path))
+                    path = (value, pattern, path)
+                    outcome = None
+                else:
+                    outcome = bool(step)
+                    if not outcome:
+                        failure = path, step._match_stack
+            if not steps:
+                return outcome, failure[0], failure[1]
+            step, parent = steps[-1]
+            try:
+                request = step.send(outcome)
+            except StopIteration as stop:
+                steps.pop()
+                if not stop.value and outcome is not False:
+                    # failed for reasons of its own, not because of the sub-match it tried last
+                    failure = path, []
+                outcome = stop.value
+                path = parent
+                request = None
+    except BaseException:
+        # leave the scopes of `Rec` innermost first
+        for step, _parent in reversed(steps):
+            step.close()
+        raise
+
+
+def match_iteratively(value, pattern, *, ctx: MatchContext, strict: bool = False) -> MatchResult:
+    """Matches the given value in the given context like `ctx.match(value, pattern, strict=strict)`, but without
+    descending the call stack (see `apm.iterative`)."""
+    matches, path, tail = _run(value, pattern, ctx, strict)
+    if matches:
+        return ctx.matches()
+    match_stack = []
+    while path is not None:
+        match_stack.append(path[:2])
+        path = path[2]
+    match_stack.reverse()
+    match_stack.extend(tail)
+    return MatchResult(matches=False, context=ctx, match_stack=match_stack)
@@ -5,9 +5,11 @@ from itertools import chain
 from typing import Union, Any, Optional
 
 from ._util import call
+from .compiler import memoization, tiering
 from .core import MatchResult, MatchContext, transform, _, Underscore, Capture, apply
 from .error import MatchError
 from .guarded import Guarded, NoGuardSucceeded
+from .iterative import match_iteratively
 from .no_value import NoValue
 from .patterns import InstanceOf, Regex
 from .try_match import TryMatch
@@ -28,7 +30,9 @@ def _autopattern(pattern):
 def match(value, pattern=NoValue, *extra,
           multimatch: bool = False,
           strict: bool = False,
-          captureall: Optional[dict] = None) -> Union[MatchResult, Any]:
+          captureall: Optional[dict] = None,
+          memoize: bool = False,
+          iterative: bool = False) -> Union[MatchResult, Any]:
     """Matches the given value. Three different call styles are possible:
 
     (1) match(value, pattern, **kwargs)
@@ -61,6 +65,10 @@ def match(value, pattern=NoValue, *extra,
     :param multimatch: Whether to capture multiple matches per capture or keep the latest only (defaults to False).
     :param strict: Whether to perform strict matches (defaults to False).
     :param captureall: Capture all patterns into the given dictionary
+    :param memoize: Remember the outcome per value, for values like scalars, tuples, and frozen dataclasses, if the
+                    pattern allows for it (see `apm.compiler.Memoization`, defaults to False).
+    :param iterative: Match on an explicit stack instead of the call stack, for values nested too deep for the
+                      interpreter (see `apm.iterative`, defaults to False). Takes precedence over `memoize`.
     :return:
     """
     ctx = MatchContext(
@@ -103,5 +111,9 @@ def match(value, pattern=NoValue, *extra,
 
         pattern = transform(pattern, lambda x: Capture(x, name=generate_name(), target=captureall))
 
-    result = ctx.match(value, pattern, strict=strict)
+    if iterative:
+        return match_iteratively(value, pattern, ctx=ctx, strict=strict)
+    if memoize:
+        return memoization.match(value, pattern, multimatch=multimatch, strict=strict)
+    result = tiering.match(value, pattern, ctx=ctx, strict=strict)
     return result
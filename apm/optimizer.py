@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import datetime
+from abc import ABCMeta
+from decimal import Decimal
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+from .analysis import is_pure
+from .core import AllOf, MatchContext, MatchResult, Not, OneOf, Pattern, StringPattern, Underscore, \
+    _get_dataclass_fields, _has_registered_handler, _is_literal, transform
+from .patterns import At, Between, Check, Contains, Each, EachItem, InstanceOf, Length, Regex, Returns, SubclassOf, \
+    Transformed
+
+# Bounds of these types are totally ordered (among compatible ones), so intersecting ranges is well defined.
+_ORDERED_TYPES = frozenset({int, float, str, bytes, Decimal, Fraction, datetime.date, datetime.datetime, datetime.time})
+
+
+def _matches_literal(value, literal, strict: bool, nested_strict: bool) -> bool:
+    """Matches like `MatchContext.match` would, given that `literal` contains no patterns at all."""
+    if _get_dataclass_fields(type(value)) is not None:
+        return False
+    literal_type = type(literal)
+    if literal_type == dict:
+        try:
+            items = value.items()
+        except (AttributeError, TypeError):
+            return False
+        lookup = value if type(value) == dict else dict(items)
+        for key, val in literal.items():
+            if key not in lookup or not _matches_literal(lookup[key], val, nested_strict, nested_strict):
+                return False
+        return not strict or len(lookup) == len(literal)
+    if literal_type in (tuple, list):
+        if literal_type == tuple and not isinstance(value, tuple) or strict and type(value) != literal_type:
+            return False
+        try:
+            it = iter(value)
+        except TypeError:
+            return False
+        for item_literal in literal:
+            try:
+                item = next(it)
+            except StopIteration:
+                return False
+            if not _matches_literal(item, item_literal, nested_strict, nested_strict):
+                return False
+        for _item in it:
+            return False
+        return True
+    if literal == value:
+        return not strict or literal_type == type(value)
+    return False
+
+
+class LiteralValue(Pattern):
+    """A dict, list, or tuple which does not contain any patterns, matched without going through `MatchContext.match`
+    for every single item. Created by `optimize()`, matches exactly like the plain value would."""
+    __slots__ = ('_value',)
+
+    def __init__(self, value):
+        self._value = value
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        return ctx.match_if(_matches_literal(value, self._value, strict, ctx.properties.strict))
+
+    @property
+    def value(self):
+        return self._value
+
+
+class LiteralSet(Pattern, StringPattern):
+    """`OneOf` a number of literals, using a hash lookup instead of trying them one after the other. Created by
+    `optimize()`, matches exactly like the `OneOf` it replaces would."""
+    __slots__ = ('_literals', '_table')
+
+    def __init__(self, *literals):
+        self._literals = literals
+        self._derive()
+
+    def _derive(self):
+        table: Dict[object, Tuple[object, frozenset]] = {}
+        for literal in self._literals:
+            first, types = table.get(literal, (literal, frozenset()))
+            table[literal] = (first, types | {type(literal)})
+        self._table = table
+
+    _derived_attributes = frozenset({'_table'})
+
+    def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        # just like OneOf this does not pass on `strict`, only the properties of the context apply
+        strict = ctx.properties.strict
+        if _is_literal(value):
+            entry = self._table.get(value)
+            if entry is None:
+                return ctx.no_match()
+            literal, types = entry
+            return ctx.match_if(literal == value and (not strict or type(value) in types))
+        if _get_dataclass_fields(type(value)) is not None:
+            return ctx.no_match()
+        for literal in self._literals:
+            if literal == value and (not strict or type(literal) == type(value)):
+                return ctx.matches()
+        return ctx.no_match()
+
+    def string_match(self, remaining, *, ctx: MatchContext) -> Optional[str]:
+        for literal in self._literals:
+            if isinstance(literal, str) and remaining[:len(literal)] == literal:
+                return literal
+        return None
+
+    @property
+    def literals(self) -> Tuple:
+        return self._literals
+
+
+_STRICT_INSENSITIVE_TYPES = (
+    AllOf, At, Between, Check, Contains, Each, EachItem, InstanceOf, Length, LiteralSet, Not, OneOf, Regex, Returns,
+    SubclassOf, Transformed, Underscore,
+)
+
+
+def _is_strict_insensitive(pattern) -> bool:
+    """Whether the pattern matches the same regardless of the `strict` flag handed to it."""
+    return pattern is Ellipsis or isinstance(pattern, _STRICT_INSENSITIVE_TYPES)
+
+
+def _same(a, b) -> bool:
+    # `==` alone considers 1, 1.0, and True to be the same, which they are not in a strict match
+    return type(a) == type(b) and a == b and repr(a) == repr(b)
+
+
+def _literal_tree(pattern):
+    """The plain value if the pattern does not contain any patterns (only literals, dicts, lists, tuples), else None.
+    Values of a type which a handler has been registered for are patterns, too."""
+    if _has_registered_handler(type(pattern)):
+        return None
+    if isinstance(pattern, LiteralValue):
+        return pattern.value
+    if _is_literal(pattern):
+        return pattern
+    if type(pattern) == dict:
+        result = {}
+        for key, val in pattern.items():
+            val = _literal_tree(val)
+            if not _is_literal(key) or val is None and pattern[key] is not None:
+                return None
+            result[key] = val
+        return result
+    if type(pattern) in (list, tuple):
+        result = []
+        for item in pattern:
+            literal = _literal_tree(item)
+            if literal is None and item is not None:
+                return None
+            result.append(literal)
+        return type(pattern)(result)
+    return None
+
+
+def _instance_of_implied(pattern: InstanceOf, by: List) -> bool:
+    if len(pattern.types) != 1 or type(pattern.types[0]) not in (type, ABCMeta):
+        return False
+    for other in by:
+        if isinstance(other, InstanceOf) and len(other.types) == 1 and type(other.types[0]) in (type, ABCMeta):
+            if issubclass(other.types[0], pattern.types[0]):
+                return True
+    return False
+
+
+def _intersect(a: Between, b: Between) -> Optional[Between]:
+    bounds = (a.lower, a.upper, b.lower, b.upper)
+    if any(type(bound) not in _ORDERED_TYPES for bound in bounds):
+        return None
+    try:
+        if a.lower == b.lower:
+            lower, lower_exclusive = a.lower, a.lower_bound_exclusive or b.lower_bound_exclusive
+        elif a.lower > b.lower:
+            lower, lower_exclusive = a.lower, a.lower_bound_exclusive
+        else:
+            lower, lower_exclusive = b.lower, b.lower_bound_exclusive
+        if a.upper == b.upper:
+            upper, upper_exclusive = a.upper, a.upper_bound_exclusive or b.upper_bound_exclusive
+        elif a.upper < b.upper:
+            upper, upper_exclusive = a.upper, a.upper_bound_exclusive
+        else:
+            upper, upper_exclusive = b.upper, b.upper_bound_exclusive
+    except TypeError:
+        return None
+    return Between(lower, upper, lower_bound_exclusive=lower_exclusive, upper_bound_exclusive=upper_exclusive)
+
+
+def _optimize_all_of(pattern: AllOf):
+    conjuncts = []
+    for p in pattern.patterns:
+        if type(p) == AllOf and p.adaptive == pattern.adaptive:
+            conjuncts.extend(p.patterns)
+        elif p is not Ellipsis:
+            conjuncts.append(p)
+    result = []
+    for p in conjuncts:
+        if is_pure(p) and any(_same(p, q) for q in result):
+            continue
+        if isinstance(p, InstanceOf) and _instance_of_implied(p, result):
+            continue
+        if isinstance(p, Between) and result and isinstance(result[-1], Between):
+            intersection = _intersect(result[-1], p)
+            if intersection is not None:
+                result[-1] = intersection
+                continue
+        result.append(p)
+    if not result:
+        return ...
+    if len(result) == 1 and _is_strict_insensitive(result[0]):
+        return result[0]
+    return AllOf(*result, adaptive=pattern.adaptive)
+
+
+def _merge_literals(run: list, into: list):
+    """Appends a run of literal alternatives, looked up in a hash table if there is more than one."""
+    if len(run) > 1:
+        into.append(LiteralSet(*run))
+    else:
+        into.extend(run)
+
+
+def _optimize_one_of(pattern: OneOf):
+    alternatives = []
+    for p in pattern.patterns:
+        if type(p) == OneOf:
+            alternatives.extend(p.patterns)
+        else:
+            alternatives.append(p)
+    result = []
+    for p in alternatives:
+        if is_pure(p) and any(_same(p, q) for q in result):
+            continue
+        result.append(p)
+        if p is Ellipsis:
+            # always matches, everything after it is unreachable
+            break
+    merged = []
+    run = []
+    for p in result:
+        if _is_literal(p):
+            run.append(p)
+            continue
+        _merge_literals(run, merged)
+        run = []
+        merged.append(p)
+    _merge_literals(run, merged)
+    if len(merged) == 1 and _is_strict_insensitive(merged[0]):
+        return merged[0]
+    return OneOf(*merged)
+
+
+def _optimize_node(pattern):
+    if type(pattern) == AllOf:
+        return _optimize_all_of(pattern)
+    if type(pattern) == OneOf:
+        return _optimize_one_of(pattern)
+    if type(pattern) == Not and type(pattern.pattern) == Not:
+        inner = pattern.pattern.pattern
+        if _is_strict_insensitive(inner):
+            return inner
+    if type(pattern) in (dict, list, tuple):
+        literal = _literal_tree(pattern)
+        if literal is not None:
+            return LiteralValue(literal)
+    return pattern
+
+
+def optimize(pattern):
+    """Rewrites a pattern into one that matches exactly the same values, producing the same captures, but faster.
+
+    - nested `AllOf` and `OneOf` are flattened, `Not(Not(p))` becomes `p`
+    - runs of literals in a `OneOf` are looked up in a hash table (`LiteralSet`)
+    - adjacent `Between` in an `AllOf` are intersected
+    - dicts, lists, and tuples which do not contain any patterns are matched directly (`LiteralValue`)
+    - conjuncts and alternatives which are provably redundant are dropped (`...` in an `AllOf`, repeated pure
+      patterns, `InstanceOf` implied by a preceding one, alternatives following `...` in a `OneOf`)
+
+    Only `MatchResult.explain()` might be phrased differently for an optimized pattern.
+    """
+    return transform(pattern, _optimize_node)
@@ -3,11 +3,12 @@ from __future__ import annotations
 import functools
 import inspect
 import typing
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 
-from .core import MatchResult, apply
+from .core import MatchResult, OneOf, apply, _Dispatch, _is_literal
 from .error import MatchError
 from .match import match
+from .patterns import InstanceOf
 
 
 class Match:
@@ -20,51 +21,278 @@ class Match:
         # typing.get_type_hints requires annotations to be callable, otherwise it bombs out with a TypeError
         return match(value, self._pattern, **self._kwargs)
 
+    @property
+    def pattern(self):
+        return self._pattern
 
-# noinspection PyDefaultArgument
-def overload(fn: Callable, func_map: Dict[str, List[Callable]] = {}):
-    qualified_name = fn.__qualname__
-    if qualified_name not in func_map:
-        func_map[qualified_name] = []
-    cases = func_map[qualified_name]
-    cases.append(fn)
 
-    @functools.wraps(fn)
-    def wrapper(*args, **kwargs):
-        for func in func_map[qualified_name]:
-            sig: inspect.Signature = inspect.signature(func)
+_MISSING = object()
+
+
+class _Case:
+    def __init__(self, fn: Callable, index: int):
+        self.function = fn
+        self.index = index
+        self.hits = 0
+        self._signature: Optional[inspect.Signature] = None
+        self._type_hints: Optional[Dict] = None
+
+    @property
+    def signature(self) -> inspect.Signature:
+        if self._signature is None:
+            self._signature = inspect.signature(self.function)
+        return self._signature
+
+    @property
+    def type_hints(self) -> Dict:
+        if self._type_hints is None:
+            # resolve the annotations which are strings as per __future__
+            self._type_hints = typing.get_type_hints(self.function)
+        return self._type_hints
+
+    def bind(self, args, kwargs) -> Optional[inspect.BoundArguments]:
+        try:
+            bound: inspect.BoundArguments = self.signature.bind(*args, **kwargs)
+        except TypeError:
+            return None
+        type_hints = self.type_hints
+        for name, value in bound.arguments.items():
+            if name not in type_hints:
+                continue
+            annotation = type_hints[name]
+            if isinstance(annotation, Match):
+                result: MatchResult = annotation(value)
+                if not result:
+                    return None
+                if callable(annotation.when) and not apply(annotation.when, result):
+                    return None
             try:
-                bound: inspect.BoundArguments = sig.bind(*args, **kwargs)
+                # noinspection PyTypeHints
+                if not isinstance(value, annotation):
+                    return None
             except TypeError:
+                pass
+        return bound
+
+    def simple_parameters(self) -> Optional[Tuple[str, ...]]:
+        """The names of the parameters if all of them are required and may be given positionally or by keyword."""
+        names = []
+        for parameter in self.signature.parameters.values():
+            if parameter.kind != parameter.POSITIONAL_OR_KEYWORD or parameter.default is not parameter.empty:
+                return None
+            names.append(parameter.name)
+        return tuple(names)
+
+    def exception_free(self) -> bool:
+        """Whether checking the annotations of this case can not raise an exception, whatever the arguments: they are
+        classes (without a metaclass of their own) or `Match` of literals and `InstanceOf`."""
+        type_hints = self.type_hints
+        for name in self.signature.parameters:
+            annotation = type_hints.get(name)
+            if annotation is None:
                 continue
-            matches = True
-            # resolve the annotations which are strings as per __future__
-            type_hints = typing.get_type_hints(func)
-            for name, value in bound.arguments.items():
-                if name not in type_hints:
-                    continue
-                annotation = type_hints[name]
-                if isinstance(annotation, Match):
-                    result: MatchResult = annotation(value)
-                    if not result:
-                        matches = False
-                        break
-                    if callable(annotation.when) and not apply(annotation.when, result):
-                        matches = False
-                        break
-                try:
-                    # noinspection PyTypeHints
-                    if not isinstance(value, annotation):
-                        matches = False
-                        break
-                except TypeError:
-                    pass
-            if not matches:
-                continue
+            if isinstance(annotation, Match):
+                if annotation.when is not None or not _exception_free(annotation.pattern):
+                    return False
+            elif type(annotation) is not type:
+                return False
+        return True
+
+    def constraint(self, name: str) -> Optional[Tuple[str, object]]:
+        """What an argument has to be for this case to accept it: `('type', t)`, `('literal', v)`, or unknown."""
+        annotation = self.type_hints.get(name)
+        if isinstance(annotation, Match):
+            pattern = annotation.pattern
+            if isinstance(pattern, InstanceOf) and len(pattern.types) == 1:
+                return 'type', pattern.types[0]
+            discriminators = _Dispatch.discriminators(pattern)
+            if ('self',) in discriminators:
+                return 'literal', discriminators[('self',)]
+            return None
+        if isinstance(annotation, type):
+            return 'type', annotation
+        return None
+
+
+def _exception_free(pattern) -> bool:
+    if isinstance(pattern, OneOf):
+        return all(_exception_free(p) for p in pattern.patterns)
+    return type(pattern) is InstanceOf or _is_literal(pattern)
+
+
+def _builtin_base(type_: type) -> Optional[type]:
+    if type(type_) is not type:
+        # metaclasses might override instance checks
+        return None
+    for base in type_.__mro__:
+        if base.__module__ == 'builtins':
+            return None if base is object else base
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _disjoint_types(a: type, b: type) -> bool:
+    """Whether no value can be an instance of both types, i.e. their builtin bases have conflicting layouts."""
+    if issubclass(a, b) or issubclass(b, a):
+        return False
+    base_a, base_b = _builtin_base(a), _builtin_base(b)
+    if base_a is None or base_b is None or issubclass(base_a, base_b) or issubclass(base_b, base_a):
+        return False
+    try:
+        type('_', (base_a, base_b), {})
+    except TypeError:
+        return True
+    return False
+
 
-            return func(*bound.args, **bound.kwargs)
+def _disjoint(a: _Case, b: _Case) -> Optional[Tuple[str, Optional[str]]]:
+    """Proves that no call is accepted by both cases. Returns the reason and, if the proof only holds for arguments
+    which are literals, the name of the parameter which must be checked at the call site. None if not provable.
+    """
+    names_a, names_b = a.simple_parameters(), b.simple_parameters()
+    if names_a is None or names_b is None:
+        return None
+    if len(names_a) != len(names_b):
+        # the annotations of a case are not looked at for calls with a different number of arguments
+        return 'arity', None
+    if names_a != names_b or not a.exception_free() or not b.exception_free():
+        # trying a case first which raises, or which is tried before one that raises, changes the outcome of a call
+        return None
+    literal_proof = None
+    for name in names_a:
+        constraint_a, constraint_b = a.constraint(name), b.constraint(name)
+        if constraint_a is None or constraint_b is None or constraint_a[0] != constraint_b[0]:
+            continue
+        kind, value_a = constraint_a
+        value_b = constraint_b[1]
+        if kind == 'type' and isinstance(value_a, type) and isinstance(value_b, type) \
+                and _disjoint_types(value_a, value_b):
+            return 'type', None
+        if kind == 'literal' and literal_proof is None and value_a != value_b:
+            literal_proof = ('literal', name)
+    return literal_proof
+
+
+class OverloadProfile:
+    """The cases of an overloaded function together with how often each of them was chosen.
+
+    Every `reorder_interval` calls the cases are sorted such that the ones hit most often are tried first. Two cases
+    only ever swap places if they are provably disjoint, i.e. no call can be accepted by both of them: They take a
+    different number of arguments, or for the same parameter they require types that no value can be an instance of
+    at the same time, or different literals (`Match(1)` vs `Match(2)`). The latter only holds for arguments which
+    are literals themselves, for any other argument the cases are tried in the order they were defined. Cases with an
+    annotation that might raise an exception (a `Check`, `when=`, ...) are never moved, relative to any other case.
+    """
+    reorder_interval = 256
+
+    def __init__(self):
+        self._cases: List[_Case] = []
+        # the order to try the cases in and the parameters which must be literals for that order to be valid
+        self._plan: Tuple[Tuple[_Case, ...], Tuple[Tuple[int, str], ...]] = ((), ())
+        self._disjoint: Optional[Dict[Tuple[int, int], Tuple[str, Optional[str]]]] = None
+        self._calls = 0
+
+    def add(self, fn: Callable):
+        self._cases.append(_Case(fn, len(self._cases)))
+        self.reset()
+
+    def reset(self):
+        """Forgets all statistics and restores the order the cases were defined in."""
+        for case in self._cases:
+            case.hits = 0
+        self._plan = (tuple(self._cases), ())
+        self._disjoint = None
+        self._calls = 0
+
+    def __call__(self, args, kwargs):
+        order, guards = self._plan
+        for index, name in guards:
+            value = args[index] if index < len(args) else kwargs.get(name, _MISSING)
+            if value is not _MISSING and not _is_literal(value):
+                order = self._cases
+                break
+        self._calls += 1
+        if self._calls % self.reorder_interval == 0:
+            self.reorder()
+        for case in order:
+            bound = case.bind(args, kwargs)
+            if bound is None:
+                continue
+            case.hits += 1
+            return case.function(*bound.args, **bound.kwargs)
         raise MatchError(f"No match(args={repr(args)}, kwargs={repr(kwargs)})")
 
+    def _analyze(self) -> Dict[Tuple[int, int], Tuple[str, Optional[str]]]:
+        if self._disjoint is None:
+            disjoint = {}
+            try:
+                for a in self._cases:
+                    for b in self._cases[a.index + 1:]:
+                        proof = _disjoint(a, b)
+                        if proof is not None:
+                            disjoint[(a.index, b.index)] = proof
+            except Exception:  # pylint: disable=broad-except
+                # annotations which can not be resolved (yet): no reordering at all
+                disjoint = {}
+            self._disjoint = disjoint
+        return self._disjoint
+
+    def reorder(self):
+        """Sorts the cases by the number of hits, as far as this does not change which case is chosen for a call."""
+        disjoint = self._analyze()
+        remaining = list(self._cases)
+        order = []
+        while remaining:
+            # a case may go next once all the earlier cases it is not disjoint from have been placed
+            ready = [case for case in remaining
+                     if all(earlier not in remaining or (earlier.index, case.index) in disjoint
+                            for earlier in self._cases[:case.index])]
+            best = max(ready, key=lambda c: (c.hits, -c.index))
+            remaining.remove(best)
+            order.append(best)
+        guards = set()
+        for position, case in enumerate(order):
+            for later in order[position + 1:]:
+                if later.index < case.index:
+                    _reason, name = disjoint[(later.index, case.index)]
+                    if name is not None:
+                        guards.add((case.simple_parameters().index(name), name))
+        self._plan = (tuple(order), tuple(sorted(guards)))
+
+    @property
+    def functions(self) -> Tuple[Callable, ...]:
+        """The cases in the order they were defined in."""
+        return tuple(case.function for case in self._cases)
+
+    @property
+    def order(self) -> Tuple[Callable, ...]:
+        """The cases in the order they are currently tried in."""
+        return tuple(case.function for case in self._plan[0])
+
+    @property
+    def hits(self) -> Dict[Callable, int]:
+        return {case.function: case.hits for case in self._cases}
+
+    def disjoint_pairs(self) -> List[Tuple[Callable, Callable, str]]:
+        """All pairs of cases which may be reordered relative to each other, with the reason: `'arity'`, `'type'`, or
+        `'literal'`."""
+        return [(self._cases[a].function, self._cases[b].function, reason)
+                for (a, b), (reason, _name) in sorted(self._analyze().items())]
+
+
+# noinspection PyDefaultArgument
+def overload(fn: Callable, func_map: Dict[str, OverloadProfile] = {}):
+    qualified_name = fn.__qualname__
+    if qualified_name not in func_map:
+        func_map[qualified_name] = OverloadProfile()
+    profile = func_map[qualified_name]
+    profile.add(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return profile(args, kwargs)
+
+    wrapper.profile = profile
     return wrapper
 
 
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import concurrent.futures
+import os
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .compiler import CompiledPattern, _CompiledNoMatch
+from .core import Aggregation, MatchContext, MatchResult, WildcardMatch
+from .serialization import deserialize, serialize
+
+# What a worker sends back per value: whether it matched, the captures, and the values of the wildcard matches in
+# the order they have been recorded. Wildcards are known by id, which does not mean anything in another process.
+_Outcome = Tuple[bool, Dict, List]
+
+# the pattern a worker process matches against, set once per process by `_init_worker`
+_worker_pattern: Optional[CompiledPattern] = None
+
+
+def _init_worker(data: bytes):
+    global _worker_pattern
+    _worker_pattern = CompiledPattern(deserialize(data))
+
+
+def _match_chunk(chunk: List, *, pattern: Optional[CompiledPattern], multimatch: bool, strict: bool) -> List[_Outcome]:
+    if pattern is None:
+        pattern = _worker_pattern
+    outcomes = []
+    for value in chunk:
+        ctx = MatchContext(multimatch=multimatch, strict=strict)
+        matches = bool(pattern.match_in(value, ctx=ctx, strict=strict))
+        outcomes.append((matches, ctx.groups, ctx.get_wildcard_matches()))
+    return outcomes
+
+
+def _aggregate_chunk(chunk: List, *, pattern: Optional[CompiledPattern], multimatch: bool,
+                     strict: bool) -> Dict[Any, Tuple[Aggregation, Any]]:
+    if pattern is None:
+        pattern = _worker_pattern
+    partials: Dict[Any, Tuple[Aggregation, Any]] = {}
+    for value in chunk:
+        ctx = MatchContext(multimatch=multimatch, strict=strict)
+        if not pattern.match_in(value, ctx=ctx, strict=strict) or not ctx._aggregations:
+            continue
+        for name, aggregation in ctx._aggregations.items():
+            aggregate = ctx.groups[name]
+            if name in partials:
+                aggregate = aggregation.merge(partials[name][1], aggregate)
+            partials[name] = aggregation, aggregate
+    return partials
+
+
+def _result(value, outcome: _Outcome, pattern, *, multimatch: bool, strict: bool) -> MatchResult:
+    matches, groups, wildcard_values = outcome
+    ctx = MatchContext(multimatch=multimatch, strict=strict)
+    ctx.groups = groups
+    for index, wildcard_value in enumerate(wildcard_values):
+        ctx.wildcards[index] = wildcard_match = WildcardMatch(index)
+        wildcard_match.set(wildcard_value)
+    if matches:
+        return ctx.matches()
+    return _CompiledNoMatch(value, pattern, ctx=ctx, strict=strict)
+
+
+def _chunks(values: Iterable, size: int) -> Iterator[List]:
+    it = iter(values)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _executor(pattern, backend: str, workers: int) -> Tuple[concurrent.futures.Executor, Optional[CompiledPattern]]:
+    if backend == 'process':
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                          initargs=(serialize(pattern),))
+        return executor, None
+    if backend == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(workers), CompiledPattern(pattern)
+    raise ValueError(f"backend must be 'process' or 'thread', not {backend!r}")
+
+
+def _map_chunks(fn, values: Iterable, pattern, *, workers: Optional[int], backend: str, chunksize: int, ordered: bool,
+                **kwargs) -> Iterator[Tuple[List, Any]]:
+    """Applies `fn(chunk, pattern=..., **kwargs)` to chunks of the values using a pool of workers, yields
+    `(chunk, result)` pairs."""
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+    workers = workers or os.cpu_count() or 1
+    executor, compiled = _executor(pattern, backend, workers)
+
+    chunks = _chunks(values, chunksize)
+    pending: Dict[concurrent.futures.Future, List] = {}
+    order: deque = deque()
+
+    def submit() -> bool:
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        future = executor.submit(fn, chunk, pattern=compiled, **kwargs)
+        pending[future] = chunk
+        if ordered:
+            order.append(future)
+        return True
+
+    try:
+        while len(pending) < 2 * workers and submit():
+            pass
+        while pending:
+            if ordered:
+                done = [order.popleft()]
+            else:
+                done, _not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                chunk = pending.pop(future)
+                result = future.result()
+                submit()
+                yield chunk, result
+    finally:
+        # the generator might have been closed early, or a worker failed: do not wait for chunks nobody asks for
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def match_parallel(values: Iterable, pattern, *,
+                   workers: Optional[int] = None,
+                   backend: str = 'process',
+                   chunksize: int = 1024,
+                   ordered: bool = True,
+                   multimatch: bool = False,
+                   strict: bool = False) -> Iterator[Tuple[Any, MatchResult]]:
+    """Matches every value from the given iterable against the pattern using `workers` threads or processes (defaults
+    to the number of CPUs) and yields `(value, result)` pairs as they become available.
+
+    The values are read lazily and sent to the workers in chunks of `chunksize`, at most two chunks per worker are
+    in flight at any time. With `ordered=False` the results of a chunk are yielded as soon as the chunk is done,
+    otherwise in the order of the values.
+
+    - The `'process'` backend sends the pattern to every worker process once, serialized using `apm.serialization`
+      (lambdas need to be registered using `register_function` when the module is imported). Values and captures are
+      pickled. This is the one to use with the standard (GIL) build of CPython.
+    - The `'thread'` backend shares the pattern and values among threads and scales on free-threaded builds (3.13+).
+
+    Each worker matches using a `CompiledPattern`, so the pattern should not be one which keeps state in between
+    matches (like a capture into a `target`). A failed result explains itself by matching once more in this process.
+    """
+    for chunk, outcomes in _map_chunks(_match_chunk, values, pattern, workers=workers, backend=backend,
+                                       chunksize=chunksize, ordered=ordered, multimatch=multimatch, strict=strict):
+        for value, outcome in zip(chunk, outcomes):
+            yield value, _result(value, outcome, pattern, multimatch=multimatch, strict=strict)
+
+
+def aggregate_parallel(values: Iterable, pattern, *,
+                       workers: Optional[int] = None,
+                       backend: str = 'process',
+                       chunksize: int = 1024,
+                       multimatch: bool = False,
+                       strict: bool = False) -> Dict[Any, Any]:
+    """Matches every value from the given iterable against a pattern with aggregating captures
+    (`pattern >> agg.Sum('total')`) like `match_parallel` does, and returns the aggregates over all of the values which
+    matched, by name. Values which do not match do not contribute, just like a failed match does not.
+
+    Every worker aggregates the values of a chunk, the aggregates of the chunks are then combined in order using
+    `Aggregation.merge`. The result is the same as matching the values one after the other and merging the aggregates
+    of those which matched. Aggregates which nothing has been added to are missing from the result.
+    """
+    aggregates: Dict[Any, Any] = {}
+    for _chunk, partials in _map_chunks(_aggregate_chunk, values, pattern, workers=workers, backend=backend,
+                                        chunksize=chunksize, ordered=True, multimatch=multimatch, strict=strict):
+        for name, (aggregation, aggregate) in partials.items():
+            if name in aggregates:
+                aggregate = aggregation.merge(aggregates[name], aggregate)
+            aggregates[name] = aggregate
+    return aggregates
@@ -1,23 +1,100 @@
 from __future__ import annotations
 
+import functools
 import numbers
 import operator as ops
 import re
-from typing import Callable, Optional, Dict, Any
+import types
+from typing import Callable, Optional, Dict, Any, Hashable, Union
 
+from .cache import ResultCache
 from ._util import get_arg_types, get_return_type, get_kwarg_types
-from .core import Pattern, MatchContext, MatchResult, StringPattern, OneOf, Nested, Underscore
+from .core import Pattern, MatchContext, MatchResult, StringPattern, OneOf, Nested, Underscore, Undecided, \
+    _get_dataclass_fields
+
+
+def pure(f: Callable) -> Callable:
+    """Marks a function as pure: Its result depends on its argument only and calling it has no side effects.
+
+    `Check` and `Transformed` apply a pure function at most once to the same value during a match, e.g. in
+    `OneOf(Transformed(loads, A), Transformed(loads, B))` with `loads = pure(json.loads)` the string is parsed once.
+    The given function is left as it is, a wrapper which is marked as pure is returned.
+    """
+    if callable(getattr(f, '__apm_pure__', None)):
+        return f
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        return f(*args, **kwargs)
+
+    # refers to the wrapped function, so that wrapping the same function twice gives the same key
+    wrapper.__apm_pure__ = f
+    return wrapper
+
+
+def _pure_function_key(f: Callable) -> Optional[Hashable]:
+    """A key which is the same for functions that compute the same thing, None if `f` is not marked as pure."""
+    f = getattr(f, '__apm_pure__', None)
+    if not callable(f):
+        return None
+    if isinstance(f, types.FunctionType):
+        try:
+            # the same code with the same defaults, closing over the same objects: e.g. a lambda written out twice
+            closure = tuple(id(cell.cell_contents) for cell in f.__closure__ or ())
+        except ValueError:
+            # a variable it closes over has not been assigned yet
+            return id(f)
+        return f.__code__, id(f.__globals__), id(f.__defaults__), id(f.__kwdefaults__), closure
+    return id(f)
+
+
+def _result_cache(cache: Union[None, bool, ResultCache]) -> Optional[ResultCache]:
+    if cache is True:
+        return ResultCache()
+    if cache is None or cache is False:
+        return None
+    return cache
+
+
+def _apply(f: Callable, value, *, ctx: MatchContext, pure_key: Optional[Hashable], cache: Optional[ResultCache]):
+    if cache is not None:
+        if pure_key is not None:
+            return ctx.call_pure(pure_key, functools.partial(cache.call, f), value)
+        return cache.call(f, value)
+    if pure_key is not None:
+        return ctx.call_pure(pure_key, f, value)
+    return f(value)
 
 
 class Check(Pattern):
-    def __init__(self, condition):
+    __slots__ = ('_condition', '_cache', '_pure_key')
+
+    _derived_attributes = frozenset({'_pure_key'})
+
+    def __init__(self, condition, *, cache: Union[None, bool, ResultCache] = None):
         self._condition = condition
+        self._cache: Optional[ResultCache] = _result_cache(cache)
+        self._derive()
+
+    def _derive(self):
+        self._pure_key = _pure_function_key(self._condition)
 
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
-        return ctx.match_if(self._condition(value))
+        return ctx.match_if(self._apply(value, ctx))
+
+    def _apply(self, value, ctx: MatchContext):
+        if self._cache is None and self._pure_key is None:
+            return self._condition(value)
+        return _apply(self._condition, value, ctx=ctx, pure_key=self._pure_key, cache=self._cache)
+
+    @property
+    def cache(self) -> Optional[ResultCache]:
+        return self._cache
 
 
 class Regex(Pattern, StringPattern):
+    __slots__ = ('_regex', '_bind_groups', '_wildcards')
+
     def __init__(self, regex, *, bind_groups: bool = True, capture_wildcards: bool = False):
         self._regex: re.Pattern = re.compile(regex)
         self._bind_groups = bind_groups
@@ -51,14 +128,22 @@ class Regex(Pattern, StringPattern):
 
 
 class InstanceOf(Pattern):
+    __slots__ = ('_type',)
+
     def __init__(self, *type_: type):
         self._type = type_
 
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
         return ctx.match_if(isinstance(value, self._type))
 
+    @property
+    def types(self):
+        return self._type
+
 
 class SubclassOf(Pattern):
+    __slots__ = ('_type',)
+
     def __init__(self, *type_: type):
         self._type = type_
 
@@ -67,6 +152,8 @@ class SubclassOf(Pattern):
 
 
 class Between(Pattern):
+    __slots__ = ('lower', 'upper', 'op_lower', 'op_upper')
+
     def __init__(self, lower, upper, *, lower_bound_exclusive=False, upper_bound_exclusive=False):
         self.lower = lower
         self.upper = upper
@@ -76,8 +163,18 @@ class Between(Pattern):
     def match(self, value, *, ctx: MatchContext, strict=False) -> MatchResult:
         return ctx.match_if(self.op_lower(value, self.lower) and self.op_upper(value, self.upper))
 
+    @property
+    def lower_bound_exclusive(self) -> bool:
+        return self.op_lower is ops.gt
+
+    @property
+    def upper_bound_exclusive(self) -> bool:
+        return self.op_upper is ops.lt
+
 
 class Length(Pattern):
+    __slots__ = ('_at_least', '_at_most')
+
     def __init__(self, *, exactly: int = None, at_least: int = None, at_most: int = None):
         if exactly is not None:
             if at_least is not None or at_most is not None:
@@ -95,6 +192,8 @@ class Length(Pattern):
 
 
 class Contains(Pattern):
+    __slots__ = ('_needle',)
+
     def __init__(self, needle):
         self._needle = needle
 
@@ -103,23 +202,43 @@ class Contains(Pattern):
 
 
 class Transformed(Pattern, Nested):
-    def __init__(self, f: Callable, pattern):
+    __slots__ = ('_f', '_pattern', '_cache', '_pure_key')
+
+    _derived_attributes = frozenset({'_pure_key'})
+
+    def __init__(self, f: Callable, pattern, *, cache: Union[None, bool, ResultCache] = None):
         self._f = f
         self._pattern = pattern
+        self._cache: Optional[ResultCache] = _result_cache(cache)
+        self._derive()
+
+    def _derive(self):
+        self._pure_key = _pure_function_key(self._f)
 
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
         # noinspection PyBroadException
         try:
-            transformed = self._f(value)
+            transformed = self._apply(value, ctx)
         except Exception:
             return ctx.no_match()
         return ctx.match(transformed, self._pattern)
 
+    def _apply(self, value, ctx: MatchContext):
+        if self._cache is None and self._pure_key is None:
+            return self._f(value)
+        return _apply(self._f, value, ctx=ctx, pure_key=self._pure_key, cache=self._cache)
+
     def descend(self, f):
-        return Transformed(f=self._f, pattern=f(self._pattern))
+        return Transformed(f=self._f, pattern=f(self._pattern), cache=self._cache)
+
+    @property
+    def cache(self) -> Optional[ResultCache]:
+        return self._cache
 
 
 class Arguments(Pattern, Nested):
+    __slots__ = ('_pattern', '_kwargs')
+
     def __init__(self, *arg_patterns, **kwargs):
         self._pattern = list(arg_patterns)
         self._kwargs: Dict[str, Any] = kwargs
@@ -142,6 +261,8 @@ class Arguments(Pattern, Nested):
 
 
 class Returns(Pattern, Nested):
+    __slots__ = ('_pattern',)
+
     def __init__(self, pattern):
         self._pattern = pattern
 
@@ -155,21 +276,94 @@ class Returns(Pattern, Nested):
 
 
 class Each(Pattern, Nested):
+    __slots__ = ('_pattern', '_at_least', '_resumable')
+
+    _derived_attributes = frozenset({'_resumable'})
+
     def __init__(self, pattern, *, at_least: int = 0):
         self._pattern = pattern
         self._at_least = at_least
+        self._derive()
+
+    def _derive(self):
+        # whether the items which matched can be skipped when a deferred match is repeated, computed when first needed
+        self._resumable: Optional[bool] = None
 
     def match(self, value, *, ctx: MatchContext, strict: bool) -> MatchResult:
+        if ctx._deferred is not None:  # pylint: disable=protected-access
+            resumable = self._resumable
+            if resumable is None:
+                from .analysis import _is_resumable  # pylint: disable=import-outside-toplevel,cyclic-import
+                resumable = self._resumable = _is_resumable(self._pattern)
+            if resumable:
+                return self._match_deferred(value, ctx)
         count = 0
         try:
             it = iter(value)
         except TypeError:
             return ctx.no_match()
+        undecided = None
         for item in it:
-            result = ctx.match(item, self._pattern)
+            try:
+                result = ctx.match(item, self._pattern)
+            except Undecided as e:
+                undecided = e
+                result = True
+            except Exception:
+                if undecided is None:
+                    raise
+                # it would not be matched at all should an earlier item not match, it is matched again once they decide
+                result = True
+            if not result:
+                return result
+            count += 1
+        if undecided is not None:
+            raise undecided
+        return ctx.match_if(count >= self._at_least)
+
+    def _match_deferred(self, value, ctx: MatchContext) -> MatchResult:
+        """Like `match`, but when the match is repeated (see `apm.deferred`) the items which matched are skipped, and an
+        undecided item is matched again only once some outcome it waited for is there."""
+        deferred = ctx._deferred  # pylint: disable=protected-access
+        state = deferred.resumed(self, value)
+        if state is None:
+            try:
+                items = ((item, None) for item in value)
+            except TypeError:
+                return ctx.no_match()
+            count = 0
+        else:
+            count, items = state
+        undecided = None
+        pending = []
+        for item, waiting in items:
+            if waiting and not any(outcome.done() for outcome in waiting):
+                deferred.waiting(waiting)
+                undecided = Undecided()
+                pending.append((item, waiting))
+                continue
+            outer = deferred.watch()
+            try:
+                result = ctx.match(item, self._pattern)
+            except Undecided as e:
+                undecided = e
+                pending.append((item, deferred.unwatch(outer)))
+                continue
+            except Exception:
+                deferred.unwatch(outer)
+                if undecided is None:
+                    raise
+                # it would not be matched at all should an earlier item not match, it is matched again once they decide
+                pending.append((item, None))
+                continue
+            deferred.unwatch(outer)
             if not result:
                 return result
             count += 1
+        if undecided is not None:
+            deferred.suspend(self, value, (count, pending))
+            raise undecided
+        deferred.suspend(self, value, (count, ()))
         return ctx.match_if(count >= self._at_least)
 
     def descend(self, f):
@@ -177,6 +371,8 @@ class Each(Pattern, Nested):
 
 
 class EachItem(Pattern, Nested):
+    __slots__ = ('_key_pattern', '_value_pattern')
+
     def __init__(self, key_pattern, value_pattern):
         self._key_pattern = key_pattern
         self._value_pattern = value_pattern
@@ -200,6 +396,8 @@ class EachItem(Pattern, Nested):
 
 
 class At(Pattern, Nested):
+    __slots__ = ('_path', '_pattern')
+
     def __init__(self, path, pattern):
         if isinstance(path, str):
             self._path = path.split(".")
@@ -218,8 +416,18 @@ class At(Pattern, Nested):
     def descend(self, f):
         return At(path=self._path, pattern=f(self._pattern))
 
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def pattern(self):
+        return self._pattern
+
 
 class Items(Pattern, Nested):
+    __slots__ = ('_items',)
+
     def __init__(self, **kwargs):
         self._items = kwargs
 
@@ -232,8 +440,14 @@ class Items(Pattern, Nested):
             items[k] = f(v)
         return Items(**items)
 
+    @property
+    def items(self):
+        return self._items
+
 
 class Attrs(Pattern, Nested):
+    __slots__ = ('_items',)
+
     def __init__(self, **kwargs):
         self._items = kwargs
 
@@ -241,7 +455,10 @@ class Attrs(Pattern, Nested):
         try:
             attrs = value.__dict__
         except AttributeError:
-            return ctx.no_match()
+            fields = _get_dataclass_fields(type(value))
+            if fields is None:
+                return ctx.no_match()
+            attrs = {name: getter(value) for name, getter in fields}
         return ctx.match(attrs, self._items, strict=strict)
 
     def descend(self, f):
@@ -252,6 +469,8 @@ class Attrs(Pattern, Nested):
 
 
 class Object(Pattern, Nested):
+    __slots__ = ('_type', '_kwargs')
+
     def __init__(self, type_, *args, **kwargs):
         self._type = type_
         self._kwargs = kwargs
@@ -270,6 +489,10 @@ class Object(Pattern, Nested):
     def descend(self, f):
         return Object(self._type, **{k: f(v) for k, v in self._kwargs.items()})
 
+    @property
+    def type(self):
+        return self._type
+
 
 # noinspection PyPep8Naming
 def NoneOf(*args) -> Pattern:
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import dataclasses
+from itertools import count
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from .analysis import capture_names
+from .match import match
+
+Token = Tuple[int, ...]
+
+
+@dataclasses.dataclass(frozen=True)
+class ReteMatch:
+    """A complete match of a rule: One fact per pattern of the rule, and the captures of all of them."""
+    rule: Hashable
+    handles: Tuple[int, ...]
+    facts: Tuple
+    groups: Dict[Hashable, Any]
+
+
+def _join_key(groups: Dict, names: Tuple) -> Optional[Tuple]:
+    try:
+        key = tuple(groups[name] for name in names)
+        hash(key)
+        return key
+    except (KeyError, TypeError):
+        return None
+
+
+def _compatible(left: Dict, right: Dict) -> bool:
+    if len(right) < len(left):
+        left, right = right, left
+    for name, value in left.items():
+        if name in right and right[name] != value:
+            return False
+    return True
+
+
+class _Alpha:
+    """Matches single facts against one pattern. Shared by all rules using an equal pattern."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.memory: Dict[int, Dict] = {}
+        self.users: List[Tuple[_Rule, int]] = []
+
+
+class _JoinIndex:
+    """Items (tokens or fact handles) indexed by the values of the captures they are joined on."""
+
+    def __init__(self, names: Tuple):
+        self.names = names
+        self.buckets: Dict[Tuple, Set] = {}
+        self.scan: Set = set()
+
+    def add(self, item, groups: Dict):
+        key = _join_key(groups, self.names)
+        if key is None:
+            self.scan.add(item)
+        else:
+            self.buckets.setdefault(key, set()).add(item)
+
+    def discard(self, item, groups: Dict):
+        key = _join_key(groups, self.names)
+        if key is None:
+            self.scan.discard(item)
+            return
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.discard(item)
+            if not bucket:
+                del self.buckets[key]
+
+    def candidates(self, groups: Dict, everything):
+        key = _join_key(groups, self.names)
+        if key is None:
+            return everything
+        return [*self.buckets.get(key, ()), *self.scan]
+
+
+class _Rule:
+    def __init__(self, rule_id: Hashable, alphas: List[_Alpha]):
+        self.id = rule_id
+        self.alphas = alphas
+        seen: Set = set()
+        # tokens[i] holds the partial matches of the first i + 1 patterns
+        self.tokens: List[Dict[Token, Dict]] = []
+        # token_index[i] indexes tokens[i - 1], fact_index[i] the facts of alphas[i], both on the shared captures
+        self.token_index: List[Optional[_JoinIndex]] = []
+        self.fact_index: List[Optional[_JoinIndex]] = []
+        for ix, alpha in enumerate(alphas):
+            names = capture_names(alpha.pattern)
+            shared = tuple(sorted(names & seen, key=repr))
+            seen |= names
+            self.tokens.append({})
+            self.token_index.append(_JoinIndex(shared) if ix else None)
+            self.fact_index.append(_JoinIndex(shared) if ix else None)
+        self.by_fact: Dict[int, Set[Tuple[int, Token]]] = {}
+
+    def add_fact(self, ix: int, handle: int, groups: Dict, emit: List[Tuple[_Rule, Token]]):
+        if ix:
+            self.fact_index[ix].add(handle, groups)
+            index = self.token_index[ix]
+            previous = self.tokens[ix - 1]
+            for token in list(index.candidates(groups, previous)):
+                token_groups = previous.get(token)
+                if token_groups is not None and handle not in token and _compatible(token_groups, groups):
+                    self._add_token(ix, token + (handle,), {**token_groups, **groups}, emit)
+        else:
+            self._add_token(0, (handle,), dict(groups), emit)
+
+    def _add_token(self, ix: int, token: Token, groups: Dict, emit: List[Tuple[_Rule, Token]]):
+        self.tokens[ix][token] = groups
+        for handle in token:
+            self.by_fact.setdefault(handle, set()).add((ix, token))
+        following = ix + 1
+        if following == len(self.alphas):
+            emit.append((self, token))
+            return
+        self.token_index[following].add(token, groups)
+        memory = self.alphas[following].memory
+        for handle in list(self.fact_index[following].candidates(groups, memory)):
+            fact_groups = memory.get(handle)
+            if fact_groups is not None and handle not in token and _compatible(groups, fact_groups):
+                self._add_token(following, token + (handle,), {**groups, **fact_groups}, emit)
+
+    def remove_fact(self, handle: int, removed: List[Tuple[_Rule, Token, Dict]]):
+        for ix, alpha in enumerate(self.alphas):
+            if ix and handle in alpha.memory:
+                self.fact_index[ix].discard(handle, alpha.memory[handle])
+        for ix, token in self.by_fact.pop(handle, ()):
+            groups = self.tokens[ix].pop(token, None)
+            if groups is None:
+                continue
+            for other in token:
+                if other != handle:
+                    self.by_fact.get(other, set()).discard((ix, token))
+            if ix + 1 == len(self.alphas):
+                removed.append((self, token, groups))
+            else:
+                self.token_index[ix + 1].discard(token, groups)
+
+
+class Rete:
+    """Incrementally maintains all matches of rules over a changing set of facts.
+
+    A rule is a sequence of patterns, each of which has to match a different fact. Captures with the same name have to
+    capture equal values across all facts of a match, which is how facts are correlated. Every distinct pattern is an
+    alpha node which remembers the facts it matches; rules join these on their shared captures, remembering partial
+    matches, so adding or removing a fact only touches the matches it takes part in.
+
+    Example:
+        >>> rete = Rete(on_match=print)
+        >>> rete.add_rule('paid', {'type': 'order', 'id': 'order_id' @ _},
+        ...                       {'type': 'payment', 'order': 'order_id' @ _})
+        >>> order = rete.add({'type': 'order', 'id': 17})
+        >>> payment = rete.add({'type': 'payment', 'order': 17})
+        ReteMatch(rule='paid', handles=(0, 1), facts=(...), groups={'order_id': 17})
+        >>> rete.matches('paid')
+        [ReteMatch(rule='paid', handles=(0, 1), facts=(...), groups={'order_id': 17})]
+
+    Args:
+        on_match (callable, optional): Invoked with every `ReteMatch` that comes into existence.
+        on_retract (callable, optional): Invoked with every `ReteMatch` that ceases to exist as a fact is removed.
+    """
+
+    def __init__(self, *, on_match: Optional[Callable[[ReteMatch], Any]] = None,
+                 on_retract: Optional[Callable[[ReteMatch], Any]] = None):
+        self._on_match = on_match
+        self._on_retract = on_retract
+        self._alphas: List[_Alpha] = []
+        self._rules: Dict[Hashable, _Rule] = {}
+        self._facts: Dict[int, Any] = {}
+        self._handles = count()
+
+    def _alpha(self, pattern) -> _Alpha:
+        for alpha in self._alphas:
+            if type(alpha.pattern) == type(pattern) and alpha.pattern == pattern:
+                return alpha
+        alpha = _Alpha(pattern)
+        for handle, fact in self._facts.items():
+            result = match(fact, pattern)
+            if result:
+                alpha.memory[handle] = dict(result.groups())
+        self._alphas.append(alpha)
+        return alpha
+
+    def add_rule(self, rule_id: Hashable, *patterns):
+        """Adds a rule, matching it against the facts already present."""
+        if not patterns:
+            raise ValueError("a rule needs at least one pattern")
+        if rule_id in self._rules:
+            self.remove_rule(rule_id)
+        rule = _Rule(rule_id, [self._alpha(p) for p in patterns])
+        self._rules[rule_id] = rule
+        emit = []
+        for ix, alpha in enumerate(rule.alphas):
+            alpha.users.append((rule, ix))
+        # seed the network in the order facts were added, which is the same result as adding them one by one
+        for handle in sorted({h for alpha in rule.alphas for h in alpha.memory}):
+            for ix, alpha in enumerate(rule.alphas):
+                if handle in alpha.memory:
+                    rule.add_fact(ix, handle, alpha.memory[handle], emit)
+        self._emit(emit)
+
+    def remove_rule(self, rule_id: Hashable):
+        rule = self._rules.pop(rule_id)
+        for alpha in rule.alphas:
+            alpha.users = [(r, ix) for r, ix in alpha.users if r is not rule]
+        self._alphas = [alpha for alpha in self._alphas if alpha.users]
+
+    def add(self, fact) -> int:
+        """Adds a fact and returns a handle for it, which can be used to remove it again."""
+        handle = next(self._handles)
+        self._facts[handle] = fact
+        emit = []
+        for alpha in self._alphas:
+            result = match(fact, alpha.pattern)
+            if result:
+                alpha.memory[handle] = groups = dict(result.groups())
+                for rule, ix in alpha.users:
+                    rule.add_fact(ix, handle, groups, emit)
+        self._emit(emit)
+        return handle
+
+    def remove(self, handle: int):
+        """Removes the fact with the given handle, along with all matches it took part in."""
+        removed = []
+        for rule in self._rules.values():
+            rule.remove_fact(handle, removed)
+        for alpha in self._alphas:
+            alpha.memory.pop(handle, None)
+        if self._on_retract is not None:
+            for rule, token, groups in removed:
+                self._on_retract(self._to_match(rule, token, groups))
+        del self._facts[handle]
+
+    def matches(self, rule_id: Hashable) -> List[ReteMatch]:
+        rule = self._rules[rule_id]
+        return [self._to_match(rule, token, groups) for token, groups in rule.tokens[-1].items()]
+
+    def facts(self) -> Dict[int, Any]:
+        return dict(self._facts)
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def _to_match(self, rule: _Rule, token: Token, groups: Dict) -> ReteMatch:
+        return ReteMatch(rule.id, token, tuple(self._facts[h] for h in token), groups)
+
+    def _emit(self, emit: List[Tuple[_Rule, Token]]):
+        if self._on_match is not None:
+            for rule, token in emit:
+                self._on_match(self._to_match(rule, token, rule.tokens[-1][token]))
@@ -0,0 +1,399 @@
+"""A compact and portable serialization of patterns, for sending them to worker processes or keeping them on disk.
+
+A serialized pattern is a JSON document holding a table of nodes. Every node refers to other nodes by their index in
+the table, which always comes before the node itself, so the table is read in one go without recursion:
+
+    {"apm": 1, "nodes": [["g", "apm.patterns", "InstanceOf"], ["t", "K", [0], "_type"], ["g", "builtins", "int"],
+                         ["t", [2]], ["o", [1], [3]]], "root": [4]}
+
+A sub-pattern which is used several times is stored only once (sharing is kept when reading it back in), and so are
+sub-patterns which are structurally equal (like `interning.InternTable` would share them), except for wildcards which
+are distinguished by identity.
+
+The classes of apm and builtin types are referred to by module and name. Any other function or class (including
+enums, dataclasses, and the classes of values which are written the way `pickle` would do it) has to be given a name
+in a `FunctionRegistry`, and the same name has to be registered with the process reading the pattern. Reading a
+pattern never imports or calls anything else, so that a document can not make the reader run arbitrary code.
+"""
+from __future__ import annotations
+
+import base64
+import copyreg
+import enum
+import importlib
+import json
+import math
+import operator as ops
+import pkgutil
+import re
+import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .cache import ResultCache
+from .core import Capture, Underscore, _, _get_dataclass_fields
+from .generic import AutoEqHash, _attributes
+
+FORMAT_VERSION = 1
+
+
+class SerializationError(ValueError):
+    pass
+
+
+class FunctionRegistry:
+    """Names for the functions and classes (other than those of apm and builtin types) which patterns refer to, so
+    that these patterns can be serialized. Deserializing such a pattern requires the same names to be registered.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[str, Callable] = {}
+        # by id, the function is kept alive by the entry so that its id is not reused
+        self._by_id: Dict[int, Tuple[str, Callable]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, f: Optional[Callable] = None, *, name: Optional[str] = None):
+        """Registers the given function or class under the given name (defaults to its module and qualified name,
+        lambdas always need a name). Can be used as a decorator, with or without arguments."""
+        if f is None:
+            return lambda g: self.register(g, name=name)
+        if name is None:
+            if f.__name__ == '<lambda>':
+                raise ValueError("a lambda needs to be registered using an explicit name")
+            name = f"{f.__module__}.{f.__qualname__}"
+        with self._lock:
+            existing = self._by_name.get(name)
+            if existing is not None and existing is not f:
+                raise ValueError(f"another function is registered as {name!r} already")
+            self._by_name[name] = f
+            self._by_id[id(f)] = (name, f)
+        return f
+
+    def name_of(self, f: Callable) -> Optional[str]:
+        entry = self._by_id.get(id(f))
+        return entry[0] if entry is not None and entry[1] is f else None
+
+    def lookup(self, name: str) -> Callable:
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise SerializationError(f"no function is registered as {name!r}") from None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __len__(self):
+        return len(self._by_name)
+
+
+functions = FunctionRegistry()
+
+
+def register_function(f: Optional[Callable] = None, *, name: Optional[str] = None):
+    """Registers a function with the default `FunctionRegistry`, see `FunctionRegistry.register`."""
+    return functions.register(f, name=name)
+
+
+_PACKAGE = __name__.rpartition('.')[0]
+_PACKAGE_MODULES = frozenset({_PACKAGE} | {f'{_PACKAGE}.{module.name}'
+                                           for module in pkgutil.iter_modules(sys.modules[_PACKAGE].__path__)})
+
+# the builtin types which patterns and the values in them are made of, by name
+_BUILTIN_TYPES = {t.__qualname__: t for t in (bool, bytearray, bytes, complex, dict, float, frozenset, int, list, object,
+                                              range, set, slice, str, tuple, type(None), type(...))}
+
+# the comparisons kept by `Between`, and the function needed to read objects written the way `pickle` would do it (given
+# their classes are allowed)
+_ALLOWED_FUNCTIONS = {(f.__module__, f.__qualname__): f for f in (ops.lt, ops.le, ops.gt, ops.ge, copyreg.__newobj__)}
+
+
+def _allowed_global(module: str, qualname: str):
+    """The object which may be referred to by the given module and name, rather than by a name in a `FunctionRegistry`:
+    a class defined by apm, one of `_BUILTIN_TYPES`, or one of `_ALLOWED_FUNCTIONS`. None for anything else.
+
+    The name is looked up in the module itself, never in anything the module holds, and no module other than those of
+    apm is imported."""
+    obj = _ALLOWED_FUNCTIONS.get((module, qualname))
+    if obj is not None:
+        return obj
+    if module == 'builtins':
+        return _BUILTIN_TYPES.get(qualname)
+    if module not in _PACKAGE_MODULES:
+        return None
+    obj = vars(importlib.import_module(module)).get(qualname)
+    if isinstance(obj, type) and obj.__module__ == module and obj.__qualname__ == qualname:
+        return obj
+    return None
+
+
+def _global_name(obj) -> Optional[Tuple[str, str]]:
+    """The module and qualified name by which the given object may be referred to, if any."""
+    module = getattr(obj, '__module__', None)
+    qualname = getattr(obj, '__qualname__', None)
+    if not isinstance(module, str) or not isinstance(qualname, str) or _allowed_global(module, qualname) is not obj:
+        return None
+    return module, qualname
+
+
+def _callable(f, args, registry: FunctionRegistry) -> bool:
+    """Whether a document may have the given function called with the given arguments while it is read: a registered
+    function, an allowed class, or `copyreg.__newobj__` creating an instance of one of these."""
+    if f is copyreg.__newobj__:
+        return bool(args) and isinstance(args[0], type) and _callable(args[0], (), registry)
+    return registry.name_of(f) is not None or _global_name(f) is not None and isinstance(f, type)
+
+
+def _scalar_key(item):
+    # node keys tell 1, 1.0, and True apart (== does not), references are lists
+    if type(item) is list:
+        return 'ref', item[0]
+    return type(item), item
+
+
+def _unregistered(value) -> SerializationError:
+    return SerializationError(f"{value!r} can not be referred to by module and name, it has to be registered with a "
+                              f"FunctionRegistry (see `register_function`)")
+
+
+class _Encoder:
+
+    def __init__(self, registry: FunctionRegistry):
+        self.registry = registry
+        self.nodes: List[list] = []
+        # by id of the object, the object is kept as well so that its id is not reused while encoding
+        self._by_id: Dict[int, Tuple[list, Any]] = {}
+        self._shared: Dict[Tuple, list] = {}
+        self._schemas: Dict[Tuple[type, Tuple[str, ...]], list] = {}
+
+    def encode(self, value):
+        t = type(value)
+        if value is None or t is bool or t is int or t is str:
+            return value
+        if t is float and math.isfinite(value):
+            return value
+        entry = self._by_id.get(id(value))
+        if entry is not None:
+            return entry[0]
+        node, shared = self._node(value)
+        ref = None
+        if shared:
+            key = tuple(_scalar_key(item) for item in node)
+            ref = self._shared.get(key)
+            if ref is None:
+                ref = self._shared[key] = [len(self.nodes)]
+                self.nodes.append(node)
+        else:
+            ref = [len(self.nodes)]
+            self.nodes.append(node)
+        self._by_id[id(value)] = (ref, value)
+        return ref
+
+    def _global(self, value) -> Optional[list]:
+        name = _global_name(value)
+        if name is None:
+            return None
+        return ['g', *name]
+
+    def _node(self, value) -> Tuple[list, bool]:
+        """The node for the given value and whether it may be shared with structurally equal values."""
+        encode = self.encode
+        t = type(value)
+        if value is _:
+            return ['_'], True
+        if t is tuple:
+            return ['t', *(encode(item) for item in value)], True
+        if t is list:
+            return ['l', *(encode(item) for item in value)], True
+        if t is dict:
+            node = ['d']
+            for k, v in value.items():
+                node.append(encode(k))
+                node.append(encode(v))
+            return node, True
+        if t is float:
+            return ['F', repr(value)], True
+        if t is frozenset or t is set:
+            return ['S' if t is frozenset else 's', *(encode(item) for item in value)], True
+        if t is bytes:
+            return ['b', base64.b64encode(value).decode('ascii')], True
+        if t is complex:
+            return ['c', encode(value.real), encode(value.imag)], True
+        if value is ...:
+            return ['...'], True
+        if t is re.Pattern:
+            return ['r', encode(value.pattern), value.flags], True
+        if t is ResultCache:
+            # a fresh cache with the same settings, which is shared by the same patterns as the original one
+            return ['C', value.maxsize, value.ttl, value.identity], False
+        if callable(value):
+            name = self.registry.name_of(value)
+            if name is not None:
+                return ['f', name], True
+            inner = getattr(value, '__apm_pure__', None)
+            if callable(inner):
+                # the wrapper created by `pure()`, which can be referred to by name if it was used as a decorator
+                return self._global(value) or ['p', encode(inner)], True
+        if isinstance(value, enum.Enum):
+            return ['E', encode(type(value)), value.name], True
+        if isinstance(value, type) or callable(value) and not isinstance(value, AutoEqHash):
+            node = self._global(value)
+            if node is not None:
+                return node, True
+            if isinstance(value, type) or getattr(value, '__self__', None) is None:
+                raise _unregistered(value)
+        if isinstance(value, AutoEqHash):
+            if isinstance(value, Capture) and value._target is not None:  # pylint: disable=protected-access
+                raise SerializationError("a capture into a target can not be serialized")
+            attributes = _attributes(value)
+            node = ['o', self._schema(type(value), tuple(attributes))]
+            node.extend(encode(attribute) for attribute in attributes.values())
+            # wildcards are told apart by identity
+            return node, not isinstance(value, Underscore)
+        fields = _get_dataclass_fields(t)
+        if fields is not None:
+            node = ['D', encode(t)]
+            for name, getter in fields:
+                node.append(name)
+                node.append(encode(getter(value)))
+            return node, True
+        return self._reduced(value), False
+
+    def _schema(self, cls: type, names: Tuple[str, ...]) -> list:
+        """A node holding the class and the names of the attributes, shared by all objects which look alike."""
+        key = (cls, names)
+        ref = self._schemas.get(key)
+        if ref is None:
+            ref = self._schemas[key] = self.encode(('K', cls, *names))
+        return ref
+
+    def _reduced(self, value) -> list:
+        """Anything else is encoded the way `pickle` would do it, using `__reduce_ex__`."""
+        try:
+            reduced = value.__reduce_ex__(4)
+        except Exception as e:
+            raise SerializationError(f"{value!r} can not be serialized") from e
+        if isinstance(reduced, str):
+            node = self._global(value)
+            if node is None:
+                raise _unregistered(value)
+            return node
+        f, args, state, list_items, dict_items = (*reduced, None, None, None)[:5]
+        if list_items is not None or dict_items is not None:
+            raise SerializationError(f"{value!r} can not be serialized")
+        return ['x', self.encode(f), self.encode(args), self.encode(state)]
+
+
+def _set_state(obj, state):
+    setstate = getattr(obj, '__setstate__', None)
+    if setstate is not None:
+        setstate(state)
+        return
+    slot_state = None
+    if isinstance(state, tuple) and len(state) == 2:
+        state, slot_state = state
+    if state:
+        obj.__dict__.update(state)
+    if slot_state:
+        for k, v in slot_state.items():
+            setattr(obj, k, v)
+
+
+def _decode_nodes(nodes: List[list], registry: FunctionRegistry) -> List:
+    objects: List = []
+
+    def value(v):
+        return objects[v[0]] if type(v) is list else v
+
+    for node in nodes:
+        tag = node[0]
+        if tag == 'o':
+            _tag, cls, *names = objects[node[1][0]]
+            if not (isinstance(cls, type) and issubclass(cls, AutoEqHash)):
+                raise SerializationError(f"{cls!r} is not a pattern class")
+            obj = cls.__new__(cls)
+            for name, v in zip(names, node[2:]):
+                setattr(obj, name, objects[v[0]] if type(v) is list else v)
+            obj._derive()  # pylint: disable=protected-access
+        elif tag == 'g':
+            module, qualname = node[1], node[2]
+            obj = _allowed_global(module, qualname)
+            if obj is None:
+                raise SerializationError(f"{module}.{qualname} has to be registered with a FunctionRegistry")
+        elif tag == 't':
+            obj = tuple(value(v) for v in node[1:])
+        elif tag == 'd':
+            obj = {value(node[i]): value(node[i + 1]) for i in range(1, len(node), 2)}
+        elif tag == 'l':
+            obj = [value(v) for v in node[1:]]
+        elif tag == '_':
+            obj = _
+        elif tag == '...':
+            obj = ...
+        elif tag == 'f':
+            obj = registry.lookup(node[1])
+        elif tag == 'p':
+            from .patterns import pure  # pylint: disable=import-outside-toplevel
+            obj = pure(value(node[1]))
+        elif tag == 'E':
+            cls = value(node[1])
+            if not isinstance(cls, enum.EnumMeta):
+                raise SerializationError(f"{cls!r} is not an enum")
+            obj = cls[node[2]]
+        elif tag == 'D':
+            cls = value(node[1])
+            if not isinstance(cls, type) or _get_dataclass_fields(cls) is None:
+                raise SerializationError(f"{cls!r} is not a dataclass")
+            obj = cls.__new__(cls)
+            for i in range(2, len(node), 2):
+                object.__setattr__(obj, node[i], value(node[i + 1]))
+        elif tag == 'r':
+            obj = re.compile(value(node[1]), node[2])
+        elif tag == 'F':
+            obj = float(node[1])
+        elif tag == 'S':
+            obj = frozenset(value(v) for v in node[1:])
+        elif tag == 's':
+            obj = {value(v) for v in node[1:]}
+        elif tag == 'b':
+            obj = base64.b64decode(node[1])
+        elif tag == 'c':
+            obj = complex(value(node[1]), value(node[2]))
+        elif tag == 'C':
+            obj = ResultCache(node[1], ttl=node[2], identity=node[3])
+        elif tag == 'x':
+            f, args = value(node[1]), value(node[2])
+            if not _callable(f, args, registry):
+                raise SerializationError(f"{f!r} may not be called when reading a pattern, it has to be registered with "
+                                         f"a FunctionRegistry")
+            obj = f(*args)
+            state = value(node[3])
+            if state is not None:
+                _set_state(obj, state)
+        else:
+            raise SerializationError(f"unknown node {tag!r}")
+        objects.append(obj)
+    return objects
+
+
+def serialize(pattern, *, registry: Optional[FunctionRegistry] = None) -> bytes:
+    """Serializes the given pattern, see `apm.serialization`. Raises a `SerializationError` if the pattern refers to
+    something which can not be serialized (like a lambda which has not been registered or a capture into a target)."""
+    encoder = _Encoder(functions if registry is None else registry)
+    root = encoder.encode(pattern)
+    return json.dumps({'apm': FORMAT_VERSION, 'nodes': encoder.nodes, 'root': root},
+                      separators=(',', ':'), ensure_ascii=False).encode('utf8')
+
+
+def deserialize(data: Union[bytes, str], *, registry: Optional[FunctionRegistry] = None):
+    """Reads a pattern written by `serialize`, looking up functions by name in the given registry (defaults to the one
+    used by `register_function`)."""
+    try:
+        document = json.loads(data)
+        version = document['apm']
+    except (ValueError, TypeError, KeyError) as e:
+        raise SerializationError("not a serialized pattern") from e
+    if version != FORMAT_VERSION:
+        raise SerializationError(f"unsupported format version {version!r}")
+    objects = _decode_nodes(document['nodes'], functions if registry is None else registry)
+    root = document['root']
+    return objects[root[0]] if type(root) is list else root
@@ -0,0 +1,433 @@
+"""Probabilistic data structures which summarize a stream of values in bounded memory, the aggregates of the
+approximate aggregations in `apm.agg`. All of them can be merged with one of the same configuration, such that parts of
+the stream can be summarized separately (in other processes even, the hashes do not depend on `PYTHONHASHSEED`)."""
+
+from __future__ import annotations
+
+import heapq
+import math
+import random
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .cache import value_key
+
+
+def _encode(value) -> bytes:
+    """The bytes which a value is hashed by: equal for values which are indistinguishable by patterns (see `value_key`),
+    otherwise (dicts, lists, ...) for values of the same type which have the same `repr`."""
+    t = type(value)
+    if t is str:
+        return b's' + value.encode('utf8', 'surrogatepass')
+    if t is bytes:
+        return b'b' + value
+    if t is int:
+        return b'i' + str(value).encode('ascii')
+    key = value_key(value)
+    if key is None:
+        key = t, repr(value)
+    return b'r' + repr(key).encode('utf8', 'surrogatepass')
+
+
+def hash64(value) -> int:
+    """A 64 bit hash of the given value which is the same in every process."""
+    return int.from_bytes(blake2b(_encode(value), digest_size=8).digest(), 'little')
+
+
+def _hash128(value) -> int:
+    return int.from_bytes(blake2b(_encode(value), digest_size=16).digest(), 'little')
+
+
+def _alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class HyperLogLog:
+    """Estimates the number of distinct values added to it, using `2 ** precision` one-byte registers (Flajolet et al.,
+    2007). The relative standard error is `1.04 / sqrt(2 ** precision)`. Small sketches keep the registers which are
+    set in a dict, such that there is no need to allocate all of them for a few values."""
+    __slots__ = ('precision', '_registers', '_sparse')
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision must be between 4 and 18, not {precision}")
+        self.precision = precision
+        self._registers: Optional[bytearray] = None
+        self._sparse: Dict[int, int] = {}
+
+    @staticmethod
+    def precision_for(error: float) -> int:
+        """The least precision which has at most the given relative standard error."""
+        if not 0 < error < 1:
+            raise ValueError(f"error must be between 0 and 1, not {error}")
+        return min(max(math.ceil(2 * math.log2(1.04 / error)), 4), 18)
+
+    def add(self, value):
+        self._set(hash64(value))
+
+    def _set(self, h: int):
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        registers = self._registers
+        if registers is not None:
+            if rank > registers[index]:
+                registers[index] = rank
+            return
+        sparse = self._sparse
+        if rank > sparse.get(index, 0):
+            sparse[index] = rank
+            if len(sparse) > (1 << self.precision) >> 6:
+                self._densify()
+
+    def _densify(self) -> bytearray:
+        registers = self._registers
+        if registers is None:
+            registers = self._registers = bytearray(1 << self.precision)
+            for index, rank in self._sparse.items():
+                registers[index] = rank
+            self._sparse = {}
+        return registers
+
+    def merge(self, other: HyperLogLog) -> HyperLogLog:
+        """Adds everything which has been added to the other sketch to this one."""
+        if other.precision != self.precision:
+            raise ValueError(f"can not merge sketches of precision {self.precision} and {other.precision}")
+        if other._registers is None:
+            for index, rank in other._sparse.items():
+                if self._registers is not None:
+                    if rank > self._registers[index]:
+                        self._registers[index] = rank
+                elif rank > self._sparse.get(index, 0):
+                    self._sparse[index] = rank
+            if self._registers is None and len(self._sparse) > (1 << self.precision) >> 6:
+                self._densify()
+        else:
+            self._registers = bytearray(map(max, self._densify(), other._registers))
+        return self
+
+    def estimate(self) -> float:
+        m = 1 << self.precision
+        if self._registers is None:
+            ranks = Counter(self._sparse.values())
+            ranks[0] = m - len(self._sparse)
+        else:
+            ranks = Counter(self._registers)
+        estimate = _alpha(m) * m * m / math.fsum(count * 2.0 ** -rank for rank, count in ranks.items())
+        zeros = ranks[0]
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+    def __len__(self):
+        return round(self.estimate())
+
+    def copy(self) -> HyperLogLog:
+        result = HyperLogLog(self.precision)
+        if self._registers is not None:
+            result._registers = bytearray(self._registers)
+        result._sparse = {**self._sparse}
+        return result
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return _restore_hyperloglog, (self.precision, None if self._registers is None else bytes(self._registers),
+                                      self._sparse)
+
+    def __repr__(self):
+        return f"HyperLogLog(precision={self.precision}, estimate={self.estimate():.0f})"
+
+
+def _restore_hyperloglog(precision: int, registers: Optional[bytes], sparse: Dict[int, int]) -> HyperLogLog:
+    result = HyperLogLog(precision)
+    if registers is not None:
+        result._registers = bytearray(registers)
+    result._sparse = sparse
+    return result
+
+
+class CountMinSketch:
+    """Estimates how often each value has been added to it using `depth` rows of `width` counters (Cormode and
+    Muthukrishnan, 2005). An estimate is never too low, and with a probability of `1 - delta` at most
+    `epsilon * total` too high, for a sketch made by `for_error(epsilon, delta)`. Until a few distinct values have
+    been added the counts are kept exactly, without allocating the counters."""
+    __slots__ = ('width', 'depth', 'total', '_table', '_pending')
+
+    # how many distinct values are counted exactly before the counters are allocated
+    _PENDING = 64
+
+    def __init__(self, width: int = 2719, depth: int = 5):
+        if width < 1 or depth < 1:
+            raise ValueError("width and depth must be at least 1")
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._table: Optional[array] = None
+        self._pending: Dict[int, int] = {}
+
+    @classmethod
+    def for_error(cls, epsilon: float = 0.001, delta: float = 0.01) -> CountMinSketch:
+        if not 0 < epsilon < 1 or not 0 < delta < 1:
+            raise ValueError("epsilon and delta must be between 0 and 1")
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def _cells(self, h: int) -> Iterator[int]:
+        # one hash gives all the rows (Kirsch and Mitzenmacher, 2006)
+        h1, h2 = h & 0xFFFFFFFFFFFFFFFF, (h >> 64) | 1
+        width = self.width
+        return (row * width + (h1 + row * h2) % width for row in range(self.depth))
+
+    def add(self, value, count: int = 1):
+        self._count(_hash128(value), count)
+        self.total += count
+
+    def _count(self, h: int, count: int):
+        table = self._table
+        if table is None:
+            pending = self._pending
+            pending[h] = pending.get(h, 0) + count
+            if len(pending) > self._PENDING:
+                self._allocate()
+            return
+        for cell in self._cells(h):
+            table[cell] += count
+
+    def _allocate(self) -> array:
+        table = self._table
+        if table is None:
+            table = self._table = array('q', bytes(8 * self.width * self.depth))
+            pending, self._pending = self._pending, {}
+            for h, count in pending.items():
+                for cell in self._cells(h):
+                    table[cell] += count
+        return table
+
+    def estimate(self, value) -> int:
+        h = _hash128(value)
+        if self._table is None:
+            return self._pending.get(h, 0)
+        table = self._table
+        return min(table[cell] for cell in self._cells(h))
+
+    __getitem__ = estimate
+
+    def merge(self, other: CountMinSketch) -> CountMinSketch:
+        """Adds everything which has been added to the other sketch to this one."""
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError(f"can not merge sketches of {self.depth}x{self.width} and {other.depth}x{other.width}")
+        if other._table is None:
+            for h, count in other._pending.items():
+                self._count(h, count)
+        else:
+            table = self._allocate()
+            for cell, count in enumerate(other._table):
+                if count:
+                    table[cell] += count
+        self.total += other.total
+        return self
+
+    def copy(self) -> CountMinSketch:
+        result = CountMinSketch(self.width, self.depth)
+        result.total = self.total
+        if self._table is not None:
+            result._table = array('q', self._table)
+        result._pending = {**self._pending}
+        return result
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return _restore_count_min_sketch, (self.width, self.depth, self.total, self._table, self._pending)
+
+    def __repr__(self):
+        return f"CountMinSketch(width={self.width}, depth={self.depth}, total={self.total})"
+
+
+def _restore_count_min_sketch(width: int, depth: int, total: int, table: Optional[array],
+                              pending: Dict[int, int]) -> CountMinSketch:
+    result = CountMinSketch(width, depth)
+    result.total = total
+    result._table = table
+    result._pending = pending
+    return result
+
+
+class SpaceSaving:
+    """Keeps track of the `capacity` most frequent values (Metwally et al., 2005). The count of a value is never too
+    low, and at most `error(value)` too high, which is at most `total / capacity`. Any value which has been added more
+    than `total / capacity` times is guaranteed to be tracked. Values need to be hashable."""
+    __slots__ = ('capacity', 'total', '_counts', '_errors')
+
+    def __init__(self, capacity: int = 100):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[Any, int] = {}
+        self._errors: Dict[Any, int] = {}
+
+    def add(self, value, count: int = 1):
+        self.total += count
+        counts = self._counts
+        if value in counts:
+            counts[value] += count
+        elif len(counts) < self.capacity:
+            counts[value] = count
+            self._errors[value] = 0
+        else:
+            # the least frequent value makes room, the new one might have been it all along
+            victim = min(counts, key=counts.__getitem__)
+            floor = counts.pop(victim)
+            del self._errors[victim]
+            counts[value] = floor + count
+            self._errors[value] = floor
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Any, int]]:
+        """The `n` (or all tracked) values with the highest counts, like `collections.Counter.most_common`."""
+        if n is None:
+            return sorted(self._counts.items(), key=itemgetter(1), reverse=True)
+        return heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+    def __getitem__(self, value) -> int:
+        return self._counts.get(value, 0)
+
+    def __contains__(self, value):
+        return value in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def error(self, value) -> int:
+        """How much the count of the given value might be too high."""
+        return self._errors.get(value, 0)
+
+    def _floor(self) -> int:
+        # what a value which is not tracked might have been counted, had it been
+        if len(self._counts) < self.capacity:
+            return 0
+        return min(self._counts.values())
+
+    def merge(self, other: SpaceSaving) -> SpaceSaving:
+        """Adds everything which has been added to the other summary to this one (Agarwal et al., 2012)."""
+        if other.capacity != self.capacity:
+            raise ValueError(f"can not merge summaries of capacity {self.capacity} and {other.capacity}")
+        floor, other_floor = self._floor(), other._floor()
+        counts, errors = {}, {}
+        for value in {**self._counts, **other._counts}:
+            counts[value] = self._counts.get(value, floor) + other._counts.get(value, other_floor)
+            errors[value] = self._errors.get(value, floor) + other._errors.get(value, other_floor)
+        if len(counts) > self.capacity:
+            counts = dict(heapq.nlargest(self.capacity, counts.items(), key=itemgetter(1)))
+        self._counts = counts
+        self._errors = {value: errors[value] for value in counts}
+        self.total += other.total
+        return self
+
+    def copy(self) -> SpaceSaving:
+        result = SpaceSaving(self.capacity)
+        result.total = self.total
+        result._counts = {**self._counts}
+        result._errors = {**self._errors}
+        return result
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return _restore_space_saving, (self.capacity, self.total, self._counts, self._errors)
+
+    def __repr__(self):
+        return f"SpaceSaving(capacity={self.capacity}, most_common={self.most_common(3)})"
+
+
+def _restore_space_saving(capacity: int, total: int, counts: Dict, errors: Dict) -> SpaceSaving:
+    result = SpaceSaving(capacity)
+    result.total = total
+    result._counts = counts
+    result._errors = errors
+    return result
+
+
+class Reservoir:
+    """A uniform random sample of at most `size` of the values added to it (Vitter's algorithm R): Each of the `seen`
+    values is in the sample with the same probability."""
+    __slots__ = ('size', 'seen', 'items', '_random')
+
+    def __init__(self, size: int = 100, seed=None):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.seen = 0
+        self.items: List = []
+        self._random = random.Random(seed)
+
+    def add(self, value):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(value)
+        else:
+            index = self._random.randrange(self.seen)
+            if index < self.size:
+                self.items[index] = value
+
+    def merge(self, other: Reservoir) -> Reservoir:
+        """Makes this a sample of all of the values which have been added to either reservoir."""
+        if other.size != self.size:
+            raise ValueError(f"can not merge reservoirs of size {self.size} and {other.size}")
+        # draw without replacement from both populations, each sample standing in for the values it was taken from
+        mine, theirs = [*self.items], [*other.items]
+        remaining_mine, remaining_theirs = self.seen, other.seen
+        rnd = self._random
+        items = []
+        while len(items) < self.size and remaining_mine + remaining_theirs:
+            if rnd.randrange(remaining_mine + remaining_theirs) < remaining_mine:
+                pool = mine
+                remaining_mine -= 1
+            else:
+                pool = theirs
+                remaining_theirs -= 1
+            index = rnd.randrange(len(pool))
+            pool[index], pool[-1] = pool[-1], pool[index]
+            items.append(pool.pop())
+        self.items = items
+        self.seen += other.seen
+        return self
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def copy(self) -> Reservoir:
+        result = Reservoir(self.size)
+        result.seen = self.seen
+        result.items = [*self.items]
+        result._random.setstate(self._random.getstate())
+        return result
+
+    __copy__ = copy
+
+    def __reduce__(self):
+        return _restore_reservoir, (self.size, self.seen, self.items, self._random.getstate())
+
+    def __repr__(self):
+        return f"Reservoir(size={self.size}, seen={self.seen}, items={self.items!r})"
+
+
+def _restore_reservoir(size: int, seen: int, items: List, state) -> Reservoir:
+    result = Reservoir(size)
+    result.seen = seen
+    result.items = items
+    result._random.setstate(state)
+    return result
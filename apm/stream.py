@@ -0,0 +1,275 @@
+"""Routing a stream of values to asynchronous handlers by pattern, like a `case(...)` chain for every value.
+
+```python
+dispatcher = Dispatcher()
+
+@dispatcher.on({'type': 'login', 'user': 'user' @ _}, concurrency=4)
+async def login(user):
+    ...
+
+stats = await dispatcher.run(events)
+```
+
+Every case has a queue of at most `backlog` values and `concurrency` tasks which call the handler. Reading from the
+source waits while the queue of the case a value is routed to is full, so a handler which lags slows down the reading
+instead of values piling up in memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from ._util import call
+from .compiler import CompiledPattern
+from .core import MatchResult, OneOf, apply
+from .sketches import Reservoir
+
+# values routed without giving other tasks a chance to run, when the source never has to wait for values
+_YIELD_EVERY = 64
+
+
+@dataclasses.dataclass(frozen=True)
+class CaseStats:
+    __slots__ = ('name', 'matched', 'handled', 'failed', 'queued', 'running', 'throughput', 'latency',
+                 'latency_p50', 'latency_p99', 'max_latency')
+
+    name: str
+    matched: int
+    handled: int
+    failed: int
+    queued: int
+    running: int
+    # handled (or failed) values per second since the dispatcher has been started
+    throughput: float
+    # seconds it took a handler to handle a value, the percentiles are estimated from a sample
+    latency: float
+    latency_p50: float
+    latency_p99: float
+    max_latency: float
+
+
+class _Case:
+    __slots__ = ('name', 'pattern', 'compiled', 'handler', 'concurrency', 'backlog', 'is_default', 'queue',
+                 'matched', 'handled', 'failed', 'running', 'total_latency', 'max_latency', 'latencies')
+
+    def __init__(self, name: str, pattern, handler: Callable[..., Awaitable], *, concurrency: int, backlog: int,
+                 is_default: bool = False):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if backlog < 1:
+            raise ValueError("backlog must be at least 1")
+        self.name = name
+        self.pattern = pattern
+        self.compiled = None if is_default else CompiledPattern(pattern)
+        self.handler = handler
+        self.concurrency = concurrency
+        self.backlog = backlog
+        self.is_default = is_default
+        self.queue: Optional[asyncio.Queue] = None
+        self.matched = 0
+        self.handled = 0
+        self.failed = 0
+        self.running = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.latencies = Reservoir(1024, seed=0)
+
+    def invoke(self, value, result: Optional[MatchResult]) -> Awaitable:
+        if result is None:
+            return call(self.handler, value)
+        return apply(self.handler, result)
+
+    def stats(self, elapsed: float) -> CaseStats:
+        done = self.handled + self.failed
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+
+        return CaseStats(
+            name=self.name,
+            matched=self.matched,
+            handled=self.handled,
+            failed=self.failed,
+            queued=0 if self.queue is None else self.queue.qsize(),
+            running=self.running,
+            throughput=done / elapsed if elapsed > 0 else 0.0,
+            latency=self.total_latency / done if done else 0.0,
+            latency_p50=percentile(0.5),
+            latency_p99=percentile(0.99),
+            max_latency=self.max_latency,
+        )
+
+
+class Dispatcher:
+    """Routes every value from an async iterable to the first case whose pattern it matches (in the order the cases
+    have been added), calling the handler of the case with the captures like `match(value, pattern, handler)` would.
+    The `otherwise` case gets the values which do not match any of the patterns, as the only argument.
+
+    Handlers are coroutine functions. If a handler raises, `on_error(name, value, exception)` is called, or, if there
+    is no `on_error`, the dispatcher stops and `run` raises the exception.
+    """
+
+    def __init__(self, *,
+                 concurrency: int = 1,
+                 backlog: Optional[int] = None,
+                 on_error: Optional[Callable[[str, Any, BaseException], Any]] = None,
+                 multimatch: bool = False,
+                 strict: bool = False):
+        self.concurrency = concurrency
+        self.backlog = backlog
+        self.on_error = on_error
+        self.multimatch = multimatch
+        self.strict = strict
+        self.unmatched = 0
+        self._cases: List[_Case] = []
+        self._default: Optional[_Case] = None
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def _new_case(self, name: str, pattern, handler, concurrency: Optional[int], backlog: Optional[int], *,
+                  is_default: bool = False) -> _Case:
+        if self._started is not None:
+            raise RuntimeError("cases can not be added to a dispatcher which has been started")
+        if any(case.name == name for case in self._all_cases()):
+            raise ValueError(f"there is a case named {name!r} already")
+        if concurrency is None:
+            concurrency = self.concurrency
+        if backlog is None:
+            backlog = concurrency if self.backlog is None else self.backlog
+        return _Case(name, pattern, handler, concurrency=concurrency, backlog=backlog, is_default=is_default)
+
+    def on(self, pattern, handler: Optional[Callable[..., Awaitable]] = None, *,
+           name: Optional[str] = None,
+           concurrency: Optional[int] = None,
+           backlog: Optional[int] = None) -> Union[Callable, Dispatcher]:
+        """Adds a case, can be used as a decorator (without the `handler`). The name defaults to the name of the
+        handler, `concurrency` and `backlog` to the ones of the dispatcher."""
+        if handler is None:
+            def decorator(f):
+                self.on(pattern, f, name=name, concurrency=concurrency, backlog=backlog)
+                return f
+
+            return decorator
+        self._cases.append(self._new_case(name or handler.__name__, pattern, handler, concurrency, backlog))
+        return self
+
+    def otherwise(self, handler: Optional[Callable[[Any], Awaitable]] = None, *,
+                  name: str = 'otherwise',
+                  concurrency: Optional[int] = None,
+                  backlog: Optional[int] = None) -> Union[Callable, Dispatcher]:
+        if handler is None:
+            def decorator(f):
+                self.otherwise(f, name=name, concurrency=concurrency, backlog=backlog)
+                return f
+
+            return decorator
+        if self._default is not None:
+            raise ValueError("there is an otherwise case already")
+        self._default = self._new_case(name, None, handler, concurrency, backlog, is_default=True)
+        return self
+
+    def _all_cases(self) -> Iterable[_Case]:
+        yield from self._cases
+        if self._default is not None:
+            yield self._default
+
+    def _router(self) -> Callable[[Any], Tuple[Optional[_Case], Optional[MatchResult]]]:
+        """Finds the case for a value, using the jump table of a `OneOf` of all of the patterns to skip the cases which
+        can not match it."""
+        by_pattern: Dict[int, _Case] = {}
+        for case in self._cases:
+            by_pattern.setdefault(id(case.pattern), case)
+        candidates = OneOf(*(case.pattern for case in self._cases)).candidates
+        multimatch, strict = self.multimatch, self.strict
+
+        def route(value):
+            for pattern in candidates(value):
+                case = by_pattern[id(pattern)]
+                result = case.compiled.match(value, multimatch=multimatch, strict=strict)
+                if result:
+                    return case, result
+            return self._default, None
+
+        return route
+
+    async def _work(self, case: _Case, failures: asyncio.Queue):
+        queue = case.queue
+        while True:
+            value, result = await queue.get()
+            case.running += 1
+            start = time.perf_counter()
+            try:
+                await case.invoke(value, result)
+            except Exception as e:  # pylint: disable=broad-except
+                case.failed += 1
+                try:
+                    if self.on_error is None:
+                        raise
+                    self.on_error(case.name, value, e)
+                except Exception as error:  # pylint: disable=broad-except
+                    failures.put_nowait(error)
+            else:
+                case.handled += 1
+            finally:
+                latency = time.perf_counter() - start
+                case.running -= 1
+                case.total_latency += latency
+                case.max_latency = max(case.max_latency, latency)
+                case.latencies.add(latency)
+                queue.task_done()
+
+    async def _read(self, source: AsyncIterable, route):
+        count = 0
+        async for value in source:
+            case, result = route(value)
+            if case is None:
+                self.unmatched += 1
+            else:
+                case.matched += 1
+                await case.queue.put((value, result))
+            count += 1
+            if count % _YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        for case in self._all_cases():
+            await case.queue.join()
+
+    async def run(self, source: AsyncIterable) -> Dict[str, CaseStats]:
+        """Dispatches all of the values from the source, returns once all of them have been handled. A dispatcher can
+        be run once."""
+        if self._started is not None:
+            raise RuntimeError("a dispatcher can be run once only")
+        self._started = time.perf_counter()
+        route = self._router()
+        failures: asyncio.Queue = asyncio.Queue()
+        workers = []
+        for case in self._all_cases():
+            case.queue = asyncio.Queue(case.backlog)
+            workers.extend(asyncio.ensure_future(self._work(case, failures)) for _i in range(case.concurrency))
+        reader = asyncio.ensure_future(self._read(source, route))
+        failed = asyncio.ensure_future(failures.get())
+        try:
+            await asyncio.wait([reader, failed], return_when=asyncio.FIRST_COMPLETED)
+            if failed.done():
+                raise failed.result()
+            reader.result()
+        finally:
+            self._finished = time.perf_counter()
+            pending = [task for task in (reader, failed, *workers) if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return self.stats()
+
+    def stats(self) -> Dict[str, CaseStats]:
+        """Statistics per case (by name), also while the dispatcher is running."""
+        if self._started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished or time.perf_counter()) - self._started
+        return {case.name: case.stats(elapsed) for case in self._all_cases()}
@@ -0,0 +1,46 @@
+"""Memory footprint and hashing cost of a rule set with many patterns.
+
+    python3 benchmarks/memory.py [number of rules]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, '.')
+
+from apm import *  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def make_rule(i: int):
+    return {
+        'kind': OneOf('create', 'update', 'delete'),
+        'id': 'id' @ InstanceOf(int) & Between(i, i + 1000),
+        'tags': [Some(InstanceOf(str)), f'tag{i % 100}'],
+        'payload': Strict({'version': i % 7}),
+    }
+
+
+def main(n: int):
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    rules = [Capture(make_rule(i), name=f'rule{i}') for i in range(n)]
+    built = time.perf_counter() - started
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{n} rules: {(after - before) / 2 ** 20:.1f} MiB ({(after - before) / n:.0f} bytes per rule), "
+          f"peak {(peak - before) / 2 ** 20:.1f} MiB, built in {built:.2f}s")
+
+    started = time.perf_counter()
+    distinct = len(set(rules))
+    first = time.perf_counter() - started
+    started = time.perf_counter()
+    distinct = len(set(rules))
+    second = time.perf_counter() - started
+    print(f"{distinct} distinct: hashing all took {first:.2f}s, {second:.2f}s once the hashes are cached")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,62 @@
+"""Throughput of `match_parallel` with 1 up to N workers, for both backends.
+
+    python3 benchmarks/parallel.py [number of records] [max workers]
+
+The thread backend is expected to scale only on a free-threaded build of CPython (3.13+).
+"""
+import os
+import sys
+import sysconfig
+import time
+
+sys.path.insert(0, '.')
+
+from apm import *  # noqa: E402 pylint: disable=wrong-import-position
+
+PATTERN = {
+    'kind': 'kind' @ OneOf('create', 'update', 'delete'),
+    'id': InstanceOf(int) & Between(0, 10 ** 9),
+    'tags': [Some(InstanceOf(str)), 'tag' @ Regex(r'tag\d+')],
+    'payload': Strict({'version': OneOf(*range(7))}),
+}
+
+
+def make_record(i: int):
+    return {
+        'kind': ('create', 'update', 'delete', 'other')[i % 4],
+        'id': i,
+        'tags': [f'x{i % 10}', f'tag{i % 100}'],
+        'payload': {'version': i % 9},
+    }
+
+
+def run(records, backend: str, workers: int) -> float:
+    started = time.perf_counter()
+    matched = sum(1 for _value, result in match_parallel(records, PATTERN, workers=workers, backend=backend,
+                                                         chunksize=2048) if result)
+    elapsed = time.perf_counter() - started
+    assert matched == sum(1 for r in records if match(r, PATTERN))
+    return elapsed
+
+
+def main(n: int, max_workers: int):
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"python {sys.version.split()[0]}, free-threaded build: {bool(sysconfig.get_config_var('Py_GIL_DISABLED'))},"
+          f" GIL enabled: {gil}")
+    records = [make_record(i) for i in range(n)]
+    started = time.perf_counter()
+    for r in records:
+        match(r, PATTERN)
+    sequential = time.perf_counter() - started
+    print(f"{n} records, sequential: {sequential:.2f}s")
+    for backend in ('process', 'thread'):
+        workers = 1
+        while workers <= max_workers:
+            elapsed = run(records, backend, workers)
+            print(f"{backend:>8} x {workers:<3} {elapsed:6.2f}s  speedup {sequential / elapsed:5.2f}")
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1)
@@ -0,0 +1,34 @@
+"""Size of a serialized rule set and how long it takes to write and read it back in.
+
+    python3 benchmarks/serialization.py [number of rules]
+"""
+import pickle
+import sys
+import time
+
+sys.path.insert(0, '.')
+sys.path.insert(0, 'benchmarks')
+
+from apm import *  # noqa: E402 pylint: disable=wrong-import-position
+from memory import make_rule  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def main(n: int):
+    rules = [Capture(make_rule(i), name=f'rule{i}') for i in range(n)]
+    started = time.perf_counter()
+    data = serialize(rules)
+    written = time.perf_counter() - started
+    started = time.perf_counter()
+    loaded = deserialize(data)
+    read = time.perf_counter() - started
+    assert loaded == rules
+    pickled = pickle.dumps(rules)
+    started = time.perf_counter()
+    pickle.loads(pickled)
+    unpickled = time.perf_counter() - started
+    print(f"{n} rules: {len(data) / 1024:.0f} KiB, written in {written * 1000:.1f}ms, read in {read * 1000:.1f}ms "
+          f"(pickle: {len(pickled) / 1024:.0f} KiB, read in {unpickled * 1000:.1f}ms)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+import unittest
+
+from apm import *
+
+
+class AdaptiveAllOfTest(unittest.TestCase):
+
+    def test_cheap_selective_check_moves_to_the_front(self):
+        calls = []
+
+        def expensive(value):
+            calls.append(value)
+            time.sleep(0.0002)
+            return True
+
+        slow = Check(expensive)
+        cheap = InstanceOf(dict)
+        pattern = AllOf(slow, cheap, adaptive=True)
+        for i in range(300):
+            match(i, pattern)
+        self.assertEqual((cheap, slow), pattern.evaluation_order)
+        calls.clear()
+        for i in range(100):
+            self.assertFalse(match(i, pattern))
+        self.assertEqual([], calls)
+        self.assertTrue(match({}, pattern))
+
+    def test_captures_keep_their_position(self):
+        capture = Capture(_, name='x')
+        pattern = AllOf(Check(lambda v: time.sleep(0.0001) or True), capture, InstanceOf(str), adaptive=True)
+        for i in range(300):
+            match(i, pattern)
+        self.assertIs(capture, pattern.evaluation_order[1])
+        result = match('a', pattern)
+        self.assertTrue(result)
+        self.assertEqual('a', result['x'])
+
+    def test_guards_stay_ahead_of_later_conjuncts(self):
+        starts_with_x = Check(lambda s: s.startswith('x'))
+        pattern = AllOf(InstanceOf(str), starts_with_x, adaptive=True)
+        for i in range(1000):
+            match('y' * (i % 7), pattern)
+        self.assertEqual((InstanceOf(str), starts_with_x), pattern.evaluation_order)
+        self.assertFalse(match(1, pattern))
+        self.assertTrue(match('xy', pattern))
+
+    def test_exceptions_fall_back_to_the_given_order(self):
+        is_empty = Check(lambda s: s == '')
+        first_is_x = Check(lambda s: s[0] == 'x')
+        pattern = AllOf(Not(is_empty), first_is_x, adaptive=True)
+        for i in range(1000):
+            match('y', pattern)
+        self.assertEqual((first_is_x, Not(is_empty)), pattern.evaluation_order)
+        self.assertFalse(match('', pattern))
+        self.assertTrue(match('x', pattern))
+        with self.assertRaises(TypeError):
+            match(1, pattern)
+
+    def test_same_results_as_static_order(self):
+        conjuncts = (InstanceOf(int), Check(lambda v: v % 3 == 0), Between(0, 50), Capture(_, name='v'),
+                     Check(lambda v: v % 2 == 0))
+        static = AllOf(*conjuncts)
+        adaptive = AllOf(*conjuncts, adaptive=True)
+        for i in range(-20, 500):
+            expected = match(i, static)
+            actual = match(i, adaptive)
+            self.assertEqual(bool(expected), bool(actual))
+            if expected:
+                self.assertEqual(expected.groups(), actual.groups())
+
+    def test_not_adaptive_by_default(self):
+        pattern = AllOf(Check(lambda v: time.sleep(0.0001) or True), InstanceOf(str))
+        for i in range(200):
+            match(i, pattern)
+        self.assertEqual(pattern.patterns, pattern.evaluation_order)
+        self.assertEqual(pattern, AllOf(*pattern.patterns))
+        self.assertNotEqual(pattern, AllOf(*pattern.patterns, adaptive=True))
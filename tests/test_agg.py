@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
+import threading
 import unittest
 from typing import Callable
 
 from apm import *
+from apm.core import Aggregation, _latest_aggregates
+
+TOTAL = agg.Sum('total')
+SHARED = Each(OneOf(InstanceOf(int) >> TOTAL, InstanceOf(str) >> agg.Set('words')))
 
 
 class AggregationsTest(unittest.TestCase):
@@ -62,6 +68,8 @@ class AggregationsTest(unittest.TestCase):
             'c': 3,
             'd': 1,
         }, result.histo)
+        self.assertIs(dict, type(result.histo))
+        self.assertIs(dict, type(agg.Histogram('h').add_many({}, 'abca')))
 
     def test_agg_sum(self):
         lower = 1
@@ -115,3 +123,99 @@ class AggregationsTest(unittest.TestCase):
         }, pattern)
         self.assertTrue(result)
         self.assertEqual(set(), numbers.value)
+
+    def test_state_does_not_leak_between_matches(self):
+        count = agg.Count('n')
+        pattern = Each(_ >> count)
+        self.assertEqual(3, match([1, 2, 3], pattern).n)
+        self.assertEqual(2, match([1, 2], pattern).n)
+        self.assertEqual(2, count.value)
+
+    def test_collected_aggregations_are_forgotten(self):
+        for n in range(1, 100):
+            count = agg.Count('n')
+            self.assertEqual(n, match(range(n), Each(_ >> count)).n)
+            self.assertEqual(n, count.value)
+        self.assertLess(len(_latest_aggregates.get()), 20)
+
+    def test_multimatch(self):
+        self.assertEqual(3, match([1, 2, 3], Each(_ >> agg.Count('n')), multimatch=True).n)
+
+    def test_branch_which_is_given_up(self):
+        a = agg.List('a')
+        pattern = (InstanceOf(int) >> a, OneOf([Some(InstanceOf(int) >> a, at_least=3), 'x'],
+                                               [Some(InstanceOf(int) >> a), 'x']))
+        self.assertEqual([0, 1, 2], match((0, [1, 2, 'x']), pattern).a)
+
+    def test_threads(self):
+        errors = []
+        barrier = threading.Barrier(8)
+
+        def work(k: int):
+            barrier.wait()
+            try:
+                for i in range(300):
+                    n = 1 + (k * 31 + i) % 50
+                    value = [*range(n), f'w{k}', f'w{i % 3}']
+                    result = match(value, SHARED)
+                    expected = (n * (n - 1) // 2, {f'w{k}', f'w{i % 3}'})
+                    if (result.total, result.words) != expected:
+                        errors.append((k, i, result.groups()))
+                    if TOTAL.value != expected[0]:
+                        errors.append((k, i, TOTAL.value))
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+
+    def test_tasks(self):
+        count = agg.Count('n')
+        pattern = Each(_ >> count)
+
+        async def work(n: int):
+            result = match(range(n), pattern)
+            await asyncio.sleep(0)
+            return result.n, count.value
+
+        async def main():
+            return await asyncio.gather(*(work(n) for n in range(1, 20)))
+
+        self.assertEqual([(n, n) for n in range(1, 20)], asyncio.run(main()))
+
+    def test_add_many_is_like_add(self):
+        values = ['3', 'a', 4, 'a', '1.5', 3]
+        for aggregation in (agg.Histogram('h'), agg.Set('s'), agg.List('l'), agg.Count('c')):
+            one_by_one = aggregation.new()
+            for value in values:
+                one_by_one = aggregation.add(one_by_one, value)
+            self.assertEqual(one_by_one, aggregation.add_many(aggregation.new(), values))
+            self.assertEqual(one_by_one, aggregation.value)
+        total = agg.Sum('total')
+        self.assertEqual(11.5, total.add_many(1, ['3', 4, '1.5', 2]))
+        self.assertIsInstance(total.add_many(0, ['3', 4]), int)
+        self.assertEqual(3, agg.Count('c').add_many(0, iter('abc')))
+
+    def test_merge(self):
+        left, right = ['a', 'b', 'a', 1], ['b', 'c', 2]
+        for aggregation in (agg.Histogram('h'), agg.Set('s'), agg.List('l'), agg.Count('c'), agg.Sum('n')):
+            values = left + right if not isinstance(aggregation, agg.Sum) else [1, 2, 3, '4.5']
+            a = aggregation.add_many(aggregation.new(), values[:3])
+            b = aggregation.add_many(aggregation.new(), values[3:])
+            b_before = aggregation.copy(b)
+            self.assertEqual(aggregation.add_many(aggregation.new(), values), aggregation.merge(a, b))
+            self.assertEqual(b_before, b)
+
+    def test_merge_histogram_into_dict(self):
+        self.assertEqual({'a': 3, 'b': 1}, agg.Histogram('h').merge({'a': 1}, {'a': 2, 'b': 1}))
+
+    def test_merge_is_not_supported_by_default(self):
+        class Last(agg.List):
+            merge = Aggregation.merge
+
+        with self.assertRaises(NotImplementedError):
+            Last('last').merge([1], [2])
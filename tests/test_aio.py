@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import unittest
+
+from apm import *
+
+
+class Recorder:
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = []
+        self.running = 0
+        self.max_running = 0
+
+    def check(self, delay: float, outcome=True):
+        async def check(value):
+            self.calls.append((delay, value))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append((delay, value))
+                raise
+            finally:
+                self.running -= 1
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome(value) if callable(outcome) else outcome
+
+        return check
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class AsyncMatchTest(unittest.TestCase):
+
+    def test_check(self):
+        r = Recorder()
+        self.assertTrue(run(amatch(3, AsyncCheck(r.check(0, lambda x: x > 2)))))
+        self.assertFalse(run(amatch(1, AsyncCheck(r.check(0, lambda x: x > 2)))))
+
+    def test_all_of_is_concurrent(self):
+        r = Recorder()
+        pattern = AllOf(AsyncCheck(r.check(0.05)), AsyncCheck(r.check(0.05)), AsyncCheck(r.check(0.05)))
+        self.assertTrue(run(amatch('x', pattern)))
+        self.assertEqual(3, r.max_running)
+
+    def test_all_of_cancels_on_first_failure(self):
+        r = Recorder()
+        pattern = AllOf(AsyncCheck(r.check(10)), AsyncCheck(r.check(0.01, False)))
+        start = time.perf_counter()
+        self.assertFalse(run(amatch('x', pattern)))
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual([(10, 'x')], r.cancelled)
+
+    def test_one_of_takes_first_success_in_declared_order(self):
+        r = Recorder()
+        pattern = OneOf(AsyncCheck(r.check(0.05, False)) >> 'first',
+                        AsyncCheck(r.check(0.03)) >> 'second',
+                        AsyncCheck(r.check(0.01)) >> 'third')
+        result = run(amatch('x', pattern))
+        self.assertTrue(result)
+        self.assertEqual({'second': 'x'}, result.groups())
+        self.assertEqual(3, r.max_running)
+
+    def test_one_of_does_not_wait_for_later_alternatives(self):
+        r = Recorder()
+        pattern = OneOf(AsyncCheck(r.check(0.01)) >> 'first', AsyncCheck(r.check(10)) >> 'second')
+        result = run(amatch('x', pattern))
+        self.assertEqual({'first': 'x'}, result.groups())
+        self.assertEqual([(10, 'x')], r.cancelled)
+
+    def test_each_is_concurrent(self):
+        r = Recorder()
+        result = run(amatch(list(range(20)), Each(AsyncCheck(r.check(0.01, lambda x: x < 100)))))
+        self.assertTrue(result)
+        self.assertEqual(20, r.max_running)
+        self.assertEqual(20, len(r.calls))
+
+    def test_each_matches_an_item_again_once_it_can_be_decided(self):
+        matched = []
+
+        async def later(n):
+            for _i in range(n):
+                await asyncio.sleep(0)
+            return n < 100
+
+        pattern = Each(AllOf(Check(lambda x: matched.append(x) or True), AsyncCheck(later)))
+        self.assertTrue(run(amatch(list(range(50)), pattern)))
+        self.assertLessEqual(len(matched), 2 * 50)
+        self.assertFalse(run(amatch([*range(50), 100], pattern)))
+
+    def test_guards_are_decided_before_exceptions_count(self):
+        async def is_str(value):
+            await asyncio.sleep(0)
+            return isinstance(value, str)
+
+        starts_with_a = Check(lambda s: s.startswith('a'))
+        guarded = AllOf(AsyncCheck(is_str), starts_with_a)
+        self.assertFalse(run(amatch(5, guarded)))
+        self.assertTrue(run(amatch('ab', guarded)))
+        self.assertTrue(run(amatch(5, OneOf(Not(AsyncCheck(is_str)), starts_with_a))))
+        self.assertFalse(run(amatch(['ab', 5, 'b'], Each(guarded))))
+        self.assertFalse(run(amatch([5, 'ab', 'b'], Each(OneOf(Not(AsyncCheck(is_str)), starts_with_a)))))
+        with self.assertRaises(AttributeError):
+            run(amatch('b', AllOf(AsyncCheck(is_str), Check(lambda s: s.no_such_method()))))
+
+        async def no(value):
+            await asyncio.sleep(0)
+            return False
+
+        # the first item does not match, the second one is not to be looked at
+        item = OneOf(AllOf(1, AsyncCheck(no)), AllOf(2, starts_with_a))
+        self.assertFalse(run(amatch([1, 2], Each(item))))
+        self.assertFalse(run(amatch([1, 2], Each('x' @ item))))
+
+    def test_nested_in_structures(self):
+        r = Recorder()
+
+        async def lookup(user):
+            await asyncio.sleep(0)
+            return {'name': user.title(), 'roles': ['admin']}
+
+        pattern = {'user': AsyncTransformed(lookup, {'name': 'name' @ _, 'roles': ['admin']}),
+                   'items': [AsyncCheck(r.check(0, lambda x: x > 0)), ...]}
+        result = run(amatch({'user': 'jane', 'items': [1, -1]}, pattern))
+        self.assertTrue(result)
+        self.assertEqual('Jane', result['name'])
+
+    def test_each_function_is_awaited_once_per_value(self):
+        r = Recorder()
+        check = AsyncCheck(r.check(0))
+        self.assertTrue(run(amatch([{'a': 1}, {'a': 1}, 'x', 'x'], Each(AllOf(check, check)))))
+        self.assertEqual(2, len(r.calls))
+
+    def test_transformed_exception_is_no_match(self):
+        r = Recorder()
+        self.assertFalse(run(amatch(1, AsyncTransformed(r.check(0, ValueError()), _))))
+
+    def test_check_exception_is_raised(self):
+        r = Recorder()
+        with self.assertRaises(ValueError):
+            run(amatch(1, AsyncCheck(r.check(0, ValueError()))))
+
+    def test_sync_match_refuses(self):
+        r = Recorder()
+        with self.assertRaises(TypeError):
+            match(1, AsyncCheck(r.check(0)))
+
+    def test_sync_patterns(self):
+        self.assertEqual({'x': 1}, run(amatch([1, 2], ['x' @ _, InstanceOf(int)])).groups())
+        self.assertFalse(run(amatch([1, 2], [_])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from apm import *
+
+
+class Lookup:
+
+    def __init__(self, known=frozenset(range(0, 100, 2))):
+        self.known = known
+        self.calls = []
+
+    def __call__(self, keys):
+        self.calls.append(list(keys))
+        return [key in self.known for key in keys]
+
+
+class BatchCheckTest(unittest.TestCase):
+
+    def test_match_calls_with_single_value(self):
+        lookup = Lookup()
+        self.assertTrue(match(2, BatchCheck(lookup)))
+        self.assertFalse(match(3, BatchCheck(lookup)))
+        self.assertEqual([[2], [3]], lookup.calls)
+
+    def test_each_is_one_batch(self):
+        lookup = Lookup()
+        result = match_many([[0, 2, 4], [6, 7], ['a']], Each(BatchCheck(lookup)))
+        self.assertEqual([True, False, False], [bool(r) for r in result])
+        self.assertEqual([[0, 2, 4, 6, 7, 'a']], lookup.calls)
+
+    def test_values_are_asked_for_once(self):
+        lookup = Lookup()
+        check = BatchCheck(lookup)
+        result = match_many([{'a': 2, 'b': 2}, {'a': 2, 'b': 4}], {'a': check, 'b': AllOf(check, check)})
+        self.assertTrue(all(result))
+        self.assertEqual([[2], [4]], lookup.calls)
+
+    def test_dependent_batches(self):
+        users, roles = Lookup({'jane', 'joe'}), Lookup({'admin'})
+        pattern = {'user': BatchCheck(users) >> 'user', 'role': BatchCheck(roles)}
+        values = [{'user': 'jane', 'role': 'admin'}, {'user': 'joe', 'role': 'guest'}, {'user': 'x', 'role': 'admin'}]
+        result = match_many(values, pattern)
+        self.assertEqual([True, False, False], [bool(r) for r in result])
+        self.assertEqual('jane', result[0]['user'])
+        self.assertEqual([['jane', 'joe', 'x']], users.calls)
+        self.assertEqual([['admin', 'guest']], roles.calls)
+
+    def test_one_of_keeps_declared_order(self):
+        lookup = Lookup()
+        pattern = OneOf(BatchCheck(lookup) >> 'known', _ >> 'unknown')
+        result = match_many([1, 2], pattern)
+        self.assertEqual([{'unknown': 1}, {'known': 2}], [r.groups() for r in result])
+        self.assertEqual([[1, 2]], lookup.calls)
+
+    def test_guards_are_decided_first(self):
+        def strings(values):
+            return [isinstance(value, str) for value in values]
+
+        pattern = AllOf(BatchCheck(strings), Check(lambda s: s.startswith('a')))
+        self.assertEqual([False, True], [bool(r) for r in match_many([5, 'ab'], pattern)])
+        self.assertEqual([False, True], [bool(r) for r in match_many([[5, 'ab'], ['ab']], Each(pattern))])
+
+    def test_errors(self):
+        def fail(keys):
+            raise KeyError('down')
+
+        with self.assertRaises(KeyError):
+            match_many([[1, 2]], Each(BatchCheck(fail)))
+        with self.assertRaises(ValueError):
+            match_many([1, 2], BatchCheck(lambda keys: [True]))
+
+    def test_amatch(self):
+        lookup = Lookup()
+        result = asyncio.run(amatch([2, 4, 5], Each(BatchCheck(lookup))))
+        self.assertFalse(result)
+        self.assertEqual([[2, 4, 5]], lookup.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
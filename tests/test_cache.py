@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import gc
+import threading
+import time
+import unittest
+
+from apm import *
+
+
+class Box:
+    __hash__ = None
+
+    def __init__(self, x):
+        self.x = x
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        calls = []
+
+        def is_even(x):
+            calls.append(x)
+            return x % 2 == 0
+
+        pattern = Check(is_even, cache=True)
+        for _i in range(3):
+            self.assertTrue(match(2, pattern))
+            self.assertFalse(match(3, pattern))
+        self.assertEqual([2, 3], calls)
+        self.assertEqual(4, pattern.cache.hits)
+        self.assertEqual(2, pattern.cache.misses)
+
+    def test_transformed(self):
+        calls = []
+
+        def parse(s):
+            calls.append(s)
+            return int(s)
+
+        pattern = Transformed(parse, 'n' @ Between(0, 10), cache=ResultCache())
+        self.assertEqual(5, match('5', pattern)['n'])
+        self.assertEqual(5, match('5', pattern)['n'])
+        self.assertFalse(match('x', pattern))
+        self.assertFalse(match('x', pattern))
+        self.assertEqual(['5', 'x', 'x'], calls)  # exceptions are not cached
+
+    def test_empty_cache_is_used(self):
+        cache = ResultCache()
+        self.assertIs(cache, Check(bool, cache=cache).cache)
+        self.assertIsNone(Check(bool).cache)
+        self.assertIsNone(Check(bool, cache=False).cache)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(maxsize=2)
+        cache.call(str, 1)
+        cache.call(str, 2)
+        cache.call(str, 1)
+        cache.call(str, 3)
+        self.assertEqual(2, len(cache))
+        hits = cache.hits
+        cache.call(str, 1)
+        self.assertEqual(hits + 1, cache.hits)
+        cache.call(str, 2)
+        self.assertEqual(hits + 1, cache.hits)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.01)
+        cache.call(str, 1)
+        cache.call(str, 1)
+        self.assertEqual(1, cache.hits)
+        time.sleep(0.02)
+        cache.call(str, 1)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def test_types_are_told_apart(self):
+        cache = ResultCache()
+        self.assertEqual('1', cache.call(repr, 1))
+        self.assertEqual('True', cache.call(repr, True))
+        self.assertEqual('1.0', cache.call(repr, 1.0))
+        self.assertEqual('(1,)', cache.call(repr, (1,)))
+        self.assertEqual('(True,)', cache.call(repr, (True,)))
+        self.assertEqual('-0.0', cache.call(repr, -0.0))
+        self.assertEqual('0.0', cache.call(repr, 0.0))
+        self.assertEqual(0, cache.hits)
+
+    def test_functions_are_told_apart(self):
+        cache = ResultCache()
+        self.assertTrue(match(2, Check(lambda x: x == 2, cache=cache)))
+        self.assertFalse(match(2, Check(lambda x: x == 3, cache=cache)))
+
+    def test_unhashable_by_identity(self):
+        cache = ResultCache()
+        a, b = Box(1), Box(1)
+        cache.call(vars, a)
+        cache.call(vars, a)
+        cache.call(vars, b)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(2, len(cache))
+        del a, b
+        gc.collect()
+        self.assertEqual(0, len(cache))
+
+    def test_uncacheable(self):
+        cache = ResultCache()
+        self.assertEqual(1, cache.call(len, {'a': 1}))
+        self.assertEqual(1, cache.call(len, {'a': 1}))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(0, len(cache))
+
+    def test_threads(self):
+        cache = ResultCache(maxsize=50)
+        errors = []
+
+        def double(x):
+            return x * 2
+
+        def work(offset):
+            for i in range(2000):
+                v = (i * 7 + offset) % 100
+                if cache.call(double, v) != v * 2:
+                    errors.append(v)
+
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertLessEqual(len(cache), 50)
+        self.assertEqual(16000, cache.hits + cache.misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -83,3 +83,95 @@ class CaseDistinctionTest(unittest.TestCase):
         self.assertEqual(0, f("a", "b"))
         self.assertEqual(1, f(1, 2))
         self.assertEqual(2, f(1, 2, 3))
+
+    def test_profile_reorders_disjoint_cases(self):
+        @case_distinction
+        def g(x: str):
+            return 'str'
+
+        @case_distinction
+        def g(x: Match(InstanceOf(bytes))):
+            return 'bytes'
+
+        @case_distinction
+        def g(x: int):
+            return 'int'
+
+        for i in range(g.profile.reorder_interval):
+            self.assertEqual('int', g(i))
+        self.assertEqual('int', g(-1))
+        self.assertEqual(g.profile.functions[2], g.profile.order[0])
+        self.assertEqual(g.profile.reorder_interval + 1, g.profile.hits[g.profile.functions[2]])
+        self.assertEqual({'type'}, {reason for _a, _b, reason in g.profile.disjoint_pairs()})
+        self.assertEqual('str', g('a'))
+        self.assertEqual('bytes', g(b'a'))
+
+    def test_profile_keeps_order_of_overlapping_cases(self):
+        @case_distinction
+        def h(x: int):
+            return 'int'
+
+        @case_distinction
+        def h(x: bool):
+            return 'bool'
+
+        @case_distinction
+        def h(x):
+            return 'any'
+
+        for _i in range(h.profile.reorder_interval):
+            h('a')
+        self.assertEqual(h.profile.functions, h.profile.order)
+        self.assertEqual([], h.profile.disjoint_pairs())
+        self.assertEqual('int', h(True))
+
+    def test_profile_keeps_order_of_cases_which_might_raise(self):
+        @case_distinction
+        def n(x: str, y: int):
+            return 'str'
+
+        @case_distinction
+        def n(x: Match(Check(lambda v: v.bit_length() < 8)), y: str):
+            return 'small'
+
+        for i in range(n.profile.reorder_interval):
+            self.assertEqual('small', n(i % 100, 'a'))
+        self.assertEqual(n.profile.functions, n.profile.order)
+        # 'x' has no bit_length, the first case takes it before the second one is looked at
+        self.assertEqual('str', n('x', 5))
+
+    def test_profile_literal_cases(self):
+        class Weird:
+            def __eq__(self, other):
+                return True
+
+        @case_distinction
+        def k(x: Match(1)):
+            return 1
+
+        @case_distinction
+        def k(x: Match('two')):
+            return 2
+
+        for _i in range(k.profile.reorder_interval):
+            self.assertEqual(2, k('two'))
+        self.assertEqual(k.profile.functions[::-1], k.profile.order)
+        self.assertEqual(1, k(1))
+        # a value which is not a literal might equal both, then the definition order applies
+        self.assertEqual(1, k(Weird()))
+
+    def test_profile_arity(self):
+        @case_distinction
+        def m(a, b):
+            return 2
+
+        @case_distinction
+        def m(a):
+            return 1
+
+        for _i in range(m.profile.reorder_interval):
+            m(0)
+        self.assertEqual(m.profile.functions[::-1], m.profile.order)
+        self.assertEqual(2, m(1, 2))
+        m.profile.reset()
+        self.assertEqual(m.profile.functions, m.profile.order)
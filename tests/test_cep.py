@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import unittest
+
+from apm import *
+
+FAILED = {'type': 'failed', 'user': 'user' @ _}
+OK = {'type': 'ok', 'user': 'user' @ _}
+BRUTE_FORCE = [FAILED, 'fails' @ Some(FAILED, at_least=3), OK]
+
+
+def event(user, type_, **kwargs):
+    return {'type': type_, 'user': user, **kwargs}
+
+
+class SequenceDetectorTest(unittest.TestCase):
+
+    def feed(self, detector, events):
+        return [(m.partition, len(m.events)) for i, e in enumerate(events) for m in detector.feed(e, timestamp=i)]
+
+    def test_partitions(self):
+        detector = SequenceDetector(BRUTE_FORCE, partition_by='user')
+        events = [event('a', 'failed'), event('b', 'failed'), event('a', 'failed'), event('a', 'view'),
+                  event('a', 'failed'), event('b', 'ok'), event('a', 'failed'), event('a', 'ok'), event('b', 'failed')]
+        matches = list(detector.process(events))
+        self.assertEqual([('a', 5)], [(m.partition, len(m.events)) for m in matches])
+        self.assertEqual('a', matches[0].result['user'])
+        self.assertEqual(3, len(matches[0].result['fails']))
+        self.assertEqual((1, 1), (len(detector), detector.partitions))
+
+    def test_same_as_matching_a_list(self):
+        sequence = [1, Some(InstanceOf(int)), 2]
+        detector = SequenceDetector(sequence)
+        events = [1, 3, 2, 2, 1, 2, 5, 1, 4, 4, 2]
+        matches = [list(m.events) for m in detector.process(events)]
+        self.assertEqual([[1, 3, 2], [1, 2], [1, 4, 4, 2]], matches)
+        for m in matches:
+            self.assertTrue(match(m, sequence))
+
+    def test_irrelevant_events_do_not_interrupt(self):
+        detector = SequenceDetector(['a', 'b'])
+        self.assertEqual([('a', 'b')], [m.events for m in detector.process(['a', 'x', 'y', 'b'])])
+        self.assertEqual([], [m.events for m in detector.process(['a', 'a', 'a'])])
+
+    def test_relevant_events_do_interrupt(self):
+        detector = SequenceDetector(BRUTE_FORCE, partition_by='user')
+        events = [event('a', 'failed'), event('a', 'failed'), event('a', 'ok'), event('a', 'failed'), event('a', 'ok')]
+        self.assertEqual([], self.feed(detector, events))
+
+    def test_time_window(self):
+        detector = SequenceDetector(['a', Some('b'), 'c'], within=10)
+        self.assertEqual([], [m.events for m in detector.process([])])
+        found = []
+        for t, e in [(0, 'a'), (5, 'b'), (11, 'c'), (12, 'a'), (20, 'b'), (22, 'c')]:
+            found.extend((m.start, m.end) for m in detector.feed(e, timestamp=t))
+        self.assertEqual([(12, 22)], found)
+
+    def test_count_window(self):
+        detector = SequenceDetector(['a', Some('b'), 'c'], within_events=4)
+        self.assertEqual([4], [len(m.events) for m in detector.process('abbcabbbc')])
+
+    def test_expire(self):
+        detector = SequenceDetector([(_, _, 'a'), (_, _, 'b')], partition_by=lambda e: e[0], timestamp=lambda e: e[1],
+                                    within=10)
+        for i in range(100):
+            detector.feed((f'user{i}', i, 'a'))
+        # expired partial matches are swept once per window
+        self.assertLessEqual(detector.partitions, 21)
+        detector.expire(now=200)
+        self.assertEqual((0, 0), (len(detector), detector.partitions))
+
+    def test_bounded_partials(self):
+        detector = SequenceDetector([Some('a'), 'b'], max_partials=3, overlapping=True)
+        for _i in range(100):
+            detector.feed('a')
+        self.assertEqual(3, len(detector))
+        self.assertEqual([3, 2, 1], [len(m.events) for m in detector.feed('b')])
+
+    def test_overlapping(self):
+        events = ['a', 'a', 'b', 'b']
+        self.assertEqual([('a', 'b')], [m.events for m in SequenceDetector(['a', 'b']).process(events)])
+        self.assertEqual([('a', 'b'), ('b', 'b')],
+                         [m.events for m in SequenceDetector([OneOf('a', 'b'), 'b'], overlapping=True).process(events)])
+
+    def test_some_of_subsequences(self):
+        detector = SequenceDetector(['start', Some('x', 'y', at_least=2), 'end'])
+        events = ['start', 'x', 'y', 'x', 'y', 'end', 'start', 'x', 'y', 'end']
+        self.assertEqual([6], [len(m.events) for m in detector.process(events)])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            SequenceDetector([])
+        with self.assertRaises(ValueError):
+            SequenceDetector([Some(Some('a'))])
+
+
+if __name__ == '__main__':
+    unittest.main()
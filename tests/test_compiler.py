@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import random
+import threading
+import unittest
+
+from apm import *
+from apm.compiler import Tiering, tiering
+from apm.core import _pattern_handlers, _registered_pattern_handlers
+
+
+def random_pattern(rng: random.Random, depth: int = 0):
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice([
+            lambda: rng.choice([0, 1, 2, 1.0, True, None, 'a']),
+            lambda: ...,
+            lambda: InstanceOf(rng.choice([int, bool, str])),
+            lambda: Between(0, rng.randint(1, 5)),
+            lambda: Check(lambda v: v == 2),
+            lambda: Capture(_, name=rng.choice('xy')),
+            lambda: Value(rng.choice([1, 'a'])),
+            lambda: Transformed(lambda v: v + 1, rng.choice([1, 2, 3])),
+        ])()
+    return rng.choice([
+        lambda: AllOf(*(random_pattern(rng, depth + 1) for _i in range(rng.randint(1, 3)))),
+        lambda: OneOf(*(random_pattern(rng, depth + 1) for _i in range(rng.randint(1, 5)))),
+        lambda: Not(random_pattern(rng, depth + 1)),
+        lambda: Strict(random_pattern(rng, depth + 1)),
+        lambda: Capture(random_pattern(rng, depth + 1), name=rng.choice('xy')),
+        lambda: (random_pattern(rng, depth + 1), random_pattern(rng, depth + 1)),
+        lambda: {'a': random_pattern(rng, depth + 1)},
+    ])()
+
+
+def outcome(f):
+    try:
+        result = f()
+    except TypeError:
+        return 'TypeError'
+    return bool(result), result.groups(), result.wildcard_matches()
+
+
+class CompilerTest(unittest.TestCase):
+
+    def test_compiled_matches_like_interpreted(self):
+        rng = random.Random(34)
+        values = [0, 1, 2, 3, 1.0, True, None, 'a', (1, 2), (True, 1), {'a': 1}, {'a': 'a'}, [1]]
+        for _i in range(200):
+            pattern = random_pattern(rng)
+            compiled = compile_pattern(pattern)
+            for value in values:
+                for strict in (False, True):
+                    with self.subTest(pattern=pattern, value=value, strict=strict):
+                        expected = outcome(lambda: MatchContext(strict=strict).match(value, pattern, strict=strict))
+                        self.assertEqual(expected, outcome(lambda: compiled.match(value, strict=strict)))
+
+    def test_explain_on_failure(self):
+        pattern = {'a': InstanceOf(int)}
+        compiled = compile_pattern(AllOf(pattern, ...))
+        result = compiled.match({'a': 'x'})
+        self.assertFalse(result)
+        self.assertEqual(match({'a': 'x'}, AllOf(pattern, ...)).explain(), result.explain())
+
+    def test_tier_up(self):
+        pattern = InstanceOf(int) & ('n' @ Between(0, 10))
+        for i in range(tiering.threshold - 1):
+            self.assertTrue(match(i % 10, pattern))
+        self.assertFalse(tiering.is_compiled(pattern))
+        self.assertEqual(3, match(3, pattern)['n'])
+        self.assertTrue(tiering.is_compiled(pattern))
+        self.assertEqual(4, match(4, pattern)['n'])
+        result = match(11, pattern)
+        self.assertFalse(result)
+        self.assertIn("did not match", result.explain())
+
+    def test_bounded(self):
+        t = Tiering(threshold=2, capacity=3)
+        patterns = [InstanceOf(int) for _i in range(5)]
+        for p in patterns:
+            for _i in range(2):
+                self.assertTrue(t.match(1, p, ctx=MatchContext(), strict=False))
+        self.assertEqual(3, len(t))
+        self.assertFalse(t.is_compiled(patterns[0]))
+        self.assertTrue(t.is_compiled(patterns[-1]))
+
+    def test_cold_patterns_are_not_tracked(self):
+        t = Tiering(threshold=3)
+        for _i in range(10):
+            self.assertTrue(t.match(1, InstanceOf(int), ctx=MatchContext(), strict=False))
+            self.assertTrue(t.match({'a': 1}, {'a': 1}, ctx=MatchContext(), strict=False))
+        self.assertEqual(0, len(t))
+
+    def test_evicted_patterns_count_again(self):
+        t = Tiering(threshold=2, capacity=1)
+        a, b = InstanceOf(int), InstanceOf(int)
+        for p in (a, a, b, b):
+            t.match(1, p, ctx=MatchContext(), strict=False)
+        self.assertFalse(t.is_compiled(a))
+        t.match(1, a, ctx=MatchContext(), strict=False)
+        self.assertFalse(t.is_compiled(a))
+        t.match(1, a, ctx=MatchContext(), strict=False)
+        self.assertTrue(t.is_compiled(a))
+
+    def test_registered_pattern_types(self):
+        def match_ignoring_case(value, pattern, *, ctx, strict):
+            return ctx.match_if(isinstance(value, str) and value.upper() == pattern)
+
+        class Upper(str):
+            pass
+
+        pattern = Capture('ABC', name='x')
+        try:
+            register_pattern_type(Upper, match_ignoring_case)
+            self.assertTrue(match('abc', Capture(Upper('ABC'), name='x')))
+            register_pattern_type(str, match_ignoring_case)
+            for _i in range(tiering.threshold + 5):
+                self.assertEqual('abc', match('abc', pattern)['x'])
+            self.assertTrue(tiering.is_compiled(pattern))
+            self.assertTrue(compile_pattern(('ABC', 1)).match(('abc', 1)))
+            self.assertTrue(match('abc', pattern, iterative=True))
+        finally:
+            del _registered_pattern_handlers[Upper], _registered_pattern_handlers[str]
+            _pattern_handlers.clear()
+        self.assertFalse(match('abc', pattern))
+
+    def test_disabled(self):
+        t = Tiering(threshold=None)
+        p = InstanceOf(int)
+        for _i in range(10):
+            t.match(1, p, ctx=MatchContext(), strict=False)
+        self.assertEqual(0, len(t))
+
+    def test_hits_do_not_wait_for_the_lock(self):
+        t = Tiering(threshold=1)
+        pattern = InstanceOf(int)
+        t.match(1, pattern, ctx=MatchContext(), strict=False)
+        results = []
+        # noinspection PyProtectedMember
+        with t._entries._lock:
+            thread = threading.Thread(target=lambda: results.append(t.match(1, pattern, ctx=MatchContext(),
+                                                                            strict=False)))
+            thread.start()
+            thread.join(timeout=5)
+        self.assertEqual(1, len(results))
+        self.assertTrue(results[0])
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import unittest
+from collections import namedtuple
 
 # noinspection PyProtectedMember
-from apm.core import Capture, Some, _is_a, _get_as
-from apm import match, InstanceOf
+from apm.core import Capture, Some, _is_a, _get_as, _registered_pattern_handlers, _pattern_handlers
+from apm import match, InstanceOf, register_pattern_type
 
 
 class CoreTest(unittest.TestCase):
@@ -24,3 +25,31 @@ class CoreTest(unittest.TestCase):
     def test_match_result(self):
         self.assertEqual(3, match(3, 'x' @ InstanceOf(int)).get('x'))
         self.assertEqual(None, match(3, 'x' @ InstanceOf(int)).get('y'))
+
+    def test_namedtuple_is_compared_not_matched_as_sequence(self):
+        Pair = namedtuple('Pair', 'a b')
+        self.assertTrue(match((1, 2), Pair(1, 2)))
+        self.assertFalse(match([1, 2], Pair(1, 2)))
+        self.assertTrue(match((1, 2), (1, 2)))
+
+    def test_register_pattern_type(self):
+        class Prefix(str):
+            pass
+
+        def match_prefix(value, pattern, *, ctx, strict):
+            return ctx.match_if(isinstance(value, str) and value.startswith(pattern))
+
+        try:
+            register_pattern_type(Prefix, match_prefix)
+            self.assertTrue(match('foobar', Prefix('foo')))
+            self.assertFalse(match('barfoo', Prefix('foo')))
+            self.assertTrue(match({'k': 'foobar'}, {'k': Prefix('foo')}))
+
+            class LongPrefix(Prefix):
+                pass
+
+            self.assertTrue(match('foobar', LongPrefix('foo')))
+        finally:
+            del _registered_pattern_handlers[Prefix]
+            _pattern_handlers.clear()
+        self.assertFalse(match('foobar', Prefix('foo')))
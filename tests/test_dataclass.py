@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import gc
+import sys
+import unittest
+from dataclasses import dataclass, field
+
+from apm import *
+# noinspection PyProtectedMember
+from apm.core import transform, _dataclass_fields, _get_dataclass_fields
+
+
+@dataclass(frozen=True)
+class Point:
+    x: int
+    y: int
+
+
+@dataclass(frozen=True)
+class Point3D(Point):
+    z: int
+
+
+class DataclassTest(unittest.TestCase):
+
+    def test_frozen(self):
+        result = match(Point(1, 2), Point('x' @ _, 2))
+        self.assertTrue(result)
+        self.assertEqual(1, result['x'])
+        self.assertFalse(match(Point(1, 2), Point(1, 3)))
+
+    def test_subclass(self):
+        self.assertTrue(match(Point3D(1, 2, 3), Point(1, 2)))
+        self.assertFalse(match(Point3D(1, 2, 3), Strict(Point(1, 2))))
+        self.assertFalse(match(Point(1, 2), Point3D(1, 2, 3)))
+
+    @unittest.skipIf(sys.version_info < (3, 10), "slots=True requires python 3.10+")
+    def test_slots(self):
+        @dataclass(frozen=True, slots=True)
+        class Slotted:
+            name: str
+            age: int
+
+        self.assertFalse(hasattr(Slotted('x', 1), '__dict__'))
+        result = match(Slotted('Jane', 42), Slotted('name' @ InstanceOf(str), Between(18, 99)))
+        self.assertTrue(result)
+        self.assertEqual('Jane', result['name'])
+        self.assertFalse(match(Slotted('Jane', 12), Slotted(_, Between(18, 99))))
+        self.assertTrue(match(Slotted('Jane', 42), Attrs(age=42)))
+
+    @unittest.skipIf(sys.version_info < (3, 10), "slots=True requires python 3.10+")
+    def test_slots_transform(self):
+        @dataclass(slots=True)
+        class Slotted:
+            name: str
+            age: int
+
+        pattern = transform(Slotted('name' @ _, _), lambda p: p)
+        result = match(Slotted('Jane', 42), pattern)
+        self.assertTrue(result)
+        self.assertEqual('Jane', result['name'])
+
+    def test_non_field_attributes_are_ignored(self):
+        @dataclass
+        class Thing:
+            name: str
+            internal: list = field(default_factory=list, compare=False)
+
+            def __post_init__(self):
+                self.cache = object()
+
+        self.assertTrue(match(Thing('a'), Strict(Thing('a'))))
+
+    def test_only_referenced_fields_are_read(self):
+        reads = []
+
+        @dataclass
+        class Lazy:
+            a: int
+            b: int
+
+        class Recording(Lazy):
+            def __getattribute__(self, item):
+                reads.append(item)
+                return super().__getattribute__(item)
+
+        self.assertTrue(match(Recording(1, 2), transform(Lazy(1, 2), lambda p: p)))
+        self.assertEqual(['a', 'b'], [r for r in reads if r in ('a', 'b')])
+
+    def test_fields_are_cached_per_type(self):
+        self.assertIsNone(_get_dataclass_fields(int))
+        fields = _get_dataclass_fields(Point)
+        self.assertEqual(('x', 'y'), tuple(name for name, _getter in fields))
+        self.assertIs(fields, _get_dataclass_fields(Point))
+
+    def test_cache_does_not_keep_types_alive(self):
+        @dataclass
+        class Ephemeral:
+            a: int
+
+        self.assertTrue(match(Ephemeral(1), Ephemeral(1)))
+        gc.collect()
+        size = len(_dataclass_fields)
+        del Ephemeral
+        gc.collect()
+        self.assertEqual(size - 1, len(_dataclass_fields))
+
+
+if __name__ == '__main__':
+    unittest.main()
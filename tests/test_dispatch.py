@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import random
+import unittest
+from dataclasses import dataclass
+
+from apm import *
+
+
+@dataclass
+class Circle:
+    radius: float
+
+
+@dataclass
+class Square:
+    side: float
+
+
+@dataclass
+class Rectangle:
+    width: float
+    height: float
+
+
+class Shape:
+    pass
+
+
+class Triangle(Shape):
+    pass
+
+
+class OneOfDispatchTest(unittest.TestCase):
+
+    def test_dict_discriminator_skips_alternatives(self):
+        tried = []
+
+        def alternative(kind):
+            return {'kind': kind, 'payload': Check(lambda _v: tried.append(kind) or True) >> 'payload'}
+
+        kinds = [f"kind{ix}" for ix in range(40)]
+        pattern = OneOf(*(alternative(kind) for kind in kinds))
+        result = match({'kind': 'kind37', 'payload': 1}, pattern)
+        self.assertTrue(result)
+        self.assertEqual(1, result['payload'])
+        self.assertEqual(['kind37'], tried)
+        self.assertFalse(match({'kind': 'kind40', 'payload': 1}, pattern))
+        self.assertFalse(match({'payload': 1}, pattern))
+        self.assertEqual(['kind37'], tried)
+
+    def test_first_match_order_with_wildcards(self):
+        pattern = OneOf(
+            {'kind': 'a', 'n': 'first' @ InstanceOf(int)},
+            {'n': 'second' @ InstanceOf(int)},
+            {'kind': 'b'},
+            {'kind': 'a', 'm': 'third' @ _},
+            {'kind': 'c'},
+            {'kind': 'd'},
+            'fallback' @ _,
+        )
+        self.assertEqual({'first': 1}, match({'kind': 'a', 'n': 1}, pattern).groups())
+        self.assertEqual({'second': 1}, match({'kind': 'b', 'n': 1}, pattern).groups())
+        self.assertEqual({'third': 2}, match({'kind': 'a', 'n': 'x', 'm': 2}, pattern).groups())
+        self.assertEqual({'fallback': {'kind': 'z'}}, match({'kind': 'z'}, pattern).groups())
+        self.assertEqual({'fallback': 3}, match(3, pattern).groups())
+
+    def test_literals(self):
+        pattern = OneOf(*range(10), 'x' @ InstanceOf(str), Value(10))
+        self.assertEqual(pattern.patterns[3:4], pattern.candidates(3)[:1])
+        self.assertTrue(match(3, pattern))
+        self.assertTrue(match(3.0, pattern))
+        self.assertTrue(match(True, pattern))
+        self.assertTrue(match(10, pattern))
+        self.assertFalse(match(11, pattern))
+        self.assertEqual({'x': 'foo'}, match('foo', pattern).groups())
+
+    def test_types(self):
+        pattern = OneOf(
+            Circle('r' @ _),
+            Square('a' @ _),
+            Rectangle('w' @ _, 'h' @ _),
+            Object(Triangle) >> 'triangle',
+            Object(Shape) >> 'shape',
+        )
+        self.assertEqual(1, len(pattern.candidates(Circle(1))))
+        self.assertEqual({'r': 1}, match(Circle(1), pattern).groups())
+        self.assertEqual({'w': 1, 'h': 2}, match(Rectangle(1, 2), pattern).groups())
+        self.assertEqual('triangle', next(iter(match(Triangle(), pattern).groups())))
+        self.assertEqual('shape', next(iter(match(Shape(), pattern).groups())))
+        self.assertFalse(match(3, pattern))
+
+    def test_equivalent_to_sequential(self):
+        rnd = random.Random(99)
+        for _i in range(50):
+            alternatives = []
+            for _j in range(rnd.randrange(4, 12)):
+                choice = rnd.randrange(4)
+                if choice == 0:
+                    alternatives.append({'kind': rnd.randrange(5), 'x': 'x' @ _})
+                elif choice == 1:
+                    alternatives.append({'kind': rnd.randrange(5)})
+                elif choice == 2:
+                    alternatives.append(rnd.randrange(5))
+                else:
+                    alternatives.append(Capture({'x': rnd.randrange(3)}, name='y'))
+            pattern = OneOf(*alternatives)
+            for value in [0, 1, 2, True, 'x', {'kind': 1}, {'kind': 2, 'x': 1}, {'x': 0}, {'kind': [1]}, None]:
+                expected = None
+                for alternative in alternatives:
+                    result = match(value, alternative)
+                    if result:
+                        expected = result.groups()
+                        break
+                result = match(value, pattern)
+                self.assertEqual(expected is not None, bool(result))
+                if result:
+                    self.assertEqual(expected, result.groups())
+
+    def test_jump_table_is_built_once_warmed_up(self):
+        pattern = OneOf(*range(10))
+        for _i in range(OneOf.dispatch_after):
+            self.assertTrue(match(9, pattern))
+        self.assertIsNone(pattern._dispatch)
+        self.assertTrue(match(9, pattern))
+        self.assertFalse(match(10, pattern))
+        self.assertIsNotNone(pattern._dispatch)
+
+    def test_equality_ignores_dispatch_table(self):
+        a = OneOf(*range(10))
+        b = OneOf(*range(10))
+        match(3, a)
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(repr(a), repr(b))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,5 +50,41 @@ class GenericTests(unittest.TestCase):
 
         self.assertEqual("X({a=1, b=2})", repr(x))
 
+    def test_slots(self):
+        class X(AutoEqHash, AutoRepr):
+            __slots__ = ('a', 'b', 'cache')
+            _derived_attributes = frozenset({'cache'})
+
+            def __init__(self, a, b):
+                self.a = a
+                self.b = b
+                self.cache = object()
+
+        self.assertFalse(hasattr(X(1, 2), '__dict__'))
+        self.assertEqual(X(1, 2), X(1, 2))
+        self.assertNotEqual(X(1, 2), X(1, 3))
+        self.assertEqual(hash(X(1, [2])), hash(X(1, [2])))
+        self.assertEqual("X({a=1, b=2})", repr(X(1, 2)))
+
+    def test_hash_is_cached(self):
+        class X(AutoEqHash):
+            __slots__ = ('a',)
+
+            def __init__(self, a):
+                self.a = a
+
+        x = X([1])
+        h = hash(x)
+        x.a.append(2)
+        self.assertEqual(h, hash(x))
+        # noinspection PyProtectedMember
+        x._reset_hash()
+        self.assertEqual(hash(X([1, 2])), hash(x))
+
+    def test_patterns_have_no_dict(self):
+        from apm import AllOf, Capture, InstanceOf, OneOf, Some
+        for pattern in (OneOf(1, 2), AllOf(InstanceOf(int)), Capture(1, name='x'), Some(1)):
+            self.assertFalse(hasattr(pattern, '__dict__'), pattern)
+
     def test_repr(self):
         self.assertEqual("{0='a', 1='b'}", _repr({0: "a", 1: "b"}))
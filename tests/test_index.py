@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import random
+from datetime import date
+from itertools import chain
+import unittest
+from dataclasses import dataclass
+
+from apm import *
+
+
+@dataclass
+class Order:
+    id: int
+    status: str
+
+
+KINDS = ['login', 'logout', 'purchase', 'refund', 'view']
+COUNTRIES = ['de', 'fr', 'us', 'jp']
+
+
+def random_pattern(rnd: random.Random):
+    pattern = {}
+    choice = rnd.randrange(6)
+    if choice == 0:
+        pattern['kind'] = rnd.choice(KINDS)
+    elif choice == 1:
+        pattern['kind'] = OneOf(*rnd.sample(KINDS, 2))
+    elif choice == 2:
+        pattern['kind'] = InstanceOf(str)
+    elif choice == 3:
+        pattern['kind'] = 'kind' @ _
+    if rnd.random() < 0.5:
+        pattern['meta'] = {'country': rnd.choice(COUNTRIES)}
+    if rnd.random() < 0.3:
+        pattern['amount'] = Between(rnd.randrange(100), rnd.randrange(100, 200))
+    if rnd.random() < 0.2:
+        return At('meta.country', rnd.choice(COUNTRIES)) & pattern
+    return pattern
+
+
+def random_event(rnd: random.Random):
+    event = {'kind': rnd.choice(KINDS + [7, None])}
+    if rnd.random() < 0.7:
+        event['meta'] = {'country': rnd.choice(COUNTRIES)} if rnd.random() < 0.9 else ['de']
+    if rnd.random() < 0.5:
+        event['amount'] = rnd.randrange(200)
+    return event
+
+
+class PatternIndexTest(unittest.TestCase):
+
+    def test_lookup(self):
+        index = PatternIndex()
+        index.add('login', {'type': 'login', 'user': 'user' @ InstanceOf(str)})
+        index.add('logout', {'type': 'logout'})
+        index.add('any', {'type': _})
+        result = index.lookup({'type': 'login', 'user': 'jane'})
+        self.assertEqual(['login', 'any'], list(result))
+        self.assertEqual('jane', result['login']['user'])
+
+    def test_candidates_are_pruned(self):
+        index = PatternIndex(leaf_size=2)
+        for ix, kind in enumerate(KINDS * 10):
+            index.add(ix, {'kind': kind, 'n': ix % 2})
+        self.assertEqual([0, 10, 20, 30, 40], index.candidates({'kind': 'login', 'n': 0}))
+        self.assertEqual([], index.candidates({'kind': 'login'}))
+        self.assertEqual([5, 15, 25, 35, 45], list(index.lookup({'kind': 'login', 'n': 1})))
+        self.assertEqual([], index.candidates({'kind': 'unknown'}))
+        self.assertEqual([], index.candidates({}))
+
+    def test_types(self):
+        index = PatternIndex(leaf_size=1)
+        index.add('order', Order(_, 'open'))
+        index.add('object', Object(Order, status='closed'))
+        index.add('int', InstanceOf(int))
+        index.add('str', InstanceOf(str))
+        self.assertEqual(['order'], list(index.lookup(Order(1, 'open'))))
+        self.assertEqual(['object'], list(index.lookup(Order(1, 'closed'))))
+        self.assertEqual(['int'], index.candidates(3))
+        self.assertEqual(['int'], index.candidates(True))
+
+    def test_add_remove(self):
+        index = PatternIndex(leaf_size=2)
+        for ix in range(20):
+            index.add(ix, {'kind': KINDS[ix % len(KINDS)]})
+        self.assertEqual(20, len(index))
+        for ix in range(0, 20, 2):
+            index.remove(ix)
+        self.assertEqual(10, len(index))
+        self.assertNotIn(0, index)
+        self.assertEqual([5, 15], list(index.lookup({'kind': 'login'})))
+        index.add(5, {'kind': 'logout'})
+        self.assertEqual([15], list(index.lookup({'kind': 'login'})))
+        self.assertEqual([1, 11, 5], list(index.lookup({'kind': 'logout'})))
+        with self.assertRaises(KeyError):
+            index.remove(0)
+
+    def test_removal_prunes_the_tree(self):
+        def size(node):
+            if node.is_leaf:
+                return 1
+            children = [*node.literals.values(), *node.ranges.values(), *node.types.values(), node.other]
+            return 1 + sum(size(child) for child in children)
+
+        index = PatternIndex(leaf_size=2)
+        for ix in range(1000):
+            index.add(ix, {'id': ix, 'amount': Between(ix, ix + 1), 'kind': InstanceOf(str)})
+            if ix >= 10:
+                index.remove(ix - 10)
+        self.assertLess(size(index._root), 50)
+        for ix in range(990, 1000):
+            index.remove(ix)
+        self.assertEqual(1, size(index._root))
+        index.add('x', {'id': 1})
+        self.assertEqual(['x'], list(index.lookup({'id': 1})))
+
+    def test_equivalent_to_sequential_matching(self):
+        rnd = random.Random(4711)
+        patterns = {ix: random_pattern(rnd) for ix in range(500)}
+        index = PatternIndex()
+        for ix, pattern in patterns.items():
+            index.add(ix, pattern)
+        for _i in range(300):
+            event = random_event(rnd)
+            expected = [ix for ix, pattern in patterns.items() if match(event, pattern)]
+            self.assertEqual(expected, list(index.lookup(event)), event)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def test_stab(self):
+        prices = IntervalIndex()
+        prices.add('cheap', Between(0, 10, upper_bound_exclusive=True))
+        prices.add('regular', Between(10, 100))
+        prices.add('premium', lower=100, upper=1000, lower_bound_exclusive=True)
+        self.assertEqual(['cheap'], prices.stab(0))
+        self.assertEqual(['regular'], prices.stab(10))
+        self.assertEqual(['regular'], prices.stab(100))
+        self.assertEqual(['premium'], prices.stab(100.5))
+        self.assertEqual([], prices.stab(-1))
+        prices.remove('regular')
+        self.assertEqual([], prices.stab(10))
+        self.assertEqual(2, len(prices))
+
+    def test_dates_and_strings(self):
+        quarters = IntervalIndex()
+        quarters.add('q1', Between(date(2021, 1, 1), date(2021, 3, 31)))
+        quarters.add('q2', Between(date(2021, 4, 1), date(2021, 6, 30)))
+        quarters.add('h1', Between(date(2021, 1, 1), date(2021, 7, 1), upper_bound_exclusive=True))
+        self.assertEqual(['q2', 'h1'], quarters.stab(date(2021, 5, 17)))
+        self.assertEqual([], quarters.stab(date(2021, 7, 1)))
+
+        shards = IntervalIndex()
+        shards.add('a-m', Between('a', 'n', upper_bound_exclusive=True))
+        shards.add('n-z', Between('n', 'z~'))
+        self.assertEqual(['a-m'], shards.stab('mallory'))
+        self.assertEqual(['n-z'], shards.stab('n'))
+
+    def test_bounds_of_mixed_types(self):
+        index = IntervalIndex()
+        index.add('digits', Between('0', '9'))
+        index.add('small', Between(0, 9))
+        self.assertEqual(['digits'], index.stab('5'))
+        self.assertEqual(['small'], index.stab(5))
+        self.assertEqual([], index.stab(2.5j))
+        self.assertIsNotNone(index._mixed)
+        index.remove('digits')
+        self.assertEqual(['small'], index.stab(5))
+        self.assertIsNone(index._mixed)
+
+        patterns = PatternIndex(leaf_size=1)
+        patterns.add('digits', {'k': Between('0', '9')})
+        patterns.add('small', {'k': Between(0, 9)})
+        self.assertEqual(['digits'], patterns.candidates({'k': '5'}))
+        self.assertEqual(['digits'], list(patterns.lookup({'k': '5'})))
+        self.assertEqual(['small'], list(patterns.lookup({'k': 5})))
+
+    def test_equivalent_to_between(self):
+        rnd = random.Random(1337)
+        index = IntervalIndex()
+        ranges = {}
+        for ix in range(300):
+            lower = rnd.randrange(1000)
+            ranges[ix] = Between(lower, lower + rnd.randrange(100),
+                                 lower_bound_exclusive=rnd.random() < 0.5,
+                                 upper_bound_exclusive=rnd.random() < 0.5)
+            index.add(ix, ranges[ix])
+        for ix in range(0, 300, 3):
+            index.remove(ix)
+            del ranges[ix]
+        for value in chain(range(-5, 1105, 3), (rnd.uniform(0, 1100) for _i in range(100))):
+            self.assertEqual([ix for ix, between in ranges.items() if match(value, between)], index.stab(value))
+
+    def test_pattern_index_routes(self):
+        rnd = random.Random(42)
+        patterns = {}
+        index = PatternIndex()
+        for ix in range(1000):
+            lower = rnd.randrange(5000)
+            patterns[ix] = At('order.price', Between(lower, lower + rnd.randrange(1, 50)))
+            index.add(ix, patterns[ix])
+        index.add('cheap', {'order': {'price': Between(0, 1, upper_bound_exclusive=True)}})
+        patterns['cheap'] = {'order': {'price': Between(0, 1, upper_bound_exclusive=True)}}
+        for _i in range(100):
+            event = {'order': {'price': rnd.uniform(0, 5050)}}
+            candidates = index.candidates(event)
+            self.assertLess(len(candidates), 100)
+            self.assertEqual([ix for ix, p in patterns.items() if match(event, p)], list(index.lookup(event)))
+        self.assertEqual(['cheap'], list(index.lookup({'order': {'price': 0.5}})))
+        with self.assertRaises(TypeError):
+            # just like matching a string against Between() with numbers does
+            index.lookup({'order': {'price': 'free'}})
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import gc
+import unittest
+
+from apm import *
+from apm.core import Underscore
+
+
+def positive(x):
+    return x > 0
+
+
+class InternTest(unittest.TestCase):
+
+    def test_equal_patterns_are_shared(self):
+        table = InternTable()
+        a = table.intern(InstanceOf(int) & Check(positive))
+        b = table.intern(InstanceOf(int) & Check(positive))
+        self.assertIs(a, b)
+        rules = table.intern([{'n': InstanceOf(int) & Check(positive)}, OneOf(InstanceOf(int) & Check(positive))])
+        self.assertIs(a, rules[0]['n'])
+        self.assertIs(a, rules[1].patterns[0])
+
+    def test_strictly_different_literals_are_not_shared(self):
+        table = InternTable()
+        self.assertIsNot(table.intern(Value(1)), table.intern(Value(True)))
+        self.assertIsNot(table.intern(OneOf(1, 2)), table.intern(OneOf(1.0, 2)))
+        self.assertIs(table.intern(OneOf(1, 2)), table.intern(OneOf(1, 2)))
+
+    def test_wildcards_and_functions_are_compared_by_identity(self):
+        table = InternTable()
+        # every wildcard records its own match
+        self.assertIsNot(table.intern(AllOf(InstanceOf(int), Underscore())),
+                         table.intern(AllOf(InstanceOf(int), Underscore())))
+        self.assertIsNot(table.intern(Check(lambda x: x)), table.intern(Check(lambda x: x)))
+        target_a, target_b = {}, {}
+        self.assertIsNot(table.intern(Capture(1, name='x', target=target_a)),
+                         table.intern(Capture(1, name='x', target=target_b)))
+
+    def test_interned_pattern_matches_the_same(self):
+        pattern = {'a': 'x' @ InstanceOf(int), 'b': [1, Some(InstanceOf(str)), 'y' @ _]}
+        interned = intern_pattern(pattern)
+        for value in ({'a': 1, 'b': [1, 'q', 2]}, {'a': 'z', 'b': [1]}, {'a': 1, 'b': [1, 2]}):
+            expected, actual = match(value, pattern), match(value, interned)
+            self.assertEqual(bool(expected), bool(actual))
+            self.assertEqual(expected.groups(), actual.groups())
+
+    def test_entries_are_weak(self):
+        table = InternTable()
+        table.intern(InstanceOf(bytes) & Length(at_least=3))
+        gc.collect()
+        self.assertEqual(0, len(table))
+        kept = table.intern(InstanceOf(bytes) & Length(at_least=3))
+        self.assertEqual(3, len(table))
+        self.assertIs(kept, table.intern(InstanceOf(bytes) & Length(at_least=3)))
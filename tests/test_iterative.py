@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import dataclasses
+import unittest
+from typing import Any, List
+
+from apm import *
+from apm.iterative import match_iteratively
+
+TREE = Rec('tree', {'value': InstanceOf(int), 'children': Each(Ref('tree'))})
+JSON = Rec('json', OneOf(None, IsString, IsNumber, InstanceOf(list) & Each(Ref('json')),
+                         InstanceOf(dict) & EachItem(IsString, Ref('json'))))
+
+
+def tree(depth: int, leaf=0):
+    node = {'value': leaf, 'children': []}
+    for i in range(depth):
+        node = {'value': i, 'children': [node]}
+    return node
+
+
+@dataclasses.dataclass
+class Node:
+    op: str
+    args: List[Any]
+
+
+class RecTest(unittest.TestCase):
+
+    def test_recursive_pattern(self):
+        self.assertTrue(match({'value': 1, 'children': [tree(3), tree(0)]}, TREE))
+        self.assertFalse(match({'value': 1, 'children': [tree(3, leaf='x')]}, TREE))
+        self.assertTrue(match({'a': [1, 'b', {'c': None}]}, JSON))
+        self.assertFalse(match({'a': [1, {'c': object()}]}, JSON))
+        self.assertFalse(match({'a': [1, {'c': object()}]}, JSON, iterative=True))
+
+    def test_captures(self):
+        pattern = Rec('tree', {'value': 'values' @ _, 'children': Each(Ref('tree'))})
+        result = match(tree(3), pattern, multimatch=True)
+        self.assertEqual([2, 1, 0, 0], result['values'])
+
+    def test_innermost_rec(self):
+        # lists of pairs of lists of ...
+        pattern = Rec('list', Each(Rec('pair', OneOf((Ref('list'), Ref('list')), 'x'))))
+        self.assertTrue(match([([], ['x', ([], [])])], pattern))
+        self.assertFalse(match([([], ['y'])], pattern))
+
+    def test_unbound_ref(self):
+        with self.assertRaises(ValueError):
+            match({'children': [1]}, {'children': Each(Ref('tree'))})
+
+    def test_equality_serialization_and_analysis(self):
+        same = Rec('tree', {'value': InstanceOf(int), 'children': Each(Ref('tree'))})
+        self.assertEqual(TREE, same)
+        self.assertEqual(hash(TREE), hash(same))
+        self.assertNotEqual(TREE, Rec('other', {'value': InstanceOf(int), 'children': Each(Ref('other'))}))
+        self.assertEqual(TREE, deserialize(serialize(TREE)))
+        self.assertTrue(match(tree(3), deserialize(serialize(TREE))))
+        self.assertTrue(compile_pattern(TREE).match(tree(3)))
+        self.assertTrue(match(tree(3), TREE, memoize=True))
+
+
+class IterativeTest(unittest.TestCase):
+
+    def test_deep_values(self):
+        deep = tree(10000)
+        with self.assertRaises(RecursionError):
+            match(deep, TREE)
+        self.assertTrue(match(deep, TREE, iterative=True))
+        self.assertTrue(match(deep, Strict(TREE), iterative=True))
+        value = deep
+        for _ in range(5000):
+            value = value['children'][0]
+        value['value'] = 'x'
+        result = match(deep, TREE, iterative=True)
+        self.assertFalse(result)
+        self.assertIn('InstanceOf', result.explain(short=True))
+
+    def test_deep_dataclasses(self):
+        pattern = Rec('expr', OneOf(InstanceOf(int), Node('add', [Ref('expr'), Ref('expr')])))
+        expr = 1
+        for _ in range(10000):
+            expr = Node('add', [expr, 2])
+        self.assertTrue(match(expr, pattern, iterative=True))
+        self.assertFalse(match(Node('add', [expr, 'x']), pattern, iterative=True))
+        self.assertFalse(match(Node('sub', [expr, 2]), pattern, iterative=True))
+
+    def test_same_as_interpreter(self):
+        cases = [
+            ({'a': 1, 'b': [1, 2, 3]}, {'a': 'a' @ _, 'b': [_, 'x' @ InstanceOf(int), ...]}),
+            ({'a': 1, 'b': [1, 2, 3]}, {'a': 'a' @ _, 'b': [_, Some(_)]}),
+            ({'a': 1, 'b': 2}, {'a': 1, _: 'rest' @ _}),
+            ({'a': 1, 'b': 2}, {'a': 1} ** Remainder('rest' @ _)),
+            ({'a': 1, 'b': 2}, Strict({'a': 1})),
+            ((1, 2.0), ('x' @ _, 'y' @ Not(InstanceOf(int)))),
+            ((1, 2.0), [_, _]),
+            ([1, 2], Strict((_, _))),
+            ([1, 'x', 3], Each(OneOf(InstanceOf(int) >> 'n', IsString >> 's'))),
+            (1.0, Strict(1)),
+            (1.0, AllOf(1, InstanceOf(float) >> 'f', Either(1, 2))),
+            (Node('neg', [3]), Node('neg', ['x' @ _])),
+            (Node('neg', [3]), Node('pos', ['x' @ _])),
+            ({'k': 'v'}, EachItem('key' @ _, 'val' @ _)),
+            (tree(5), TREE),
+        ]
+        for value, pattern in cases:
+            for multimatch in (False, True):
+                with self.subTest(value=value, pattern=pattern, multimatch=multimatch):
+                    expected = match(value, pattern, multimatch=multimatch)
+                    actual = match(value, pattern, multimatch=multimatch, iterative=True)
+                    self.assertEqual(bool(expected), bool(actual))
+                    self.assertEqual(expected.groups(), actual.groups())
+                    self.assertEqual(expected.wildcard_matches(), actual.wildcard_matches())
+
+    def test_scopes_are_left_on_errors(self):
+        ctx = MatchContext()
+        pattern = Rec('tree', {'children': Each(Ref('tree')), 'check': Check(lambda x: 1 / x)})
+        with self.assertRaises(ZeroDivisionError):
+            match_iteratively({'children': [{'children': [], 'check': 0}], 'check': 1}, pattern, ctx=ctx)
+        self.assertFalse(ctx._references)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import enum
+import unittest
+from dataclasses import dataclass
+
+from apm import *
+from apm.analysis import is_memoizable
+from apm.cache import value_key
+from apm.compiler import memoization
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+@dataclass(frozen=True)
+class Key:
+    name: str
+    version: int
+
+
+class MemoizeTest(unittest.TestCase):
+
+    def setUp(self):
+        memoization.clear()
+
+    def test_value_key(self):
+        self.assertNotEqual(value_key(1), value_key(True))
+        self.assertNotEqual(value_key((1, 2)), value_key((1.0, 2)))
+        self.assertNotEqual(value_key(0.0), value_key(-0.0))
+        self.assertEqual(value_key(float('nan')), value_key(float('nan')))
+        self.assertNotEqual(value_key(Key('a', 1)), value_key(Key('a', True)))
+        self.assertEqual(value_key(frozenset({1, 2})), value_key(frozenset({2, 1})))
+        self.assertIsNotNone(value_key(Color.RED))
+        self.assertIsNone(value_key([1]))
+        self.assertIsNone(value_key((1, [2])))
+
+    def test_is_memoizable(self):
+        self.assertTrue(is_memoizable({'a': 'x' @ InstanceOf(int), 'b': [_, ...]}))
+        self.assertTrue(is_memoizable(Regex(r'(?P<n>\d+)') & Between('0', '9')))
+        self.assertTrue(is_memoizable(Check(pure(lambda x: x > 0))))
+        self.assertFalse(is_memoizable(Check(lambda x: x > 0)))
+        self.assertFalse(is_memoizable(Transformed(str, _)))
+        self.assertFalse(is_memoizable(Capture(_, name='x', target={})))
+        self.assertFalse(is_memoizable(Capture(_, name='x', agg=agg.Count())))
+
+    def test_captures(self):
+        calls = []
+
+        @pure
+        def version(k: Key):
+            calls.append(k)
+            return k.version
+
+        pattern = AllOf(Key('name' @ InstanceOf(str), _), Transformed(version, 'v' @ Between(1, 3)))
+        for _i in range(3):
+            result = match(Key('a', 2), pattern, memoize=True)
+            self.assertTrue(result)
+            self.assertEqual({'name': 'a', 'v': 2}, result.groups())
+            self.assertEqual([2], result.wildcard_matches())
+        self.assertEqual(1, len(calls))
+        self.assertEqual(2, memoization.memo(pattern).cache.hits)
+
+    def test_results_are_independent(self):
+        pattern = Strict(('x' @ _, 'x' @ _))
+        first = match((1, 2), pattern, multimatch=True, memoize=True)
+        first['x'].append(3)
+        first.groups()['y'] = 4
+        second = match((1, 2), pattern, multimatch=True, memoize=True)
+        self.assertEqual({'x': [1, 2]}, second.groups())
+        self.assertEqual(2, match((1, 2), pattern, memoize=True)['x'])
+
+    def test_strict_and_types(self):
+        pattern = Capture(OneOf(1, 2), name='n')
+        self.assertTrue(match(True, pattern, memoize=True))
+        self.assertFalse(match(True, pattern, strict=True, memoize=True))
+        self.assertTrue(match(1, pattern, strict=True, memoize=True))
+        self.assertIs(True, match(True, pattern, memoize=True)['n'])
+
+    def test_no_match_explains(self):
+        pattern = Capture(InstanceOf(int), name='n')
+        for _i in range(2):
+            result = match('x', pattern, memoize=True)
+            self.assertFalse(result)
+            self.assertIn("did not match", result.explain())
+
+    def test_impure_patterns_are_not_memoized(self):
+        calls = []
+        pattern = Check(lambda x: calls.append(x) or True)
+        for _i in range(3):
+            self.assertTrue(match(1, pattern, memoize=True))
+        self.assertEqual(3, len(calls))
+        self.assertIsNone(memoization.memo(pattern))
+
+        into = {}
+        pattern = Capture(_, name='x', target=into)
+        match(1, pattern, memoize=True)
+        match(2, pattern, memoize=True)
+        self.assertEqual({'x': 2}, into)
+
+    def test_unkeyed_values_are_matched(self):
+        pattern = Capture(Length(exactly=2), name='x')
+        value = [1, 2]
+        self.assertEqual(value, match(value, pattern, memoize=True)['x'])
+        value.append(3)
+        self.assertFalse(match(value, pattern, memoize=True))
+
+    def test_compiled(self):
+        compiled = compile_pattern({'kind': 'k' @ OneOf('a', 'b')}, memoize=True)
+        self.assertEqual('a', compiled.match({'kind': 'a'})['k'])
+        self.assertEqual('a', compiled.match({'kind': 'a'})['k'])
+        self.assertEqual(0, len(compiled.memo.cache))  # a dict can not be keyed
+        self.assertIsNone(compile_pattern({'x': Check(bool)}, memoize=True).memo)
+        compiled = compile_pattern(Each('k' @ OneOf('a', 'b')), memoize=ResultCache(maxsize=2))
+        self.assertEqual('b', compiled.match(('a', 'b')).get('k'))
+        self.assertEqual('b', compiled.match(('a', 'b')).get('k'))
+        self.assertFalse(compiled.match(('a', 'c')))
+        self.assertEqual(1, compiled.memo.cache.hits)
+        self.assertEqual(2, len(compiled.memo.cache))
+
+    def test_same_outcome(self):
+        values = [0, 1, True, 1.0, 'a', (1, 2), (True, 2), (1, 'a', 'b'), Key('a', 1), Color.RED, None]
+        patterns = [
+            'x' @ _,
+            Strict(('x' @ _, 2)),
+            (1, 'rest' @ Remaining(InstanceOf(str))),
+            OneOf(Key('n' @ _, 1), Color.RED, 'z' @ InstanceOf(int)),
+            Not(1) & ('y' @ _),
+            Check(pure(bool)),
+        ]
+        for pattern in patterns:
+            for value in values:
+                for strict in (False, True):
+                    for multimatch in (False, True):
+                        with self.subTest(pattern=pattern, value=value, strict=strict, multimatch=multimatch):
+                            expected = match(value, pattern, strict=strict, multimatch=multimatch)
+                            for _i in range(2):
+                                actual = match(value, pattern, strict=strict, multimatch=multimatch, memoize=True)
+                                self.assertEqual(bool(expected), bool(actual))
+                                self.assertEqual(expected.groups(), actual.groups())
+                                self.assertEqual(expected.wildcard_matches(), actual.wildcard_matches())
+
+
+if __name__ == '__main__':
+    unittest.main()
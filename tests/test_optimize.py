@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import random
+import unittest
+from dataclasses import dataclass
+
+from apm import *
+from apm.optimizer import LiteralSet, LiteralValue
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+VALUES = [
+    0, 1, 2, 3, 7, 10, -1, 1.0, 2.5, True, False, None, 'a', 'b', 'abc', b'a',
+    [], [1], [1, 2], [1, 2, 3], (1, 2), (1, True), {}, {'a': 1}, {'a': 1, 'b': 2}, {'a': [1, 2]}, {'a': True},
+    Point(1, 2), float('nan'), object,
+]
+
+
+def random_pattern(rng: random.Random, depth: int = 0):
+    leaves = [
+        lambda: rng.choice([0, 1, 2, 3, 1.0, True, False, None, 'a', 'b']),
+        lambda: ...,
+        lambda: InstanceOf(rng.choice([int, bool, float, str, object])),
+        lambda: Between(rng.randint(-1, 3), rng.randint(1, 8),
+                        lower_bound_exclusive=rng.random() < 0.5, upper_bound_exclusive=rng.random() < 0.5),
+        lambda: Check(lambda v: isinstance(v, int) and v % 2 == 0),
+        lambda: Capture(_, name=rng.choice('xyz')),
+    ]
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(leaves)()
+    nodes = [
+        lambda: AllOf(*(random_pattern(rng, depth + 1) for _i in range(rng.randint(0, 4)))),
+        lambda: OneOf(*(random_pattern(rng, depth + 1) for _i in range(rng.randint(1, 5)))),
+        lambda: OneOf(*rng.sample([random_pattern(rng, depth + 1), None, 'a'], rng.randint(2, 3))),
+        lambda: Not(random_pattern(rng, depth + 1)),
+        lambda: Strict(random_pattern(rng, depth + 1)),
+        lambda: Capture(random_pattern(rng, depth + 1), name=rng.choice('xyz')),
+        lambda: {'a': random_pattern(rng, depth + 1)},
+        lambda: [random_pattern(rng, depth + 1) for _i in range(rng.randint(0, 2))],
+        lambda: (random_pattern(rng, depth + 1), random_pattern(rng, depth + 1)),
+    ]
+    return rng.choice(nodes)()
+
+
+def outcome(value, pattern, **kwargs):
+    try:
+        result = match(value, pattern, **kwargs)
+    except TypeError:
+        return 'TypeError'
+    return bool(result), result.groups() if result else None
+
+
+class OptimizeTest(unittest.TestCase):
+
+    def test_flattens_nested_all_of_and_one_of(self):
+        p = optimize(AllOf(InstanceOf(int), AllOf(Check(bool), Capture(_, name='x'))))
+        self.assertEqual(AllOf, type(p))
+        self.assertEqual(3, len(p.patterns))
+        p = optimize(OneOf(InstanceOf(str), OneOf(InstanceOf(int), InstanceOf(float))))
+        self.assertEqual(3, len(p.patterns))
+
+    def test_literals_become_literal_set(self):
+        p = optimize(OneOf(1, 2, 3, 'x'))
+        self.assertIsInstance(p, LiteralSet)
+        self.assertTrue(match(2, p))
+        self.assertFalse(match(4, p))
+        self.assertTrue(match(True, p))
+        self.assertFalse(match(True, p, strict=True))
+        self.assertTrue(match(1, p, strict=True))
+
+    def test_literal_runs_keep_their_order(self):
+        p = optimize(OneOf(1, 2, InstanceOf(str) >> 'x', 3, 4))
+        self.assertEqual([LiteralSet, Capture, LiteralSet], [type(a) for a in p.patterns])
+
+    def test_none_is_an_alternative(self):
+        for pattern in (OneOf(InstanceOf(str), None), OneOf(1, None), OneOf(None, 'a', 'b')):
+            with self.subTest(pattern=pattern):
+                self.assertTrue(match(None, optimize(pattern)))
+
+    def test_between_is_intersected(self):
+        p = optimize(AllOf(Between(0, 10), Between(5, 20, upper_bound_exclusive=True)))
+        self.assertEqual(Between, type(p))
+        self.assertEqual((5, 10), (p.lower, p.upper))
+        self.assertFalse(p.lower_bound_exclusive)
+        self.assertFalse(p.upper_bound_exclusive)
+
+    def test_incomparable_betweens_are_left_alone(self):
+        p = optimize(AllOf(Between(0, 10), Between('a', 'z')))
+        self.assertEqual(AllOf, type(p))
+
+    def test_double_negation(self):
+        self.assertEqual(InstanceOf(int), optimize(Not(Not(InstanceOf(int)))))
+        # a plain value would be strict in a strict context, which the double negation is not
+        self.assertEqual(Not(Not(1)), optimize(Not(Not(1))))
+
+    def test_redundant_patterns_are_dropped(self):
+        self.assertEqual(InstanceOf(bool), optimize(AllOf(InstanceOf(bool), ..., InstanceOf(int))))
+        self.assertEqual(InstanceOf(int), optimize(AllOf(InstanceOf(int), InstanceOf(int))))
+        p = optimize(OneOf(InstanceOf(int), ..., InstanceOf(str)))
+        self.assertEqual(2, len(p.patterns))
+        # captures have an effect and are never dropped
+        capture = Capture(_, name='x')
+        self.assertEqual(2, len(optimize(AllOf(capture, capture)).patterns))
+
+    def test_literal_subtrees(self):
+        p = optimize({'a': [1, 2, {'b': (3, 4)}], 'c': Capture(_, name='c')})
+        self.assertIsInstance(p['a'], LiteralValue)
+        result = match({'a': [1, 2, {'b': (3, 4)}], 'c': 5}, p)
+        self.assertTrue(result)
+        self.assertEqual(5, result['c'])
+        self.assertFalse(match({'a': [1, 2, {'b': (3, 5)}], 'c': 5}, p))
+
+    def test_same_results_as_original(self):
+        rng = random.Random(31)
+        for _i in range(200):
+            pattern = random_pattern(rng)
+            optimized = optimize(pattern)
+            for value in VALUES:
+                for strict in (False, True):
+                    with self.subTest(pattern=pattern, value=value, strict=strict):
+                        self.assertEqual(outcome(value, pattern, strict=strict),
+                                         outcome(value, optimized, strict=strict))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import unittest
+
+from apm import *
+
+PATTERN = Strict({'id': 'id' @ InstanceOf(int), 'tags': ['first' @ _, ...]})
+
+
+small = register_function(lambda x: x < 100, name='tests.parallel.small')
+
+
+def record(i: int):
+    if i % 4 == 0:
+        return {'id': str(i), 'tags': []}
+    return {'id': i, 'tags': [f't{i}', 'x']}
+
+
+class ParallelTest(unittest.TestCase):
+
+    def check(self, results, n):
+        self.assertEqual(n, len(results))
+        for value, result in results:
+            expected = match(value, PATTERN)
+            self.assertEqual(bool(expected), bool(result))
+            self.assertEqual(expected.groups(), result.groups())
+            self.assertEqual(expected.wildcard_matches(), result.wildcard_matches())
+
+    def test_threads_ordered(self):
+        values = [record(i) for i in range(1000)]
+        results = list(match_parallel(values, PATTERN, workers=4, backend='thread', chunksize=7))
+        self.assertEqual(values, [value for value, _result in results])
+        self.check(results, 1000)
+
+    def test_threads_unordered(self):
+        results = list(match_parallel((record(i) for i in range(1000)), PATTERN, workers=3, backend='thread',
+                                      chunksize=10, ordered=False))
+        self.assertEqual([i for i in range(1000) if i % 4], sorted(r['id'] for _value, r in results if r))
+        self.check(results, 1000)
+
+    def test_processes(self):
+        values = [record(i) for i in range(200)]
+        results = list(match_parallel(values, PATTERN, workers=2, chunksize=16))
+        self.assertEqual(values, [value for value, _result in results])
+        self.check(results, 200)
+        _value, failed = results[0]
+        self.assertIn("did not match", failed.explain())
+
+    def test_processes_with_registered_function(self):
+        results = list(match_parallel(range(150), Check(small), workers=2, chunksize=32, ordered=False))
+        self.assertEqual(100, sum(1 for _value, result in results if result))
+
+    def test_stop_early(self):
+        results = match_parallel(range(10 ** 9), InstanceOf(int), workers=2, backend='thread', chunksize=100)
+        for i, (value, result) in enumerate(results):
+            self.assertTrue(result)
+            if i == 500:
+                break
+        results.close()
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            list(match_parallel([1], _, backend='fiber'))
+        with self.assertRaises(ValueError):
+            list(match_parallel([1], _, chunksize=0))
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(ZeroDivisionError):
+            list(match_parallel([1, 0], Check(lambda x: 1 / x), backend='thread', chunksize=1))
+
+    def test_aggregate_threads(self):
+        values = [record(i) for i in range(1000)]
+        pattern = OneOf({'id': InstanceOf(int) >> agg.Sum('total'), 'tags': [_ >> agg.Histogram('tags'), ...]},
+                        InstanceOf(dict) >> agg.Count('skipped'))
+        expected = {'total': sum(i for i in range(1000) if i % 4),
+                    'tags': {f't{i}': 1 for i in range(1000) if i % 4},
+                    'skipped': 250}
+        aggregates = aggregate_parallel(values, pattern, workers=4, backend='thread', chunksize=7)
+        self.assertEqual(expected, aggregates)
+
+    def test_aggregate_processes_keeps_order(self):
+        pattern = Check(small) >> agg.List('small')
+        self.assertEqual({'small': list(range(100))}, aggregate_parallel(range(150), pattern, workers=2, chunksize=9))
+
+    def test_aggregate_nothing(self):
+        self.assertEqual({}, aggregate_parallel([], _ >> agg.Count('n'), backend='thread'))
+        self.assertEqual({}, aggregate_parallel(['a'], InstanceOf(int) >> agg.Count('n'), backend='thread'))
+
+
+if __name__ == '__main__':
+    unittest.main()
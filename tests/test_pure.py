@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import unittest
+
+from apm import *
+
+
+class PureTest(unittest.TestCase):
+
+    def test_transformed_is_applied_once_per_value(self):
+        calls = []
+
+        @pure
+        def loads(s):
+            calls.append(s)
+            return json.loads(s)
+
+        pattern = OneOf(Transformed(loads, {'type': 'a', 'x': 'x' @ _}),
+                        Transformed(loads, {'type': 'b', 'y': 'y' @ _}),
+                        Transformed(loads, {'type': 'c'}))
+        result = match('{"type": "b", "y": 2}', pattern)
+        self.assertTrue(result)
+        self.assertEqual(2, result['y'])
+        self.assertEqual(1, len(calls))
+        match('{"type": "c"}', pattern)
+        self.assertEqual(2, len(calls))
+
+    def test_check_in_either(self):
+        calls = []
+
+        @pure
+        def positive(x):
+            calls.append(x)
+            return x > 0
+
+        self.assertFalse(match(3, Check(positive) ^ Check(positive)))
+        self.assertEqual([3], calls)
+
+    def test_structurally_identical_functions(self):
+        calls = []
+
+        def make():
+            return pure(lambda x: calls.append(x) or x * 2)
+
+        self.assertTrue(match(2, AllOf(Transformed(make(), 4), Transformed(make(), InstanceOf(int)))))
+        self.assertEqual([2], calls)
+
+    def test_functions_are_wrapped(self):
+        loads = pure(json.loads)
+        self.assertTrue(match('[1, 2]', Transformed(loads, [1, 2])))
+        self.assertEqual(pure(json.loads).__apm_pure__, loads.__apm_pure__)
+        self.assertFalse(hasattr(json.loads, '__apm_pure__'))
+        self.assertIs(loads, pure(loads))
+
+    def test_closure_over_unassigned_variable(self):
+        def positive(x):
+            return check(x)
+
+        pattern = Check(pure(positive)) | Check(pure(positive))
+        check = lambda x: x > 0  # noqa: E731
+        self.assertTrue(match(1, pattern))
+        self.assertFalse(match(-1, pattern))
+
+    def test_impure_functions_are_called_every_time(self):
+        calls = []
+
+        def f(x):
+            calls.append(x)
+            return x
+
+        match(1, OneOf(Transformed(f, 2), Transformed(f, 1)))
+        self.assertEqual([1, 1], calls)
+
+    def test_exceptions_are_remembered(self):
+        calls = []
+
+        @pure
+        def fail(x):
+            calls.append(x)
+            raise ValueError(x)
+
+        self.assertFalse(match(1, OneOf(Transformed(fail, _), Transformed(fail, _))))
+        self.assertEqual([1], calls)
+
+    def test_different_values_are_not_confused(self):
+        double = pure(lambda x: x * 2)
+        self.assertTrue(match([1, 2], [Transformed(double, 2), Transformed(double, 4)]))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import random
+import unittest
+from itertools import permutations
+
+from apm import *
+
+ORDER = {'type': 'order', 'id': 'order_id' @ _, 'customer': 'customer' @ _}
+PAYMENT = {'type': 'payment', 'order': 'order_id' @ _, 'amount': 'amount' @ InstanceOf(int)}
+SHIPMENT = {'type': 'shipment', 'order': 'order_id' @ _}
+
+
+def brute_force(facts, patterns):
+    result = set()
+    for handles in permutations(facts, len(patterns)):
+        groups = {}
+        ok = True
+        for handle, pattern in zip(handles, patterns):
+            m = match(facts[handle], pattern)
+            if not m or any(k in groups and groups[k] != v for k, v in m.items()):
+                ok = False
+                break
+            groups.update(m)
+        if ok:
+            result.add(handles)
+    return result
+
+
+class ReteTest(unittest.TestCase):
+
+    def test_join_on_shared_capture(self):
+        added, retracted = [], []
+        rete = Rete(on_match=added.append, on_retract=retracted.append)
+        rete.add_rule('paid', ORDER, PAYMENT)
+        order = rete.add({'type': 'order', 'id': 17, 'customer': 'jane'})
+        rete.add({'type': 'payment', 'order': 18, 'amount': 5})
+        self.assertEqual([], added)
+        payment = rete.add({'type': 'payment', 'order': 17, 'amount': 10})
+        self.assertEqual(1, len(added))
+        self.assertEqual('paid', added[0].rule)
+        self.assertEqual((order, payment), added[0].handles)
+        self.assertEqual({'order_id': 17, 'customer': 'jane', 'amount': 10}, added[0].groups)
+        self.assertEqual(added, rete.matches('paid'))
+
+        rete.remove(order)
+        self.assertEqual(added, retracted)
+        self.assertEqual([], rete.matches('paid'))
+
+    def test_rule_added_after_facts(self):
+        rete = Rete()
+        rete.add({'type': 'order', 'id': 1, 'customer': 'a'})
+        rete.add({'type': 'shipment', 'order': 1})
+        rete.add({'type': 'payment', 'order': 1, 'amount': 3})
+        rete.add_rule('done', ORDER, PAYMENT, SHIPMENT)
+        self.assertEqual(1, len(rete.matches('done')))
+
+    def test_shared_alpha_nodes(self):
+        rete = Rete()
+        rete.add_rule('paid', ORDER, PAYMENT)
+        rete.add_rule('shipped', ORDER, SHIPMENT)
+        # noinspection PyProtectedMember
+        self.assertEqual(3, len(rete._alphas))
+        rete.remove_rule('paid')
+        # noinspection PyProtectedMember
+        self.assertEqual(2, len(rete._alphas))
+
+    def test_equivalent_to_nested_loops(self):
+        rnd = random.Random(7)
+        rete = Rete()
+        patterns = [ORDER, PAYMENT, SHIPMENT]
+        rete.add_rule('all', *patterns)
+        rete.add_rule('orders', ORDER)
+        facts = {}
+        for step in range(300):
+            if len(facts) > 12 or facts and rnd.random() < 0.3:
+                handle = rnd.choice(list(facts))
+                rete.remove(handle)
+                del facts[handle]
+            else:
+                kind = rnd.choice(['order', 'payment', 'shipment', 'other'])
+                fact = {'type': kind, 'id': rnd.randrange(5), 'order': rnd.randrange(5),
+                        'customer': 'c', 'amount': rnd.choice([1, 'x'])}
+                facts[rete.add(fact)] = fact
+            if step % 10 == 0:
+                self.assertEqual(brute_force(facts, patterns), {m.handles for m in rete.matches('all')})
+                self.assertEqual(brute_force(facts, [ORDER]), {m.handles for m in rete.matches('orders')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import datetime
+import decimal
+import enum
+import json
+import re
+import unittest
+from dataclasses import dataclass
+
+from apm import *
+from apm.analysis import is_pure
+from apm.core import Underscore
+from apm.optimizer import optimize
+from apm.serialization import functions
+
+
+@register_function
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+@register_function
+@dataclass(frozen=True)
+class Point:
+    x: int
+    y: int
+
+
+@register_function(name='tests.is_even')
+def is_even(x):
+    return x % 2 == 0
+
+
+register_function(lambda x: x * 2, name='tests.double')
+register_function(str.upper, name='str.upper')
+register_function(len)
+register_function(datetime.date)
+register_function(decimal.Decimal)
+
+
+def roundtrip(pattern):
+    return deserialize(serialize(pattern))
+
+
+class SerializationTest(unittest.TestCase):
+
+    def assertSameMatches(self, pattern, values):
+        loaded = roundtrip(pattern)
+        for value in values:
+            for strict in (False, True):
+                with self.subTest(value=value, strict=strict):
+                    expected = match(value, pattern, strict=strict)
+                    actual = match(value, loaded, strict=strict)
+                    self.assertEqual(bool(expected), bool(actual))
+                    self.assertEqual(expected.groups(), actual.groups())
+                    self.assertEqual(expected.wildcard_matches(), actual.wildcard_matches())
+
+    def test_patterns(self):
+        patterns = [
+            {'id': 'id' @ InstanceOf(int), 'kind': OneOf('a', 'b', 1, 1.0, True), 'tags': [Some(str), ...]},
+            Strict(('x' @ _, _, Remaining(_))),
+            AllOf(InstanceOf(int, float), Between(0, 10, upper_bound_exclusive=True), adaptive=True) | Not(None),
+            Regex(r'(?P<n>\d+)-(\w+)', capture_wildcards=True),
+            Transformed(str.upper, Contains('A')) & Length(at_least=1),
+            Each(OneOf(*range(20))),
+            EachItem(Regex('[a-z]+'), InstanceOf(int)),
+            At('a.b', Value([1, 2])),
+            Items(a=1) & Attrs(real=1),
+            Point('x' @ _, Between(0, 5)),
+            OneOf(Color.RED, b'\x00', 1 + 2j, float('inf'), ..., frozenset({1})),
+            InstanceOf(int) & Check(is_even) & Transformed(functions.lookup('tests.double'), 'd' @ _),
+            optimize(OneOf('a', 'b', 'c', 1, True, 1.0)),
+            Capture(_, name='c', agg=agg.Count()),
+        ]
+        values = [0, 1, 2, 1.0, True, None, 'a', 'abc', 'A1', '12-ab', (1, 2), (1, 2, 3), [1, 2], {'a': 1},
+                  {'id': 1, 'kind': 'b', 'tags': ['x', 3]}, Point(1, 2), Color.RED, b'\x00', float('inf'),
+                  frozenset({1}), {'a': {'b': [1, 2]}}]
+        for pattern in patterns:
+            with self.subTest(pattern=pattern):
+                self.assertSameMatches(pattern, values)
+
+    def test_equal(self):
+        pattern = {'a': OneOf(1, 2) & Regex('x'), 'b': [Point(1, _), Strict(InstanceOf(int))]}
+        self.assertEqual(pattern, roundtrip(pattern))
+
+    def test_sharing(self):
+        shared = InstanceOf(int) & Between(1, 3)
+        pattern = (shared, shared, InstanceOf(int) & Between(1, 3))
+        loaded = roundtrip(pattern)
+        self.assertIs(loaded[0], loaded[1])
+        self.assertIs(loaded[0], loaded[2])  # structurally equal
+
+    def test_wildcards_keep_their_identity(self):
+        w1, w2 = Underscore(), Underscore()
+        pattern = (w1, w2, w1, _)
+        loaded = roundtrip(pattern)
+        self.assertIsNot(loaded[0], loaded[1])
+        self.assertIs(loaded[0], loaded[2])
+        self.assertIs(_, loaded[3])
+        self.assertEqual([1, 2], match((1, 2, 1, 3), loaded).wildcard_matches()[:2])
+
+    def test_types_are_kept_apart(self):
+        loaded = roundtrip([1, 1.0, True, (1,), (1.0,), (True,)])
+        self.assertEqual([int, float, bool], [type(v) for v in loaded[:3]])
+        self.assertEqual([int, float, bool], [type(v[0]) for v in loaded[3:]])
+
+    def test_values_by_reduce(self):
+        pattern = Between(datetime.date(2020, 1, 1), datetime.date(2021, 1, 1)) | decimal.Decimal('1.50')
+        loaded = roundtrip(pattern)
+        self.assertEqual(pattern, loaded)
+        self.assertTrue(match(datetime.date(2020, 5, 5), loaded))
+
+    def test_functions(self):
+        loaded = roundtrip(Check(is_even))
+        self.assertTrue(match(2, loaded))
+        with self.assertRaises(SerializationError):
+            serialize(Check(lambda x: x > 0))
+        registry = FunctionRegistry()
+        registry.register(lambda x: x > 0, name='positive')
+        data = serialize(Check(registry.lookup('positive')), registry=registry)
+        self.assertTrue(match(1, deserialize(data, registry=registry)))
+        with self.assertRaises(SerializationError):
+            deserialize(data, registry=FunctionRegistry())
+        with self.assertRaises(ValueError):
+            registry.register(lambda x: x, name='positive')
+        with self.assertRaises(ValueError):
+            registry.register(lambda x: x)
+
+    def test_pure(self):
+        loaded = roundtrip(Check(pure(is_even)) & Transformed(pure(len), 2))
+        self.assertTrue(is_pure(loaded))
+        self.assertTrue(match([1, 2], loaded.patterns[1]))
+
+    def test_cache(self):
+        cache = ResultCache(maxsize=10)
+        a, b = roundtrip((Check(is_even, cache=cache), Transformed(is_even, True, cache=cache)))
+        self.assertIsNot(cache, a.cache)
+        self.assertIs(a.cache, b.cache)
+        self.assertEqual(10, a.cache.maxsize)
+
+    def test_target(self):
+        with self.assertRaises(SerializationError):
+            serialize(Capture(_, name='x', target={}))
+
+    def test_format(self):
+        document = json.loads(serialize(InstanceOf(int)))
+        self.assertEqual(1, document['apm'])
+        self.assertEqual(42, deserialize(serialize(42)))
+        with self.assertRaises(SerializationError):
+            deserialize(b'{"apm": 2, "nodes": [], "root": 1}')
+        with self.assertRaises(SerializationError):
+            deserialize(b'not json')
+
+    def test_only_registered_functions_are_called(self):
+        with self.assertRaises(SerializationError):
+            serialize(Check(json.dumps))
+        payloads = [
+            b'{"apm":1,"nodes":[["g","os","getcwd"],["t"],["x",[0],[1],null]],"root":[2]}',
+            b'{"apm":1,"nodes":[["g","builtins","eval"],["t","1"],["x",[0],[1],null]],"root":[2]}',
+            b'{"apm":1,"nodes":[["g","apm","register_function"],["t"],["x",[0],[1],null]],"root":[2]}',
+            b'{"apm":1,"nodes":[["g","builtins","int"],["t","K",[0]],["o",[1]]],"root":[2]}',
+            # names are not looked up in anything a module holds, like another module
+            json.dumps({'apm': 1, 'nodes': [['g', 'apm.deferred', 'asyncio.events.subprocess.Popen'],
+                                            ['l', 'touch', '/tmp/pwned'], ['t', [1]], ['x', [0], [2], None]],
+                        'root': [3]}),
+            b'{"apm":1,"nodes":[["g","apm.core","ABC"],["t"],["x",[0],[1],null]],"root":[2]}',
+            b'{"apm":1,"nodes":[["g","builtins","type"],["t","T",[],{}],["x",[0],[1],null]],"root":[2]}',
+            b'{"apm":1,"nodes":[["g","_operator","lt"],["t",1,2],["x",[0],[1],null]],"root":[2]}',
+            b'{"apm":1,"nodes":[["g","copyreg","__newobj__"],["g","apm.core","ABC"],["t",[1]],["x",[0],[2],null]],'
+            b'"root":[3]}',
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                with self.assertRaises(SerializationError):
+                    deserialize(payload)
+        self.assertIs(type(None), roundtrip(InstanceOf(type(None))).types[0])
+
+    def test_regex(self):
+        loaded = roundtrip(re.compile(b'x+', re.IGNORECASE))
+        self.assertEqual(re.compile(b'x+', re.IGNORECASE), loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
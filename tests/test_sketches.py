@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import pickle
+import random
+import unittest
+from collections import Counter
+
+from apm import *
+from apm.sketches import CountMinSketch, HyperLogLog, Reservoir, SpaceSaving, hash64
+
+
+def zipf(n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    return [int(rnd.paretovariate(1.2)) for _ in range(n)]
+
+
+class HyperLogLogTest(unittest.TestCase):
+
+    def test_estimate(self):
+        for n in (0, 1, 10, 1000, 50000):
+            sketch = HyperLogLog(14)
+            for i in range(n):
+                sketch.add(f'user{i}')
+                sketch.add(f'user{i}')
+            self.assertAlmostEqual(n, len(sketch), delta=max(3 * 0.0082 * n, 1))
+
+    def test_merge(self):
+        a, b = HyperLogLog(12), HyperLogLog(12)
+        for i in range(20000):
+            a.add(i)
+        for i in range(10000, 12000):
+            b.add(i)
+        both = a.copy().merge(b)
+        self.assertEqual(len(a), len(both))
+        b.merge(a)
+        self.assertEqual(len(a), len(b))
+        with self.assertRaises(ValueError):
+            a.merge(HyperLogLog(13))
+
+    def test_values_are_told_apart_like_patterns_do(self):
+        self.assertNotEqual(hash64(1), hash64(True))
+        self.assertNotEqual(hash64(1), hash64('1'))
+        self.assertEqual(hash64((1, 'a')), hash64((1, 'a')))
+        sketch = HyperLogLog(10)
+        for value in (1, 1.0, True, 'a', b'a', ('a',)):
+            sketch.add(value)
+        self.assertEqual(6, len(sketch))
+
+    def test_precision_for(self):
+        self.assertEqual(14, HyperLogLog.precision_for(0.01))
+        with self.assertRaises(ValueError):
+            HyperLogLog.precision_for(0)
+
+    def test_pickle(self):
+        sketch = HyperLogLog(8)
+        for i in range(1000):
+            sketch.add(i)
+        self.assertEqual(len(sketch), len(pickle.loads(pickle.dumps(sketch))))
+
+
+class CountMinSketchTest(unittest.TestCase):
+
+    def test_estimates_are_never_too_low(self):
+        values = zipf(20000)
+        sketch = CountMinSketch.for_error(0.01, 0.01)
+        for value in values:
+            sketch.add(value)
+        for value, count in Counter(values).items():
+            self.assertLessEqual(count, sketch[value])
+            self.assertLessEqual(sketch[value], count + 0.01 * len(values))
+        self.assertEqual(len(values), sketch.total)
+
+    def test_few_values_are_counted_exactly(self):
+        sketch = CountMinSketch(16, 2)
+        sketch.add('a', 3)
+        sketch.add('b')
+        self.assertEqual((3, 1, 0), (sketch['a'], sketch['b'], sketch['c']))
+
+    def test_merge(self):
+        values = zipf(5000)
+        a, b, everything = CountMinSketch(100, 3), CountMinSketch(100, 3), CountMinSketch(100, 3)
+        for i, value in enumerate(values):
+            (a if i % 3 else b).add(value)
+            everything.add(value)
+        small = CountMinSketch(100, 3)
+        small.add(1)
+        a.merge(b).merge(small)
+        everything.add(1)
+        for value in set(values):
+            self.assertEqual(everything[value], a[value])
+        with self.assertRaises(ValueError):
+            a.merge(CountMinSketch(100, 4))
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def test_heavy_hitters(self):
+        values = zipf(20000)
+        summary = SpaceSaving(20)
+        for value in values:
+            summary.add(value)
+        exact = Counter(values)
+        self.assertEqual([value for value, _count in exact.most_common(3)],
+                         [value for value, _count in summary.most_common(3)])
+        for value, count in summary.most_common():
+            self.assertLessEqual(exact[value], count)
+            self.assertLessEqual(count - summary.error(value), exact[value])
+        self.assertEqual(20, len(summary))
+
+    def test_merge(self):
+        values = zipf(20000)
+        a, b = SpaceSaving(20), SpaceSaving(20)
+        for i, value in enumerate(values):
+            (a if i % 2 else b).add(value)
+        a.merge(b)
+        exact = Counter(values)
+        self.assertEqual([value for value, _count in exact.most_common(3)],
+                         [value for value, _count in a.most_common(3)])
+        for value, count in a.most_common():
+            self.assertLessEqual(exact[value], count)
+        self.assertEqual(len(values), a.total)
+
+
+class ReservoirTest(unittest.TestCase):
+
+    def test_small_streams_are_kept(self):
+        reservoir = Reservoir(10)
+        for i in range(5):
+            reservoir.add(i)
+        self.assertEqual([0, 1, 2, 3, 4], list(reservoir))
+
+    def test_uniform(self):
+        hits = Counter()
+        for seed in range(300):
+            a, b = Reservoir(5, seed), Reservoir(5, seed + 1000)
+            for i in range(10):
+                a.add(i)
+            for i in range(10, 40):
+                b.add(i)
+            a.merge(b)
+            self.assertEqual(5, len(a))
+            self.assertEqual(40, a.seen)
+            hits.update(a)
+        # every value is in the sample with a probability of 1/8, i.e. about 37 times
+        self.assertLess(max(hits.values()), 75)
+        self.assertEqual(40, len(hits))
+
+    def test_copy(self):
+        reservoir = Reservoir(3, seed=7)
+        for i in range(100):
+            reservoir.add(i)
+        copy = reservoir.copy()
+        for i in range(100):
+            reservoir.add(i)
+            copy.add(i)
+        self.assertEqual(list(reservoir), list(copy))
+
+
+class SketchAggregationsTest(unittest.TestCase):
+
+    def test_match(self):
+        result = match(['a', 'b', 'a', 'c', 'a'], Each(_ >> agg.Distinct('distinct') >> agg.TopK('top', k=1)))
+        self.assertEqual(3, len(result.distinct))
+        self.assertEqual([('a', 3)], result.top.most_common(1))
+
+    def test_frequency_add_many(self):
+        frequency = agg.Frequency('f', epsilon=0.01)
+        sketch = frequency.add_many(frequency.new(), ['x', 'y', 'x'])
+        self.assertEqual(2, sketch['x'])
+        self.assertIs(sketch, frequency.value)
+
+    def test_aggregate_parallel(self):
+        values = [{'ip': f'10.0.0.{i % 200}', 'path': f'/{i % 7}'} for i in range(5000)]
+        pattern = {'ip': _ >> agg.Distinct('ips') >> agg.Sample('sample', size=20, seed=1),
+                   'path': _ >> agg.TopK('paths', k=3) >> agg.Frequency('hits')}
+        for backend in ('thread', 'process'):
+            result = aggregate_parallel(values, pattern, workers=2, backend=backend, chunksize=300)
+            self.assertEqual(200, len(result['ips']))
+            self.assertEqual(20, len(result['sample']))
+            self.assertEqual(5000, result['sample'].seen)
+            self.assertEqual({'/0', '/1', '/2'}, {path for path, _count in result['paths'].most_common(3)})
+            self.assertEqual(715, result['hits']['/0'])
+
+    def test_serialize(self):
+        pattern = _ >> agg.TopK('top', k=2, capacity=5)
+        top = deserialize(serialize(pattern))._aggregation
+        self.assertEqual((2, 5), (top.k, top.new().capacity))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            agg.Distinct('d', error=2)
+        with self.assertRaises(ValueError):
+            agg.TopK('t', k=20, capacity=10)
+        with self.assertRaises(ValueError):
+            agg.Sample('s', size=0)
+        with self.assertRaises(ValueError):
+            agg.Frequency('f', delta=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from apm import *
+
+
+async def events(n: int):
+    for i in range(n):
+        yield {'type': 'login' if i % 3 else 'logout', 'user': f'u{i}', 'seq': i}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class DispatcherTest(unittest.TestCase):
+
+    def test_routes_to_first_matching_case(self):
+        seen = {'login': [], 'any': [], 'other': []}
+        dispatcher = Dispatcher()
+
+        @dispatcher.on({'type': 'login', 'user': 'user' @ _})
+        async def login(user):
+            seen['login'].append(user)
+
+        @dispatcher.on({'type': _}, name='any')
+        async def anything():
+            seen['any'].append(True)
+
+        @dispatcher.otherwise
+        async def other(value):
+            seen['other'].append(value)
+
+        async def source():
+            yield {'type': 'login', 'user': 'jane'}
+            yield {'type': 'logout'}
+            yield 'garbage'
+
+        stats = run(dispatcher.run(source()))
+        self.assertEqual({'login': ['jane'], 'any': [True], 'other': ['garbage']}, seen)
+        self.assertEqual(['login', 'any', 'otherwise'], list(stats))
+        self.assertEqual((1, 1, 0), (stats['login'].matched, stats['login'].handled, stats['login'].failed))
+
+    def test_unmatched_without_otherwise(self):
+        dispatcher = Dispatcher()
+        dispatcher.on({'type': 'login'}, self.noop)
+        run(dispatcher.run(events(30)))
+        self.assertEqual(10, dispatcher.unmatched)
+
+    @staticmethod
+    async def noop():
+        pass
+
+    def test_bounded_concurrency_and_backpressure(self):
+        running, most, read = 0, 0, 0
+        dispatcher = Dispatcher()
+
+        async def slow():
+            nonlocal running, most
+            running += 1
+            most = max(most, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+
+        dispatcher.on(_, slow, concurrency=3, backlog=2)
+
+        async def source():
+            nonlocal read
+            for i in range(50):
+                read += 1
+                # never more than the ones running, the ones queued, and the one the reader is about to put
+                self.assertLessEqual(read - dispatcher.stats()['slow'].handled, 3 + 2 + 1)
+                yield i
+
+        stats = run(dispatcher.run(source()))
+        self.assertEqual(3, most)
+        self.assertEqual(50, stats['slow'].handled)
+        self.assertEqual(0, stats['slow'].queued)
+        self.assertGreater(stats['slow'].latency, 0)
+        self.assertLessEqual(stats['slow'].latency_p50, stats['slow'].max_latency)
+        self.assertGreater(stats['slow'].throughput, 0)
+
+    def test_does_not_block_the_loop(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        async def main():
+            dispatcher = Dispatcher(backlog=10 ** 6)
+            dispatcher.on(_, self.noop)
+            task = asyncio.ensure_future(ticker())
+            await dispatcher.run(events(1000))
+            task.cancel()
+
+        run(main())
+        self.assertGreater(ticks, 10)
+
+    def test_errors_stop_the_dispatcher(self):
+        async def fail(seq):
+            if seq == 5:
+                raise ValueError(seq)
+
+        dispatcher = Dispatcher()
+        dispatcher.on({'seq': 'seq' @ _}, fail)
+        with self.assertRaises(ValueError):
+            run(dispatcher.run(events(100)))
+        with self.assertRaises(RuntimeError):
+            run(dispatcher.run(events(1)))
+
+    def test_on_error(self):
+        errors = []
+
+        async def fail(seq):
+            if seq % 10 == 0:
+                raise ValueError(seq)
+
+        dispatcher = Dispatcher(concurrency=4, on_error=lambda name, value, e: errors.append((name, e.args[0])))
+        dispatcher.on({'seq': 'seq' @ _}, fail)
+        stats = run(dispatcher.run(events(100)))
+        self.assertEqual([('fail', i) for i in range(0, 100, 10)], sorted(errors))
+        self.assertEqual((90, 10), (stats['fail'].handled, stats['fail'].failed))
+
+    def test_invalid_cases(self):
+        dispatcher = Dispatcher()
+        dispatcher.on(_, self.noop)
+        with self.assertRaises(ValueError):
+            dispatcher.on(_, self.noop)
+        with self.assertRaises(ValueError):
+            dispatcher.on(_, self.noop, name='other', concurrency=0)
+
+
+if __name__ == '__main__':
+    unittest.main()